@@ -0,0 +1,400 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+from catalog import ProjectCatalog
+from depcache import DependencyCache
+from logstore import LogStore
+from output import OutputPipe
+from environments import get_python_executable, venv_layout
+from projects import UpdateThread, create_venv, clone_options, CLONE_MODES, DEFAULT_CLONE_DEPTH
+from venvpool import VenvTemplatePool
+
+BENCHMARKS = ('clone', 'venv', 'deps', 'update', 'catalog', 'logs')
+GIT_IDENTITY = ['-c', 'user.name=Benchmark', '-c', 'user.email=benchmark@localhost']
+DRAIN_PERIOD = 0.05  # как часто окно вывода забирает строки
+DRAIN_LIMIT = 2000
+
+# Дочерний процесс для замера приема вывода: печатает N строк с заданной скоростью
+LOG_EMITTER = '''
+import sys, time
+count, rate = int(sys.argv[1]), float(sys.argv[2])
+started = time.perf_counter()
+for i in range(count):
+    stream = sys.stderr if i % 10 == 0 else sys.stdout
+    stream.write(f"line {i} " + "x" * 80 + "\\n")
+    if rate and i % 100 == 0:
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+'''
+
+
+def git_run(*args, cwd=None, stdin=None):
+    result = subprocess.run(['git', *GIT_IDENTITY, *args], cwd=cwd, input=stdin, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise Exception(f"git {' '.join(args)}: {result.stderr.decode(errors='replace')}")
+    return result.stdout.decode(errors='replace').strip()
+
+
+def make_repo(path, commits, files, file_size, requirements=''):
+    # Синтетический репозиторий через git fast-import: первый коммит создает все файлы,
+    # каждый следующий меняет один из них
+    os.makedirs(path)
+    git_run('init', '-q', path)
+    stream = []
+
+    def data(content):
+        raw = content.encode('utf-8')
+        stream.append(f'data {len(raw)}\n'.encode('ascii') + raw + b'\n')
+
+    timestamp = 1600000000
+    for number in range(commits):
+        stream.append(f'commit refs/heads/main\n'
+                      f'committer Benchmark <benchmark@localhost> {timestamp + number} +0000\n'.encode('ascii'))
+        data(f'commit {number}')
+        if number == 0:
+            for index in range(files):
+                stream.append(f'M 100644 inline src/file_{index}.py\n'.encode('ascii'))
+                data(f'# {index}\n' + 'x = 1\n' * (file_size // 6))
+            stream.append(b'M 100644 inline main.py\n')
+            data('print("benchmark")\n')
+            if requirements:
+                stream.append(b'M 100644 inline requirements.txt\n')
+                data(requirements)
+        else:
+            stream.append(f'M 100644 inline src/file_{number % files}.py\n'.encode('ascii'))
+            data(f'# {number}\n' + 'x = 1\n' * (file_size // 6))
+    git_run('fast-import', '--quiet', cwd=path, stdin=b''.join(stream))
+    git_run('symbolic-ref', 'HEAD', 'refs/heads/main', cwd=path)
+    git_run('reset', '-q', '--hard', cwd=path)
+
+
+def add_commit(repo_path, number):
+    with open(os.path.join(repo_path, 'main.py'), 'a', encoding='utf-8') as f:
+        f.write(f'# update {number}\n')
+    git_run('commit', '-q', '-am', f'update {number}', cwd=repo_path)
+
+
+def make_wheel(index_dir, name, version='1.0'):
+    # Минимальное колесо без setuptools: модуль, METADATA, WHEEL и RECORD
+    dist_info = f'{name}-{version}.dist-info'
+    files = {
+        f'{name}/__init__.py': f'VERSION = "{version}"\n',
+        f'{dist_info}/METADATA': f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n',
+        f'{dist_info}/WHEEL': 'Wheel-Version: 1.0\nGenerator: benchmark\nRoot-Is-Purelib: true\nTag: py3-none-any\n',
+    }
+    record = []
+    for file_name, content in files.items():
+        digest = base64.urlsafe_b64encode(hashlib.sha256(content.encode('utf-8')).digest()).rstrip(b'=')
+        record.append(f'{file_name},sha256={digest.decode("ascii")},{len(content.encode("utf-8"))}')
+    record.append(f'{dist_info}/RECORD,,')
+    files[f'{dist_info}/RECORD'] = '\n'.join(record) + '\n'
+    with zipfile.ZipFile(os.path.join(index_dir, f'{name}-{version}-py3-none-any.whl'), 'w') as wheel:
+        for file_name, content in files.items():
+            wheel.writestr(file_name, content)
+
+
+def venv_pip(venv_path):
+    layout = venv_layout(venv_path)
+    if layout is None or layout['pip'] is None:
+        raise Exception(f"pip not found in {venv_path}")
+    return layout['pip']
+
+
+def summarize(runs):
+    return {'runs': [round(run, 4) for run in runs], 'min': round(min(runs), 4),
+            'median': round(statistics.median(runs), 4), 'mean': round(statistics.mean(runs), 4)}
+
+
+class Benchmark:
+    # Набор замеров на синтетических данных во временной папке: file://-репозиторий
+    # с заданной историей, локальный каталог колес вместо PyPI и N проектов для каталога
+    def __init__(self, work_dir, args):
+        self.work_dir = work_dir
+        self.args = args
+        self.results = {}
+        self.origin = os.path.join(work_dir, 'origin')
+        self.index_dir = os.path.join(work_dir, 'index')
+        self.origin_url = None
+        self._counter = 0
+
+    def new_dir(self, prefix):
+        self._counter += 1
+        return os.path.join(self.work_dir, f'{prefix}-{self._counter}')
+
+    def measure(self, name, function, setup=None, repeat=None):
+        # function(context) возвращает необязательный словарь доп. метрик последнего прогона
+        runs = []
+        extra = None
+        try:
+            for _ in range(repeat or self.args.repeat):
+                context = setup() if setup is not None else None
+                started = time.perf_counter()
+                extra = function(context)
+                runs.append(time.perf_counter() - started)
+        except Exception as e:
+            self.results[name] = {'error': str(e)}
+            print(f"{name}: error: {e}")
+            return
+        result = summarize(runs)
+        if isinstance(extra, dict):
+            result.update(extra)
+        self.results[name] = result
+        print(f"{name}: median {result['median'] * 1000:.1f} ms")
+
+    def prepare(self):
+        os.makedirs(self.index_dir)
+        packages = [f'bench_pkg_{index}' for index in range(self.args.packages)]
+        for package in packages:
+            make_wheel(self.index_dir, package)
+        requirements = ''.join(f'{package}==1.0\n' for package in packages)
+        started = time.perf_counter()
+        make_repo(self.origin, self.args.commits, self.args.files, self.args.file_size, requirements)
+        self.results['prepare_origin'] = summarize([time.perf_counter() - started])
+        self.origin_url = pathlib.Path(self.origin).resolve().as_uri()
+        # Зависимости ставим только из локального каталога колес, сеть не нужна
+        os.environ['PIP_NO_INDEX'] = '1'
+        os.environ['PIP_FIND_LINKS'] = self.index_dir
+        os.environ['PIP_DISABLE_PIP_VERSION_CHECK'] = '1'
+
+    def clone_project(self, mode=None):
+        import git
+        project_path = os.path.join(self.new_dir('clones'), 'origin')
+        options = clone_options(mode, self.args.depth) if mode else []
+        git.Repo.clone_from(self.origin_url, project_path, multi_options=options)
+        return project_path
+
+    def bench_clone(self):
+        for mode in CLONE_MODES:
+            self.measure(f'clone_{mode}', lambda _, mode=mode: self.clone_project(mode))
+
+    def bench_venv(self):
+        python = get_python_executable()
+        self.measure('venv_create', lambda project_path: asyncio.run(create_venv(project_path)),
+                     setup=lambda: self._empty_project())
+
+        pool_dir = self.new_dir('pool')
+        pool = VenvTemplatePool(pool_dir, size=self.args.repeat)
+        pool.register(python)
+        pool.start()
+
+        def acquire(venv_path):
+            if not pool.acquire(python, venv_path):
+                raise Exception("template pool is empty")
+
+        def wait_for_template():
+            # Ждем готовый шаблон вне замера: сравниваем именно взятие из пула
+            deadline = time.time() + 300
+            while not self._pool_ready(pool):
+                if time.time() > deadline:
+                    raise Exception("template pool was not filled in time")
+                time.sleep(0.2)
+            return os.path.join(self._empty_project(), 'venv')
+
+        self.measure('venv_template_acquire', acquire, setup=wait_for_template)
+        pool.stop()
+
+    def _pool_ready(self, pool):
+        if not os.path.isdir(pool.root):
+            return False
+        for interpreter_dir in os.listdir(pool.root):
+            path = os.path.join(pool.root, interpreter_dir)
+            if os.path.isdir(path) and any(name.startswith('ready-') for name in os.listdir(path)):
+                return True
+        return False
+
+    def _empty_project(self):
+        project_path = self.new_dir('projects')
+        os.makedirs(project_path)
+        return project_path
+
+    def bench_deps(self):
+        requirements_path = os.path.join(self.origin, 'requirements.txt')
+        if not os.path.exists(requirements_path):
+            self.results['deps_install_cold'] = {'error': 'no packages requested'}
+            return
+
+        def new_venv(projects_dir=None):
+            projects_dir = projects_dir or self.new_dir('wheelhouse')
+            self._counter += 1
+            venv_path = os.path.join(projects_dir, f'project-{self._counter}', 'venv')
+            subprocess.run([get_python_executable(), '-m', 'venv', venv_path], check=True)
+            return projects_dir, venv_path
+
+        def install(context):
+            projects_dir, venv_path = context
+            DependencyCache(projects_dir).install(venv_pip(venv_path), venv_path, requirements_path)
+
+        # Холодная установка: пустой wheelhouse, колеса собираются из каталога
+        self.measure('deps_install_cold', install, setup=new_venv)
+        # Теплая: wheelhouse общий и уже заполнен, установка без сборки
+        shared_dir, venv_path = new_venv()
+        install((shared_dir, venv_path))
+        self.measure('deps_install_warm', install, setup=lambda: new_venv(shared_dir))
+
+    def run_update(self, project_path):
+        messages = []
+        update_thread = UpdateThread(project_path, lambda value: None, messages.append, lambda: None)
+        update_thread.run()
+        if update_thread.error is not None:
+            raise update_thread.error
+        return {'head_changed': update_thread.head_changed}
+
+    def bench_update(self):
+        project_path = self.clone_project()
+        self.measure('update_noop', lambda _: self.run_update(project_path))
+
+        def push_commit():
+            self._counter += 1
+            add_commit(self.origin, self._counter)
+
+        self.measure('update_pull', lambda _: self.run_update(project_path), setup=push_commit)
+
+    def bench_catalog(self):
+        projects_dir = self.new_dir('catalog')
+        os.makedirs(projects_dir)
+        for index in range(self.args.projects):
+            git_run('clone', '-q', '--shared', '--no-checkout', self.origin,
+                    os.path.join(projects_dir, f'project_{index}'))
+
+        def cold_scan(_):
+            cache_dir = os.path.join(projects_dir, '.cache')
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            catalog = ProjectCatalog(projects_dir)
+            catalog.refresh(force=True)
+            return {'projects': len(catalog.names())}
+
+        self.measure('catalog_scan_cold', cold_scan)
+        catalog = ProjectCatalog(projects_dir)
+        catalog.refresh(force=True)
+        self.measure('catalog_refresh_warm', lambda _: catalog.refresh())
+        self.measure('catalog_load_cache', lambda _: ProjectCatalog(projects_dir).load())
+
+    def ingest_logs(self, log_store):
+        process = subprocess.Popen([get_python_executable(), '-c', LOG_EMITTER, str(self.args.log_lines),
+                                    str(self.args.log_rate)],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8')
+        pipe = OutputPipe(process, sink=log_store.open_run('benchmark'))
+        pipe.start()
+        received = dropped = 0
+        # Забираем строки так же, как окно вывода: пачками по таймеру
+        while not pipe.finished.is_set():
+            lines, lost = pipe.drain(DRAIN_LIMIT)
+            received += len(lines)
+            dropped += lost
+            if not lines:
+                time.sleep(DRAIN_PERIOD)
+        lines, lost = pipe.drain()
+        received += len(lines)
+        dropped += lost
+        return {'lines': self.args.log_lines, 'received': received, 'dropped': dropped}
+
+    def bench_logs(self):
+        log_store = LogStore(self.new_dir('logs'))
+        self.measure('log_ingest', lambda _: self.ingest_logs(log_store))
+        result = self.results['log_ingest']
+        if 'median' in result:
+            result['lines_per_sec'] = round(self.args.log_lines / result['median'])
+
+    def run(self, names):
+        self.prepare()
+        for name in names:
+            try:
+                getattr(self, f'bench_{name}')()
+            except Exception as e:
+                # Подготовка группы не удалась (например, нет GitPython) - остальные замеры продолжаем
+                self.results.setdefault(name, {'error': str(e)})
+                print(f"{name}: error: {e}")
+        return self.results
+
+
+def revision():
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        sha = git_run('rev-parse', 'HEAD', cwd=source_dir)
+        dirty = bool(git_run('status', '--porcelain', '--untracked-files=no', cwd=source_dir))
+    except Exception:
+        return None
+    return sha + ('-dirty' if dirty else '')
+
+
+def compare(results, baseline):
+    # Отношение медиан: < 1 - стало быстрее, > 1 - медленнее
+    lines = [f"{'benchmark':<26}{'base, ms':>12}{'new, ms':>12}{'ratio':>8}"]
+    for name, result in sorted(results.items()):
+        base = baseline.get('results', {}).get(name)
+        if not base or 'median' not in base or 'median' not in result:
+            continue
+        ratio = result['median'] / base['median'] if base['median'] else float('inf')
+        lines.append(f"{name:<26}{base['median'] * 1000:>12.1f}{result['median'] * 1000:>12.1f}{ratio:>8.2f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры клонирования, venv, обновлений, каталога и логов")
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"какие замеры выполнить: {', '.join(BENCHMARKS)} (по умолчанию все)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--commits', type=int, default=500, help="коммитов в синтетическом репозитории")
+    parser.add_argument('--files', type=int, default=100, help="файлов в синтетическом репозитории")
+    parser.add_argument('--file-size', type=int, default=2048, help="размер файла, байт")
+    parser.add_argument('--depth', type=int, default=DEFAULT_CLONE_DEPTH, help="глубина мелкого клона")
+    parser.add_argument('--packages', type=int, default=5, help="пакетов в requirements.txt")
+    parser.add_argument('--projects', type=int, default=100, help="проектов для замера каталога")
+    parser.add_argument('--log-lines', type=int, default=200000)
+    parser.add_argument('--log-rate', type=float, default=0, help="строк в секунду, 0 - без ограничения")
+    parser.add_argument('--work-dir', help="рабочая папка (по умолчанию временная)")
+    parser.add_argument('--keep', action='store_true', help="не удалять рабочую папку")
+    parser.add_argument('--output', help="куда записать JSON с результатами")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(sorted(unknown))}")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='manager-benchmark-')
+    os.makedirs(work_dir, exist_ok=True)
+    started = time.time()
+    try:
+        results = Benchmark(work_dir, args).run(args.benchmarks or BENCHMARKS)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'revision': revision(),
+        'started': started,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'compare', 'work_dir', 'keep')},
+        'results': results,
+    }
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data)
+    else:
+        print(data)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print(compare(results, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+
+TRASH_DIR = '.trash'
+DEFAULT_BULK_CONCURRENCY = 8
+
+BULK_UPDATE = 'update'
+BULK_RESTART = 'restart'
+BULK_DELETE = 'delete'
+BULK_CHECKOUT = 'checkout'
+BULK_ACTIONS = (BULK_UPDATE, BULK_RESTART, BULK_DELETE, BULK_CHECKOUT)
+
+ITEM_PENDING = 'pending'
+ITEM_RUNNING = 'running'
+ITEM_DONE = 'done'
+ITEM_FAILED = 'failed'
+ITEM_CANCELLED = 'cancelled'
+
+
+def _remove_readonly(function, path, exc_info):
+    # Файлы объектов git на Windows только для чтения, rmtree на них падает
+    os.chmod(path, stat.S_IWRITE)
+    function(path)
+
+
+def purge_trash(projects_dir):
+    trash_path = os.path.join(projects_dir, TRASH_DIR)
+    try:
+        names = os.listdir(trash_path)
+    except OSError:
+        return
+    for name in names:
+        shutil.rmtree(os.path.join(trash_path, name), onerror=_remove_readonly)
+
+
+def move_to_trash(projects_dir, project_path, wait=False):
+    # Переименование в пределах диска мгновенное: проект сразу пропадает из списка,
+    # а само удаление большого venv идет в фоне. wait=True - удалить до возврата
+    # (сборке мусора нужно, чтобы место действительно освободилось)
+    trash_path = os.path.join(projects_dir, TRASH_DIR)
+    os.makedirs(trash_path, exist_ok=True)
+    target = os.path.join(trash_path, f"{os.path.basename(project_path)}-{uuid.uuid4().hex[:8]}")
+    os.replace(project_path, target)
+    if wait:
+        shutil.rmtree(target, onerror=_remove_readonly)
+        return target
+    threading.Thread(target=shutil.rmtree, args=(target,), kwargs={'onerror': _remove_readonly},
+                     name="trash-purge", daemon=True).start()
+    return target
+
+
+class BulkOperation:
+    # Одно действие над множеством проектов: пул воркеров, статус по каждому проекту,
+    # отмена еще не начатых и итоговая сводка.
+    # action(name, message_callback) выполняется синхронно и при ошибке бросает исключение
+    def __init__(self, kind, names, action, concurrency=DEFAULT_BULK_CONCURRENCY, finished_callback=None):
+        self.kind = kind
+        self.action = action
+        self.concurrency = max(1, min(concurrency, len(names) or 1))
+        self.finished_callback = finished_callback
+        self.started = None
+        self.finished_at = None
+        self.finished = threading.Event()
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = list(names)
+        self._items = {name: {'state': ITEM_PENDING, 'message': '', 'duration': None} for name in names}
+        self._workers_left = self.concurrency
+
+    def start(self):
+        self.started = time.time()
+        if not self._items:
+            self._finish()
+            return
+        for index in range(self.concurrency):
+            threading.Thread(target=self._worker, name=f"bulk-{self.kind}-{index}", daemon=True).start()
+
+    def cancel(self):
+        # Уже выполняющиеся действия доводим до конца, остальные помечаем отмененными
+        self.cancelled.set()
+        with self._lock:
+            for name in self._pending:
+                self._items[name]['state'] = ITEM_CANCELLED
+            self._pending = []
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._items[name].update(fields)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._pending or self.cancelled.is_set():
+                    self._workers_left -= 1
+                    last = self._workers_left == 0
+                    break
+                name = self._pending.pop(0)
+                self._items[name]['state'] = ITEM_RUNNING
+            started = time.time()
+            try:
+                self.action(name, lambda message, name=name: self._set(name, message=message))
+                self._set(name, state=ITEM_DONE, duration=time.time() - started)
+            except Exception as e:
+                self._set(name, state=ITEM_FAILED, message=str(e), duration=time.time() - started)
+        if last:
+            self._finish()
+
+    def _finish(self):
+        self.finished_at = time.time()
+        self.finished.set()
+        if self.finished_callback is not None:
+            self.finished_callback(self)
+
+    def snapshot(self):
+        with self._lock:
+            items = {name: dict(item) for name, item in self._items.items()}
+        counts = {ITEM_PENDING: 0, ITEM_RUNNING: 0, ITEM_DONE: 0, ITEM_FAILED: 0, ITEM_CANCELLED: 0}
+        for item in items.values():
+            counts[item['state']] += 1
+        end = self.finished_at or time.time()
+        return dict(counts, kind=self.kind, items=items, total=len(items), finished=self.finished.is_set(),
+                    elapsed=end - self.started if self.started else 0)
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"Готово: {snapshot[ITEM_DONE]}, ошибок: {snapshot[ITEM_FAILED]}, "
+                 f"отменено: {snapshot[ITEM_CANCELLED]} из {snapshot['total']} "
+                 f"за {snapshot['elapsed']:.1f} с"]
+        for name, item in sorted(snapshot['items'].items()):
+            if item['state'] == ITEM_FAILED:
+                lines.append(f"{name}: {item['message']}")
+        return "\n".join(lines)
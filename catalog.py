@@ -0,0 +1,271 @@
+import json
+import os
+import threading
+import time
+
+from environments import find_environment
+
+CACHE_DIR = '.cache'  # отдельная папка, чтобы запись кэша не меняла mtime projects_dir
+CATALOG_FILE = 'catalog.json'
+CATALOG_VERSION = 3
+DEFAULT_POLL_INTERVAL = 5
+
+
+def find_git_dir(project_path):
+    git_path = os.path.join(project_path, '.git')
+    if os.path.isfile(git_path):
+        # Рабочие деревья и подмодули: .git - файл со ссылкой на настоящий каталог
+        with open(git_path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if content.startswith('gitdir:'):
+            return os.path.normpath(os.path.join(project_path, content[len('gitdir:'):].strip()))
+    return git_path
+
+
+def read_head_sha(git_dir):
+    # HEAD без GitPython: прямой SHA, loose-ссылка или packed-refs
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r', encoding='utf-8') as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    if not head.startswith('ref:'):
+        return head
+    ref = head[len('ref:'):].strip()
+    for base in (git_dir, _common_dir(git_dir)):
+        try:
+            with open(os.path.join(base, ref), 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            pass
+        try:
+            with open(os.path.join(base, 'packed-refs'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.rstrip('\n').endswith(' ' + ref):
+                        return line.split(' ', 1)[0]
+        except OSError:
+            pass
+    return None
+
+
+def read_head_ref(git_dir):
+    # Имя текущей ветки (refs/heads/...) или None для detached HEAD
+    try:
+        with open(os.path.join(git_dir, 'HEAD'), 'r', encoding='utf-8') as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    return head[len('ref:'):].strip() if head.startswith('ref:') else None
+
+
+def read_remote_urls(git_dir):
+    # URL всех remote из .git/config без GitPython
+    urls = []
+    in_remote = False
+    try:
+        with open(os.path.join(_common_dir(git_dir), 'config'), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('['):
+                    in_remote = line.startswith('[remote ')
+                elif in_remote:
+                    key, _, value = line.partition('=')
+                    if key.strip() == 'url':
+                        urls.append(value.strip())
+    except OSError:
+        pass
+    return urls
+
+
+def _common_dir(git_dir):
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r', encoding='utf-8') as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        return git_dir
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ProjectCatalog:
+    # Кэш проектов в projects_dir с метаданными (путь, venv с интерпретатором и pip,
+    # время обновления, SHA HEAD). Хранится в .cache/catalog.json и обновляется инкрементально:
+    # каталог перечитывается только при изменении mtime projects_dir, а по каждому
+    # проекту проверяются лишь mtime .git/HEAD и .git/logs/HEAD.
+    # Настройки запуска проектов живут отдельно, в ConfigStore.
+    def __init__(self, projects_dir, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.projects_dir = projects_dir
+        self.cache_path = os.path.join(projects_dir, CACHE_DIR, CATALOG_FILE)
+        self.poll_interval = poll_interval
+        self.version = 0  # растет при каждом изменении, UI сравнивает со своей копией
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._root_mtime = None
+        # Каталоги без .git (клонирование еще идет): перепроверяются на каждом опросе,
+        # ведь mtime корня, когда .git появится, уже не изменится. None - еще не знаем
+        self._pending = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != CATALOG_VERSION:
+            return False
+        with self._lock:
+            self._entries = data.get('projects', {})
+            self._root_mtime = data.get('root_mtime')
+            self.version += 1
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {'version': CATALOG_VERSION, 'root_mtime': self._root_mtime, 'projects': self._entries}
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+
+    def names(self):
+        with self._lock:
+            return sorted(self._entries)
+
+    def paths(self):
+        with self._lock:
+            return [self._entries[name]['path'] for name in sorted(self._entries)]
+
+    def entries(self):
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._entries.items()}
+
+    def get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            return dict(entry) if entry is not None else None
+
+    def update(self, name, **fields):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            entry.update(fields)
+            self.version += 1
+        self.save()
+
+    def mark_updated(self, project_path):
+        name = os.path.basename(project_path)
+        self.update(name, last_update=time.time(), head_sha=read_head_sha(find_git_dir(project_path)))
+
+    def refresh(self, force=False):
+        # Возвращает True, если что-то изменилось
+        changed = False
+        with self._lock:
+            root_mtime = _mtime(self.projects_dir)
+            if force or root_mtime != self._root_mtime or self._pending is None:
+                changed |= self._rescan_root()
+                self._root_mtime = root_mtime
+            elif self._pending:
+                changed |= self._check_pending()
+            for name in list(self._entries):
+                changed |= self._refresh_entry(name, force)
+            if changed:
+                self.version += 1
+        if changed:
+            self.save()
+        return changed
+
+    def _rescan_root(self):
+        try:
+            listing = set(os.listdir(self.projects_dir))
+        except OSError:
+            listing = set()
+        changed = False
+        for name in list(self._entries):
+            if name not in listing:
+                del self._entries[name]
+                changed = True
+        self._pending = {name for name in listing - set(self._entries)
+                         if os.path.isdir(os.path.join(self.projects_dir, name))}
+        changed = self._check_pending() or changed
+        # Служебные папки менеджера (.cache, .logs, .trash...) проектами не станут - ждать их незачем
+        self._pending = {name for name in self._pending if not name.startswith('.')}
+        return changed
+
+    def _check_pending(self):
+        changed = False
+        for name in list(self._pending):
+            project_path = os.path.join(self.projects_dir, name)
+            if not os.path.isdir(project_path):
+                self._pending.discard(name)
+            elif os.path.exists(os.path.join(project_path, '.git')):
+                self._pending.discard(name)
+                self._entries[name] = {'path': project_path, 'venv': None, 'python': None, 'pip': None,
+                                       'last_update': None, 'head_sha': None, 'head_stamp': None}
+                changed = True
+        return changed
+
+    def _refresh_entry(self, name, force):
+        entry = self._entries[name]
+        project_path = entry['path']
+        git_dir = find_git_dir(project_path)
+        head_stamp = [_mtime(os.path.join(git_dir, 'HEAD')), _mtime(os.path.join(git_dir, 'logs', 'HEAD'))]
+        if head_stamp[0] is None:
+            # .git пропал - это больше не проект
+            del self._entries[name]
+            return True
+
+        changed = False
+        if force or head_stamp != entry['head_stamp']:
+            entry['head_stamp'] = head_stamp
+            entry['head_sha'] = read_head_sha(git_dir)
+            changed = True
+        if force or entry['python'] is None:
+            changed |= self._set_environment(entry, find_environment(project_path))
+        return changed
+
+    def _set_environment(self, entry, environment):
+        environment = environment or {'venv': None, 'python': None, 'pip': None}
+        if all(entry.get(key) == environment[key] for key in ('venv', 'python', 'pip')):
+            return False
+        entry.update(environment)
+        return True
+
+    def environment(self, name):
+        # Интерпретатор и pip проекта из кэша. Диск перепроверяется, только если
+        # закэшированного интерпретатора больше нет (venv пересоздан или удален)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            if entry['python'] is not None and os.path.exists(entry['python']):
+                return {'venv': entry['venv'], 'python': entry['python'], 'pip': entry['pip']}
+            environment = find_environment(entry['path'])
+            changed = self._set_environment(entry, environment)
+            if changed:
+                self.version += 1
+        if changed:
+            self.save()
+        return environment
+
+    def start_watching(self):
+        self._thread = threading.Thread(target=self._watch, name="project-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Project catalog refresh error: {e}")
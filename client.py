@@ -1,118 +1,610 @@
-import asyncio
+import time
+
+STARTED = time.perf_counter()  # точка отсчета отчета о времени запуска
+
 import os
-import sys
-import json
-import shutil
-import subprocess
+import queue
 import threading
-import git
-from tkinter import Tk, Frame, Label, Entry, Button, Listbox, Menu, filedialog, messagebox, simpledialog, Scrollbar, Text, Toplevel, END, BOTH, W, N, E, S, HORIZONTAL, X, OptionMenu, StringVar
-from tkinter.ttk import Progressbar, Style, Treeview
+from tkinter import Tk, Frame, Label, Entry, Button, Listbox, Menu, filedialog, messagebox, simpledialog, Scrollbar, Text, Toplevel, END, BOTH, W, N, E, S, HORIZONTAL, X, EXTENDED, OptionMenu, StringVar
+from tkinter.ttk import Combobox, Progressbar, Style, Treeview
+
+from catalog import CACHE_DIR
+from events import EventBus, EVENT_PROGRESS, EVENT_FINISHED, EVENT_LOG, DEFAULT_FRAME_INTERVAL
+from output import Scrollback, STDERR, DEFAULT_MAX_LINES, DEFAULT_MAX_BYTES
+from service import ManagerService, load_settings, OPERATION_FAILED
+from startup import StartupTimer
+from scheduler import STATE_QUEUED as UPDATE_QUEUED, STATE_DONE as UPDATE_DONE, STATE_FAILED as UPDATE_FAILED
+from storage import format_size
+from supervisor import STATE_RUNNING, STATE_STOPPING, STATE_STOPPED, STATE_EXITED, STATE_RESTARTING, STATE_FAILED
+
+BACKGROUND_START_DELAY = 500  # мс после первой отрисовки до запуска обновлений и горячих клавиш
+
+
+def describe_process(supervised):
+    state = supervised.state
+    if state == STATE_RUNNING:
+        text = "Проект запущен"
+    elif state == STATE_STOPPING:
+        text = "Остановка..."
+    elif state == STATE_STOPPED:
+        text = "Проект остановлен"
+    elif state == STATE_EXITED:
+        text = "Проект завершен"
+    elif state == STATE_RESTARTING:
+        text = f"Перезапуск после падения (код {supervised.returncode})..."
+    else:
+        text = f"Проект завершился с ошибкой (код {supervised.returncode})"
+    if supervised.reason:
+        text += f": {supervised.reason}"
+    metrics = supervised.metrics
+    if metrics:
+        text += (f" | CPU {metrics['cpu_percent']:.0f}% | RSS {metrics['rss_mb']:.0f} МБ"
+                 f" | файлы {metrics['open_files']} | потоки {metrics['threads']}")
+    if supervised.restarts:
+        text += f" | перезапусков {supervised.restarts}"
+    return text
 
-import psutil
-from pynput import keyboard
 
-SETTINGS_FILE = 'settings.json'
+class OutputWindow(Toplevel):
+    FLUSH_INTERVAL = 100  # мс между выводом накопленных строк
+    FLUSH_BATCH = 2000  # максимум строк за один проход, чтобы не подвешивать главный цикл
 
+    def __init__(self, project_name, service, max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__()
+        self.title(f"{project_name}")
+        self.project_name = project_name
+        self.service = service
+        self.supervised = None
+        self.pipe = None
+        self.generation = 0
+        self.scrollback = Scrollback(max_lines, max_bytes)
+        self.flush_job = None
 
-def get_python_executable():
-    if hasattr(sys, 'frozen'):
-        with open(os.path.join(sys._MEIPASS, 'python_path.txt'), 'r') as f:
-            return f.read().strip()
-    else:
-        return sys.executable
+        self.output_text = Text(self, state='disabled')
+        self.output_text.tag_config(STDERR, foreground='red')
+        self.output_text.pack(expand=True, fill=BOTH)
 
+        self.status_label = Label(self, text="Проект запущен...")
+        self.status_label.pack()
 
-async def create_venv(project_path):
-    venv_path = os.path.join(project_path, 'venv')
-    python_executable = get_python_executable()  # Используем сохраненный путь к Python
-    venv_create_command = [python_executable, '-m', 'venv', venv_path]
+        self.stop_button = Button(self, text="Остановить", command=self.stop_process)
+        self.stop_button.pack()
 
-    # Проверяем, что python_executable существует
-    if not os.path.exists(python_executable):
-        raise Exception(f"Python executable not found: {python_executable}")
+    @property
+    def process(self):
+        return self.supervised.process if self.supervised is not None else None
+
+    def attach(self, supervised):
+        self.supervised = supervised
+        self.flush_job = self.after(self.FLUSH_INTERVAL, self.flush_output)
+
+    def flush_output(self):
+        if self.supervised.generation != self.generation:
+            # Процесс перезапущен: дочитываем старый пайп и переключаемся на новый
+            if self.pipe is not None:
+                self.show_lines(*self.pipe.drain())
+                self.append_output("--- Перезапуск ---\n")
+            self.pipe = self.supervised.pipe
+            self.generation = self.supervised.generation
+
+        lines, dropped = self.pipe.drain(self.FLUSH_BATCH)
+        self.show_lines(lines, dropped)
+        self.set_status(describe_process(self.supervised))
+
+        finished = self.supervised.state in (STATE_STOPPED, STATE_EXITED, STATE_FAILED)
+        if finished and self.pipe.finished.is_set() and len(lines) < self.FLUSH_BATCH:
+            self.flush_job = None
+            self.stop_button.config(state='disabled')
+        else:
+            self.flush_job = self.after(self.FLUSH_INTERVAL, self.flush_output)
+
+    def show_lines(self, lines, dropped):
+        chunks = []
+        if dropped:
+            chunks.extend([f"... пропущено строк: {dropped}\n", STDERR])
+        for stream, line in lines:
+            # Соседние строки одного потока склеиваем в одну вставку
+            tag = STDERR if stream == STDERR else ''
+            if chunks and chunks[-1] == tag:
+                chunks[-2] += line
+            else:
+                chunks.extend([line, tag])
+        if chunks:
+            self.insert_chunks(chunks)
 
-    print(f"Creating virtual environment with: {venv_create_command}")
+    def append_output(self, text):
+        self.insert_chunks([text, ''])
 
-    # Создание виртуального окружения
-    proc = await asyncio.create_subprocess_exec(
-        *venv_create_command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    stdout, stderr = await proc.communicate()
+    def insert_chunks(self, chunks):
+        for text in chunks[::2]:
+            self.scrollback.add(text)
+        self.output_text.config(state='normal')
+        self.output_text.insert(END, *chunks)
+        overflow = self.scrollback.overflow()
+        if overflow:
+            self.output_text.delete('1.0', f'{overflow + 1}.0')
+        self.output_text.config(state='disabled')
+        self.output_text.see(END)
 
-    if proc.returncode != 0:
-        raise Exception(f"Error creating virtual environment: {stderr.decode()}")
+    def destroy(self):
+        if self.flush_job is not None:
+            self.after_cancel(self.flush_job)
+            self.flush_job = None
+        super().destroy()
 
-    requirements_path = os.path.join(project_path, 'requirements.txt')
-    if os.path.exists(requirements_path):
-        pip_executable = os.path.join(venv_path, 'Scripts', 'pip')
-        install_command = [pip_executable, 'install', '-r', requirements_path]
+    def set_status(self, status):
+        if self.status_label.cget('text') != status:
+            self.status_label.config(text=status)
 
-        # Проверяем, что pip_executable существует
-        if not os.path.exists(pip_executable):
-            raise Exception(f"Pip executable not found: {pip_executable}")
+    def stop_process(self):
+        # Останавливаем все дерево процессов в фоне, окно не ждет таймаута. Через сервис,
+        # чтобы вместе с процессом выключилось и наблюдение за файлами
+        if self.supervised is not None:
+            threading.Thread(target=self.service.stop, args=(self.project_name,), daemon=True).start()
 
-        print(f"Installing dependencies with: {install_command}")
+    def close(self):
+        self.stop_process()
+        self.destroy()
 
-        # Установка зависимостей
-        proc = await asyncio.create_subprocess_exec(
-            *install_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
 
-        if proc.returncode != 0:
-            raise Exception(f"Error installing dependencies: {stderr.decode()}")
+class ProcessesWindow(Toplevel):
+    REFRESH_INTERVAL = 2000
 
-def load_settings():
-    if os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, 'r') as f:
-            return json.load(f)
-    return {"projects_dir": "C:/"}
+    def __init__(self, parent, supervisor):
+        super().__init__(parent)
+        self.title("Процессы")
+        self.geometry("800x400")
+        self.supervisor = supervisor
+
+        columns = ("name", "state", "cpu", "rss", "files", "threads", "restarts")
+        self.process_tree = Treeview(self, columns=columns, show="headings")
+        for column, text, width in (("name", "Проект", 200), ("state", "Состояние", 100), ("cpu", "CPU %", 70),
+                                    ("rss", "RSS, МБ", 80), ("files", "Файлы", 70), ("threads", "Потоки", 70),
+                                    ("restarts", "Перезапуски", 90)):
+            self.process_tree.heading(column, text=text)
+            self.process_tree.column(column, width=width)
+        self.process_tree.pack(fill=BOTH, expand=True)
+
+        self.refresh_job = None
+        self.refresh()
+
+    def destroy(self):
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        super().destroy()
+
+    def refresh(self):
+        # Самые прожорливые по памяти - сверху
+        metrics = self.supervisor.metrics()
+        self.process_tree.delete(*self.process_tree.get_children())
+        for name, item in sorted(metrics.items(), key=lambda pair: pair[1].get('rss_mb', 0), reverse=True):
+            self.process_tree.insert("", "end", values=(
+                name, item['state'], f"{item.get('cpu_percent', 0):.0f}", f"{item.get('rss_mb', 0):.0f}",
+                item.get('open_files', ''), item.get('threads', ''), item['restarts']))
+        self.refresh_job = self.after(self.REFRESH_INTERVAL, self.refresh)
+
+
+class StorageWindow(Toplevel):
+    REFRESH_INTERVAL = 2000
+
+    def __init__(self, parent, service):
+        super().__init__(parent)
+        self.title("Место на диске")
+        self.geometry("850x450")
+        self.service = service
+        self.version = None
+        self.gc_operation = None
+
+        columns = ("name", "total", "checkout", "git", "venv", "worktrees", "logs")
+        self.size_tree = Treeview(self, columns=columns, show="headings")
+        for column, text, width in (("name", "Проект", 200), ("total", "Всего", 90), ("checkout", "Файлы", 90),
+                                    ("git", ".git", 90), ("venv", "venv", 90), ("worktrees", "Версии", 90),
+                                    ("logs", "Логи", 90)):
+            self.size_tree.heading(column, text=text)
+            self.size_tree.column(column, width=width)
+        self.size_tree.pack(fill=BOTH, expand=True)
+
+        self.summary_label = Label(self, text="", justify="left")
+        self.summary_label.pack(fill=X, padx=10)
+        self.status_label = Label(self, text="")
+        self.status_label.pack()
 
+        buttons = Frame(self)
+        buttons.pack(pady=5)
+        Button(buttons, text="Пересчитать", command=self.rescan).pack(side="left", padx=5)
+        self.gc_button = Button(buttons, text="Очистить", command=self.collect_garbage)
+        self.gc_button.pack(side="left", padx=5)
+
+        self.refresh_job = None
+        self.refresh()
+
+    def destroy(self):
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        super().destroy()
+
+    def refresh(self):
+        if self.service.storage.version != self.version:
+            self.version = self.service.storage.version
+            self.show_usage(self.service.storage_usage())
+        if self.gc_operation is not None:
+            self.show_gc_status()
+        self.refresh_job = self.after(self.REFRESH_INTERVAL, self.refresh)
+
+    def show_usage(self, usage):
+        # Самые тяжелые проекты - сверху
+        self.size_tree.delete(*self.size_tree.get_children())
+        for name, item in sorted(usage['projects'].items(), key=lambda pair: pair[1]['total'], reverse=True):
+            self.size_tree.insert("", "end", values=(
+                name, format_size(item['total']), format_size(item['checkout']), format_size(item['git']),
+                format_size(item['venv']), format_size(item['worktrees']), format_size(item['logs'])))
+        shared = usage['shared']
+        self.summary_label.config(text=(
+            f"Свободно {format_size(usage['disk']['free'])} из {format_size(usage['disk']['total'])}. "
+            f"Общее: колеса {format_size(shared.get('wheelhouse', 0))}, "
+            f"шаблоны venv {format_size(shared.get('venv_templates', 0))}, "
+            f"корзина {format_size(shared.get('trash', 0))}"))
+
+    def rescan(self):
+        self.status_label.config(text="Пересчет...")
+        threading.Thread(target=self.service.storage.refresh, kwargs={'force': True}, daemon=True).start()
+
+    def collect_garbage(self):
+        self.gc_button.config(state="disabled")
+        self.gc_operation = self.service.gc()
+        self.show_gc_status()
+
+    def show_gc_status(self):
+        operation = next((item for item in self.service.operations() if item['id'] == self.gc_operation), None)
+        if operation is None:
+            self.gc_operation = None
+            return
+        self.status_label.config(text=operation['message'])
+        if operation['state'] != 'running':
+            self.gc_operation = None
+            self.gc_button.config(state="normal")
 
-def save_settings(settings):
-    with open(SETTINGS_FILE, 'w') as f:
-        json.dump(settings, f)
 
+class BulkWindow(Toplevel):
+    REFRESH_INTERVAL = 300
+    STATE_TEXT = {'pending': "В очереди", 'running': "Выполняется", 'done': "Готово", 'failed': "Ошибка",
+                  'cancelled': "Отменено"}
 
-class OutputWindow(Toplevel):
-    def __init__(self, project_name, process):
-        super().__init__()
-        self.title(f"{project_name}")
-        self.process = process
+    def __init__(self, parent, service, operation_id, title):
+        super().__init__(parent)
+        self.title(title)
+        self.geometry("700x400")
+        self.service = service
+        self.operation_id = operation_id
+
+        self.item_tree = Treeview(self, columns=("name", "state", "message"), show="headings")
+        for column, text, width in (("name", "Проект", 200), ("state", "Состояние", 110),
+                                    ("message", "Сообщение", 370)):
+            self.item_tree.heading(column, text=text)
+            self.item_tree.column(column, width=width)
+        self.item_tree.pack(fill=BOTH, expand=True)
+
+        self.progress_bar = Progressbar(self, orient=HORIZONTAL, mode='determinate')
+        self.progress_bar.pack(fill=X, padx=10, pady=5)
+        self.status_label = Label(self, text="")
+        self.status_label.pack()
+        self.cancel_button = Button(self, text="Отменить", command=self.cancel)
+        self.cancel_button.pack(pady=5)
+
+        self.refresh_job = None
+        self.refresh()
+
+    def destroy(self):
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        super().destroy()
+
+    def cancel(self):
+        self.service.cancel_bulk(self.operation_id)
+        self.cancel_button.config(state="disabled")
+
+    def refresh(self):
+        snapshot = self.service.bulk_status(self.operation_id)
+        for name, item in sorted(snapshot['items'].items()):
+            values = (name, self.STATE_TEXT.get(item['state'], item['state']), item['message'])
+            if self.item_tree.exists(name):
+                self.item_tree.item(name, values=values)
+            else:
+                self.item_tree.insert("", "end", iid=name, values=values)
+        completed = snapshot['done'] + snapshot['failed'] + snapshot['cancelled']
+        self.progress_bar['value'] = completed * 100 / snapshot['total'] if snapshot['total'] else 100
+        if snapshot['finished']:
+            # Итоговая сводка вместо счетчиков
+            operation = self.service.bulk_operation(self.operation_id)
+            self.status_label.config(text=operation.summary(), justify="left")
+            self.cancel_button.config(state="disabled")
+            self.refresh_job = None
+            return
+        self.status_label.config(text=f"Выполнено {completed} из {snapshot['total']}, "
+                                      f"ошибок {snapshot['failed']}")
+        self.refresh_job = self.after(self.REFRESH_INTERVAL, self.refresh)
 
-        self.output_text = Text(self, state='disabled')
-        self.output_text.pack(expand=True, fill=BOTH)
 
-        self.status_label = Label(self, text="Проект запущен...")
+class LogWindow(Toplevel):
+    PAGE_SIZE = 500
+
+    def __init__(self, parent, project_name, log_store):
+        super().__init__(parent)
+        self.title(f"Логи: {project_name}")
+        self.geometry("800x500")
+        self.project_name = project_name
+        self.log_store = log_store
+        self.reader = None
+        self.page_start = 0
+        self.search_thread = None
+        self.search_result = None
+
+        runs = log_store.runs(project_name) or ["(нет запусков)"]
+        self.run_var = StringVar(value=runs[0])
+        controls = Frame(self)
+        controls.pack(fill=X)
+        OptionMenu(controls, self.run_var, *runs, command=lambda _: self.open_run()).pack(side="left")
+        Button(controls, text="<<", command=lambda: self.show_page(0)).pack(side="left")
+        Button(controls, text="<", command=lambda: self.show_page(self.page_start - self.PAGE_SIZE)).pack(side="left")
+        Button(controls, text=">", command=lambda: self.show_page(self.page_start + self.PAGE_SIZE)).pack(side="left")
+        Button(controls, text="Хвост", command=self.show_tail).pack(side="left")
+        self.search_input = Entry(controls)
+        self.search_input.pack(side="left", fill=X, expand=True)
+        self.search_input.bind('<Return>', lambda _: self.search())
+        Button(controls, text="Найти", command=self.search).pack(side="left")
+
+        self.log_text = Text(self, state='disabled')
+        self.log_text.tag_config('stderr', foreground='red')
+        self.log_text.pack(expand=True, fill=BOTH)
+
+        self.status_label = Label(self, text="")
         self.status_label.pack()
 
-        self.stop_button = Button(self, text="Остановить", command=self.stop_process)
-        self.stop_button.pack()
+        if log_store.runs(project_name):
+            self.open_run()
 
-    def append_output(self, text):
-        self.output_text.config(state='normal')
-        self.output_text.insert(END, text)
-        self.output_text.config(state='disabled')
+    def open_run(self):
+        self.reader = self.log_store.reader(self.project_name, self.run_var.get())
+        self.show_tail()
 
-    def set_status(self, status):
-        self.status_label.config(text=status)
+    def show_tail(self):
+        if self.reader is not None:
+            self.show_page(self.reader.total_lines() - self.PAGE_SIZE)
 
-    def stop_process(self):
-        if self.process.poll() is None:  # Проверяем, что процесс еще работает
-            self.process.terminate()  # Попробуйте завершить процесс
+    def show_page(self, start):
+        if self.reader is None:
+            return
+        total = self.reader.total_lines()
+        self.page_start = max(0, min(start, total - self.PAGE_SIZE))
+        self.show_lines(self.reader.read_lines(self.page_start, self.PAGE_SIZE))
+        page_end = min(total, self.page_start + self.PAGE_SIZE)
+        self.status_label.config(text=f"Строки {self.page_start + 1}-{page_end} из {total}")
+
+    def show_lines(self, lines):
+        self.log_text.config(state='normal')
+        self.log_text.delete('1.0', END)
+        for line_no, ts, stream, text in lines:
+            self.log_text.insert(END, f"{line_no + 1}: {text}\n", stream)
+        self.log_text.config(state='disabled')
+
+    def search(self):
+        pattern = self.search_input.get()
+        if self.reader is None or not pattern or self.search_thread is not None:
+            return
+        self.status_label.config(text="Поиск...")
+
+        def run_search():
             try:
-                self.process.wait(timeout=5)  # Ждем завершения процесса
-            except subprocess.TimeoutExpired:
-                self.process.kill()
+                self.search_result = self.reader.grep(pattern)
+            except Exception as e:
+                self.search_result = e
+
+        # Поиск по многогигабайтному логу идет в фоне, результат забираем опросом из главного цикла
+        self.search_thread = threading.Thread(target=run_search, daemon=True)
+        self.search_thread.start()
+        self.after(100, self.check_search)
+
+    def check_search(self):
+        if self.search_thread.is_alive():
+            self.after(100, self.check_search)
+            return
+        self.search_thread = None
+        if isinstance(self.search_result, Exception):
+            self.status_label.config(text=f"Ошибка поиска: {self.search_result}")
+            return
+        self.show_lines(self.search_result)
+        self.status_label.config(text=f"Найдено строк: {len(self.search_result)}")
 
-    def close(self):
-        self.stop_process()
-        self.destroy()
+
+class CommitsWindow(Toplevel):
+    def __init__(self, parent, project_name, project_path):
+        super().__init__(parent)
+        self.parent = parent
+        self.project_name = project_name
+        self.project_path = project_path
+        self.history = None
+        self.ref = None
+        self.loaded = 0
+        self.has_more = False
+        self.loading = False
+        self.generation = 0  # ответы от устаревших запросов (смена ветки, поиск) отбрасываем
+        self.results = queue.Queue()
+
+        self.title(f"Коммиты: {project_name}")
+        self.geometry("700x450")  # Размер окна
+
+        # Настройка стиля
+        style = Style(self)
+        style.configure("Treeview", rowheight=25, font=("Arial", 10))
+        style.configure("Treeview.Heading", font=("Arial", 12, "bold"))
+
+        # Заголовок
+        title_label = Label(self, text=f"Коммиты проекта {project_name}", font=("Arial", 14))
+        title_label.pack(pady=10)
+
+        # Выбор ветки/тега и поиск
+        controls = Frame(self)
+        controls.pack(fill=X, padx=10)
+        self.ref_input = Combobox(controls, width=30)
+        self.ref_input.pack(side="left")
+        self.ref_input.bind('<<ComboboxSelected>>', lambda _: self.open_ref(self.ref_input.get()))
+        self.ref_input.bind('<Return>', lambda _: self.open_ref(self.ref_input.get()))
+        self.search_input = Entry(controls)
+        self.search_input.pack(side="left", fill=X, expand=True, padx=5)
+        self.search_input.bind('<Return>', lambda _: self.search())
+        Button(controls, text="Найти", command=self.search).pack(side="left")
+        Button(controls, text="Сброс", command=lambda: self.open_ref(self.ref)).pack(side="left")
+
+        # Рамка для таблицы коммитов
+        commits_frame = Frame(self)
+        commits_frame.pack(fill='both', expand=True, padx=10, pady=10)
+
+        # Scrollbar для таблицы
+        self.scrollbar = Scrollbar(commits_frame)
+        self.scrollbar.pack(side="right", fill="y")
+
+        # Таблица для отображения коммитов
+        self.commit_tree = Treeview(commits_frame, columns=("sha", "date", "author", "message"), show="headings",
+                                    yscrollcommand=self.on_scroll)
+        self.commit_tree.pack(fill="both", expand=True)
+
+        self.scrollbar.config(command=self.commit_tree.yview)
+
+        # Определение столбцов
+        self.commit_tree.heading("sha", text="SHA")
+        self.commit_tree.heading("date", text="Дата")
+        self.commit_tree.heading("author", text="Автор")
+        self.commit_tree.heading("message", text="Сообщение")
+
+        self.commit_tree.column("sha", width=80)
+        self.commit_tree.column("date", width=130)
+        self.commit_tree.column("author", width=120)
+        self.commit_tree.column("message", width=350)
+
+        self.status_label = Label(self, text="Загрузка...")
+        self.status_label.pack()
+
+        # Версии разворачиваются в отдельные рабочие деревья, основное дерево не трогается
+        buttons = Frame(self)
+        buttons.pack(pady=10)
+        Button(buttons, text="Переключиться на выбранный коммит", command=self.switch_commit).pack(side="left")
+        Button(buttons, text="Запустить рядом", command=self.run_side_by_side).pack(side="left", padx=5)
+        Button(buttons, text="Вернуться на ветку",
+               command=lambda: self.parent.switch_commit(self.project_name, None)).pack(side="left")
+
+        self.poll_job = None
+        self.run_in_background(self.open_history)
+        self.poll_results()
+
+    def destroy(self):
+        if self.poll_job is not None:
+            self.after_cancel(self.poll_job)
+            self.poll_job = None
+        super().destroy()
+
+    def run_in_background(self, job, *args):
+        # git log и разбор истории выполняются вне главного цикла Tk
+        generation = self.generation
+
+        def worker():
+            try:
+                result = job(*args)
+            except Exception as e:
+                result = e
+            self.results.put((generation, job, result))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def poll_results(self):
+        while True:
+            try:
+                generation, job, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            self.loading = False
+            if isinstance(result, Exception):
+                self.status_label.config(text=f"Не удалось загрузить коммиты: {result}")
+            elif job == self.open_history:
+                self.ref_input.config(values=result[1])
+                self.open_ref(result[0])
+            else:
+                self.show_commits(*result)
+        self.poll_job = self.after(50, self.poll_results)
+
+    def open_history(self):
+        from commits import CommitHistory  # GitPython нужен только браузеру коммитов
+        self.history = CommitHistory(self.project_path)
+        return self.history.default_ref(), self.history.refs()
+
+    def open_ref(self, ref):
+        if self.history is None or not ref:
+            return
+        self.ref = ref
+        self.ref_input.set(ref)
+        self.generation += 1
+        self.commit_tree.delete(*self.commit_tree.get_children())  # Очистка предыдущих данных
+        self.loaded = 0
+        self.has_more = True
+        self.loading = False
+        self.load_more()
+
+    def load_more(self):
+        if self.loading or not self.has_more:
+            return
+        self.loading = True
+        self.status_label.config(text="Загрузка...")
+        self.run_in_background(self.load_page, self.ref, self.loaded)
+
+    def load_page(self, ref, offset):
+        commits, has_more = self.history.load_page(ref, offset)
+        return commits, has_more, offset == 0
+
+    def search(self):
+        query = self.search_input.get()
+        if self.history is None or not query.strip():
+            return
+        self.generation += 1
+        self.commit_tree.delete(*self.commit_tree.get_children())
+        self.has_more = False
+        self.loading = True
+        self.status_label.config(text="Поиск...")
+        self.run_in_background(lambda: (self.history.search(self.ref, query), False, True))
+
+    def show_commits(self, commits, has_more, first_page):
+        for commit in commits:
+            date = time.strftime('%Y-%m-%d %H:%M', time.localtime(commit['date']))
+            self.commit_tree.insert("", "end", iid=commit['sha'],
+                                    values=(commit['short'], date, commit['author'], commit['summary']))
+        self.loaded += len(commits)
+        self.has_more = has_more
+        if first_page and commits:
+            self.commit_tree.selection_set(self.commit_tree.get_children()[0])  # Выбор первого коммита
+        self.status_label.config(text=f"Показано коммитов: {len(self.commit_tree.get_children())}")
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Подгружаем следующую страницу, когда пользователь долистал почти до конца
+        if float(last) > 0.9:
+            self.load_more()
+
+    def switch_commit(self):
+        selected_item = self.commit_tree.selection()
+        if not selected_item:
+            messagebox.showwarning("Ошибка", "Пожалуйста, выберите коммит для переключения.")
+            return
+        self.parent.switch_commit(self.project_name, selected_item[0])
+
+    def run_side_by_side(self):
+        selected_item = self.commit_tree.selection()
+        if not selected_item:
+            messagebox.showwarning("Ошибка", "Пожалуйста, выберите коммит для запуска.")
+            return
+        self.parent.run_side_by_side(self.project_name, selected_item[0])
 
 
 class SettingsWindow(Toplevel):
@@ -152,98 +644,101 @@ class SettingsWindow(Toplevel):
             self.path_input.insert(0, folder)
 
     def reset_run_paths(self):
-        for project in os.listdir(self.parent.projects_dir):
-            config_path = os.path.join(self.parent.projects_dir, project, 'config.json')
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                config['run_file'] = None
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, ensure_ascii=False, indent=4)
+        self.parent.service.reset_run_files()
         messagebox.showinfo("Сброс путей", "Пути файлов запуска сброшены")
 
     def save_settings(self):
         new_path = self.path_input.get()
         if new_path and new_path != self.parent.projects_dir:
             self.parent.projects_dir = new_path
-            os.makedirs(self.parent.projects_dir, exist_ok=True)
+            self.parent.service.set_projects_dir(new_path)
             self.parent.load_projects()
-            settings = load_settings()
-            settings['projects_dir'] = new_path
-            save_settings(settings)
         self.destroy()
 
     def close(self):
         self.destroy()
 
 
-class CloneThread(threading.Thread):
-    def __init__(self, url, projects_dir, progress_callback, message_callback, finished_callback):
-        super().__init__()
-        self.url = url
-        self.projects_dir = projects_dir
-        self.progress_callback = progress_callback
-        self.message_callback = message_callback
-        self.finished_callback = finished_callback
-
-    def run(self):
-        asyncio.run(self.clone_project())
+class OperationsPanel(Frame):
+    # Своя строка с прогрессом на каждую операцию вместо одной общей полосы.
+    # Меняется только из главного потока, перерисовывается не чаще раза в кадр
+    MAX_ROWS = 6  # остальные операции сворачиваются в строку "и еще N"
+    KEEP_FINISHED = 3000  # мс, сколько закончившаяся операция остается на экране
 
-    async def clone_project(self):
-        try:
-            repo_name = self.url.split('/')[-1].replace(".git", "")
-            project_path = os.path.join(self.projects_dir, repo_name)
-            if os.path.exists(project_path):
-                raise Exception(f"Проект {repo_name} уже существует.")
-
-            self.message_callback(f"Скачивание проекта {repo_name}...")
-            git.Repo.clone_from(self.url, project_path)
-
-            self.progress_callback(35)
-            self.message_callback("Создание виртуального окружения...")
-
-            await create_venv(project_path)
-
-            self.progress_callback(100)
-        except Exception as e:
-            self.message_callback(str(e))
-        self.finished_callback()
-
-
-class UpdateThread(threading.Thread):
-    def __init__(self, project_path, progress_callback, message_callback, finished_callback):
-        super().__init__()
-        self.project_path = project_path
-        self.progress_callback = progress_callback
-        self.message_callback = message_callback
-        self.finished_callback = finished_callback
-
-    def run(self):
-        try:
-            self.message_callback("Обновление проекта...")
-            repo = git.Repo(self.project_path)
-            origin = repo.remotes.origin
-            origin.pull()
-
-            self.progress_callback(50)
-            requirements_path = os.path.join(self.project_path, 'requirements.txt')
-            if os.path.exists(requirements_path):
-                self.message_callback("Обновление зависимостей...")
-                subprocess.run(
-                    [os.path.join(self.get_venv(self.project_path), 'Scripts', 'pip'), 'install', '-r',
-                     requirements_path],
-                    check=True)
-
-            self.progress_callback(100)
-        except Exception as e:
-            self.message_callback(str(e))
-        self.finished_callback()
-
-    def get_venv(self, project_path):
-        venv_path = os.path.join(project_path, 'venv')
-        if os.path.exists(venv_path):
-            return venv_path
-        return os.path.join(project_path, '.venv')
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.entries = {}
+        self.rows = {}
+        self.order = []
+        self.dirty = False
+        self.more_label = Label(self, text="")
+
+    def on_progress(self, key, data):
+        entry = self.entries.get(key)
+        if entry is None or entry['finished']:
+            # Новая операция с тем же ключом встает в конец
+            self.entries.pop(key, None)
+            entry = self.entries[key] = {'title': str(key), 'value': 0, 'message': '', 'queued': False,
+                                         'finished': False}
+            self.dirty = True
+        for name, value in data.items():
+            if entry.get(name) != value:
+                entry[name] = value
+                self.dirty = True
+
+    def on_finished(self, key, data):
+        entry = self.entries.get(key)
+        if entry is None or entry['finished']:
+            return
+        error = data.get('error')
+        entry.update(finished=True, queued=False, value=100, message=f"ошибка: {error}" if error else "готово")
+        self.dirty = True
+        self.after(self.KEEP_FINISHED, self.remove, key, entry)
+
+    def remove(self, key, entry):
+        if self.entries.get(key) is entry:
+            del self.entries[key]
+            self.dirty = True
+
+    def redraw(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        # Сначала идущие операции, за ними закончившиеся, ожидающие очереди - в конце
+        ordered = sorted(self.entries.items(), key=lambda item: (item[1]['queued'], item[1]['finished']))
+        visible = dict(ordered[:self.MAX_ROWS])
+        for key in list(self.rows):
+            if key not in visible:
+                self.rows.pop(key)['frame'].destroy()
+        for key, entry in visible.items():
+            row = self.rows.get(key)
+            if row is None:
+                frame = Frame(self)
+                label = Label(frame, text="", anchor=W)
+                label.pack(fill=X)
+                bar = Progressbar(frame, orient=HORIZONTAL, mode='determinate')
+                bar.pack(fill=X)
+                row = self.rows[key] = {'frame': frame, 'label': label, 'bar': bar}
+            text = f"{entry['title']}: {entry['message']}" if entry['message'] else entry['title']
+            if row['label'].cget('text') != text:
+                row['label'].config(text=text)
+            if row['bar']['value'] != entry['value']:
+                row['bar']['value'] = entry['value']
+
+        hidden = len(self.entries) - len(visible)
+        order = list(visible) + (['more'] if hidden else [])
+        if order != self.order:
+            # Перекладываем строки, только если поменялся их состав или порядок
+            for row in self.rows.values():
+                row['frame'].pack_forget()
+            self.more_label.pack_forget()
+            for key in visible:
+                self.rows[key]['frame'].pack(fill=X, padx=10, pady=2)
+            if hidden:
+                self.more_label.pack()
+            self.order = order
+        if hidden:
+            self.more_label.config(text=f"... и еще операций: {hidden}")
 
 
 class GitHubManager(Tk):
@@ -252,140 +747,147 @@ class GitHubManager(Tk):
 
         self.settings = load_settings()
         self.projects_dir = self.settings['projects_dir']
-        os.makedirs(self.projects_dir, exist_ok=True)
         self.output_windows = {}
-        self.selected_commit = StringVar()
+        self.update_keys = set()
+        self.catalog_version = None
+        # Фоновые потоки не трогают виджеты, а шлют события, главный поток разбирает их раз в кадр
+        self.events = EventBus()
+
+        self.startup_timer = StartupTimer(STARTED)
+        self.startup_timer.mark("settings")
+
+        # Вся работа с проектами идет через сервис, окно - лишь один из его клиентов
+        self.service = ManagerService(self.settings)
+        self.service.start()
+        self.control_server = None
+        self.listener = None
+        self.startup_timer.mark("service")
 
         self.initUI()
-        self.autoupdate_projects()
+        self.pump_events()
+        self.poll_update_progress()
+        self.poll_catalog()
+        self.startup_timer.mark("ui")
 
         self.minsize(800, 600)
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)  # Обработчик закрытия окна
 
+        # Обновления, пул venv, API и горячие клавиши стартуют после того, как окно показано
+        self.after_idle(self.on_first_paint)
+
+    def on_first_paint(self):
+        self.startup_timer.mark("first_paint")
+        self.after(BACKGROUND_START_DELAY, self.start_background)
+
+    def start_background(self):
+        self.service.start_background()
+        if self.settings.get('api_enabled'):
+            from daemon import start_control_server, DEFAULT_API_HOST, DEFAULT_API_PORT
+            self.control_server = start_control_server(
+                self.service, self.settings.get('api_host', DEFAULT_API_HOST),
+                self.settings.get('api_port', DEFAULT_API_PORT), self.settings.get('api_socket'))
+        threading.Thread(target=self.start_hotkeys, daemon=True).start()
+        self.startup_timer.mark("background")
+        threading.Thread(target=self.save_startup_report, daemon=True).start()
+
+    def start_hotkeys(self):
+        # pynput грузится заметное время, поэтому импортируем его в фоне
+        from pynput import keyboard
         self.listener = keyboard.GlobalHotKeys({
-            '<ctrl>+<alt>+q': self.stop_last_project
+            '<ctrl>+<alt>+q': lambda: self.events.call(self.stop_last_project)
         })
         self.listener.start()
 
+    def save_startup_report(self):
+        cache_dir = os.path.join(self.projects_dir, CACHE_DIR)
+        history = self.startup_timer.load_history(cache_dir)
+        print(self.startup_timer.report(history))
+        try:
+            self.startup_timer.save(cache_dir, history)
+        except OSError as e:
+            print(f"Startup report save error: {e}")
+
     def stop_last_project(self):
         print("Hotkey triggered: Ctrl+Alt+Q")  # Проверка, вызывается ли функция
         if self.output_windows:
             last_project = list(self.output_windows.keys())[-1]
             print(f"Stopping project: {last_project}")  # Проверка, что проект выбирается
-            window = self.output_windows[last_project]
-
-            if window.process and window.process.poll() is None:
-                print(f"Terminating process for project: {last_project}")
-                parent_process = psutil.Process(window.process.pid)
-                for child in parent_process.children(recursive=True):  # Убиваем дочерние процессы
-                    child.kill()
-                parent_process.terminate()
-                try:
-                    parent_process.wait(timeout=3)  # Ждем завершения процесса
-                    print(f"Process for project {last_project} terminated")
-                except psutil.TimeoutExpired:
-                    print(f"Process for project {last_project} did not terminate, killing it")
-                    parent_process.kill()
-                    print(f"Process for project {last_project} killed")
-
-                window.set_status("Проект остановлен")
-                window.stop_button.config(state='disabled')
+            print(f"Terminating process tree for project: {last_project}")
+            if self.service.stop(last_project):
+                print(f"Process for project {last_project} stopped")
             else:
                 print(f"No active process for project: {last_project}")
         else:
             print("No projects running")
 
     def on_close(self):
-        for output_window in self.output_windows.values():
-            output_window.stop_process()
+        self.service.shutdown()
         self.destroy()
 
-    def switch_commit(self, project_path):
-        selected_item = self.commit_tree.selection()
-        if not selected_item:
-            messagebox.showwarning("Ошибка", "Пожалуйста, выберите коммит для переключения.")
-            return
+    def pump_events(self):
+        self.events.dispatch()
+        self.operations_panel.redraw()
+        self.after(DEFAULT_FRAME_INTERVAL, self.pump_events)
 
-        selected_commit = self.commit_tree.item(selected_item[0], "values")[0]
+    def notify(self, title, message, error=False):
+        # Диалог открывается вне разбора очереди, чтобы не задерживать остальные события кадра
+        self.after_idle(messagebox.showerror if error else messagebox.showinfo, title, message)
 
-        try:
-            repo = git.Repo(project_path)
-
-            # Проверка на незакоммиченные изменения
-            if repo.is_dirty():
-                messagebox.showwarning("Ошибка",
-                                       "Есть несохраненные изменения. Сохраните изменения перед переключением коммитов.")
-                return
-
-            # Проверка наличия выбранного коммита
-            try:
-                repo.git.checkout(selected_commit)
-                messagebox.showinfo("Успех", f"Переключено на коммит {selected_commit}.")
-            except git.exc.BadName:
-                messagebox.showerror("Ошибка", f"Коммит с SHA {selected_commit} не найден.")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось переключиться на коммит: {str(e)}")
-
-    def show_commits_window(self):
-        selected_project = self.projects_listbox.get(self.projects_listbox.curselection())
-        project_path = os.path.join(self.projects_dir, selected_project)
-
-        # Создание нового окна
-        self.commits_window = Toplevel(self)
-        self.commits_window.title(f"Коммиты: {selected_project}")
-        self.commits_window.geometry("600x400")  # Размер окна
-
-        # Настройка стиля
-        style = Style(self.commits_window)
-        style.configure("Treeview", rowheight=25, font=("Arial", 10))
-        style.configure("Treeview.Heading", font=("Arial", 12, "bold"))
-
-        # Заголовок
-        title_label = Label(self.commits_window, text=f"Коммиты проекта {selected_project}", font=("Arial", 14))
-        title_label.pack(pady=10)
-
-        # Рамка для таблицы коммитов
-        commits_frame = Frame(self.commits_window)
-        commits_frame.pack(fill='both', expand=True, padx=10, pady=10)
-
-        # Scrollbar для таблицы
-        scrollbar = Scrollbar(commits_frame)
-        scrollbar.pack(side="right", fill="y")
-
-        # Таблица для отображения коммитов
-        self.commit_tree = Treeview(commits_frame, columns=("sha", "message"), show="headings", yscrollcommand=scrollbar.set)
-        self.commit_tree.pack(fill="both", expand=True)
+    def on_project_log(self, name, data):
+        text = ''.join(data['lines'])
+        output_window = self.output_windows.get(name)
+        if output_window is not None and output_window.winfo_exists():
+            output_window.append_output(text)
+        else:
+            print(text, end='')
 
-        scrollbar.config(command=self.commit_tree.yview)
+    def open_output_window(self, supervised):
+        output_window = OutputWindow(supervised.name, self.service)
+        self.output_windows[supervised.name] = output_window
+        output_window.attach(supervised)
 
-        # Определение столбцов
-        self.commit_tree.heading("sha", text="SHA")
-        self.commit_tree.heading("message", text="Сообщение")
+    def switch_commit(self, project_name, selected_commit):
+        if selected_commit is None:
+            # Возврат на основное дерево: разворачивать нечего, только перезапуск, если проект работает
+            def job():
+                try:
+                    self.service.switch(project_name, None,
+                                        lambda message: self.events.log(project_name, message + "\n"))
+                except Exception as e:
+                    self.events.call(self.notify, "Ошибка", str(e), True)
+                    return
+                self.events.call(self.notify, "Версия", f"{project_name} переключен на текущую ветку")
+
+            threading.Thread(target=job, daemon=True).start()
+            return
+        # Через массовую операцию: первое разворачивание версии с зависимостями идет в фоне с прогрессом
+        self.run_bulk('checkout', [project_name], f"Переключение на {selected_commit[:7]}", ref=selected_commit)
 
-        self.commit_tree.column("sha", width=150)
-        self.commit_tree.column("message", width=400)
+    def run_side_by_side(self, project_name, ref):
+        # Вторая версия проекта рядом с основной, из своего рабочего дерева
+        key = ('run', project_name, ref)
+        self.events.progress(key, title=f"Подготовка {project_name}@{ref[:7]}")
 
-        # Загрузка коммитов в таблицу
-        self.update_commits(project_path)
+        def job():
+            try:
+                supervised = self.service.run(
+                    project_name, ref=ref, message_callback=lambda message: self.events.progress(key, message=message))
+            except Exception as e:
+                self.events.finished(key, str(e))
+                self.events.call(self.notify, "Ошибка", str(e), True)
+                return
+            self.events.finished(key)
+            self.events.call(self.open_output_window, supervised)
 
-        # Кнопка для переключения на выбранный коммит
-        switch_button = Button(self.commits_window, text="Переключиться на выбранный коммит",
-                               command=lambda: self.switch_commit(project_path))
-        switch_button.pack(pady=10)
+        threading.Thread(target=job, daemon=True).start()
 
-    def update_commits(self, project_path):
-        try:
-            repo = git.Repo(project_path)
-            commits = list(repo.iter_commits('master', max_count=100))
-            self.commit_tree.delete(*self.commit_tree.get_children())  # Очистка предыдущих данных
-
-            for commit in commits:
-                self.commit_tree.insert("", "end", values=(commit.hexsha[:7], commit.message))
-            if commits:
-                self.commit_tree.selection_set(self.commit_tree.get_children()[0])  # Выбор первого коммита
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить коммиты: {str(e)}")
+    def show_commits_window(self):
+        selected_project = self.selected_project()
+        if selected_project is None:
+            return
+        project_path = os.path.join(self.projects_dir, selected_project)
+        self.commits_window = CommitsWindow(self, selected_project, project_path)
 
     def initUI(self):
         self.title("GitHub Manager")
@@ -400,12 +902,14 @@ class GitHubManager(Tk):
 
         projectMenu = Menu(self.menubar, tearoff=0)
         projectMenu.add_command(label="Скачать проект", command=self.clone_project)
+        projectMenu.add_command(label="Процессы", command=lambda: ProcessesWindow(self, self.service.supervisor))
+        projectMenu.add_command(label="Место на диске", command=lambda: StorageWindow(self, self.service))
         self.menubar.add_cascade(label="Проекты", menu=projectMenu)
 
         self.frame = Frame(self)
         self.frame.pack(fill=BOTH, expand=True)
 
-        self.projects_listbox = Listbox(self.frame)
+        self.projects_listbox = Listbox(self.frame, selectmode=EXTENDED, exportselection=False)
         self.projects_listbox.pack(side="left", fill=BOTH, expand=True)
 
         scrollbar = Scrollbar(self.frame)
@@ -430,150 +934,219 @@ class GitHubManager(Tk):
         self.update_button = Button(self.details_frame, text="Обновить проект", command=self.update_project)
         self.update_button.pack()
 
+        self.restart_button = Button(self.details_frame, text="Перезапустить выбранные", command=self.restart_projects)
+        self.restart_button.pack()
+
+        self.watch_button = Button(self.details_frame, text="Перезапуск при изменениях",
+                                   command=self.toggle_watch)
+        self.watch_button.pack()
+
+        self.checkout_button = Button(self.details_frame, text="Переключить выбранные на тег",
+                                      command=self.checkout_projects)
+        self.checkout_button.pack()
+
         self.delete_button = Button(self.details_frame, text="Удалить проект", command=self.delete_project)
         self.delete_button.pack()
 
-        self.progress_bar = Progressbar(self.details_frame, orient=HORIZONTAL, length=100, mode='determinate')
-        self.progress_bar.pack(fill=X, padx=10, pady=10)
+        self.logs_button = Button(self.details_frame, text="Логи проекта", command=self.show_logs_window)
+        self.logs_button.pack()
 
-        self.progress_label = Label(self.details_frame, text="")
-        self.progress_label.pack()
+        self.operations_panel = OperationsPanel(self.details_frame)
+        self.operations_panel.pack(fill=X, pady=10)
+        self.events.subscribe(EVENT_PROGRESS, self.operations_panel.on_progress)
+        self.events.subscribe(EVENT_FINISHED, self.operations_panel.on_finished)
+        self.events.subscribe(EVENT_LOG, self.on_project_log)
 
-        self.load_projects()
+        # Сразу рисуем список из кэша каталога, а сверку с диском делаем в фоне:
+        # poll_catalog подхватит изменения, когда она закончится
+        self.sync_projects_listbox()
+        threading.Thread(target=self.service.catalog.refresh, daemon=True).start()
+
+    def show_logs_window(self):
+        selected_project = self.selected_project()
+        if selected_project is None:
+            return
+        LogWindow(self, selected_project, self.service.log_store)
 
     def show_settings(self):
         settings_window = SettingsWindow(self)
         settings_window.grab_set()
 
     def load_projects(self):
-        self.projects_listbox.delete(0, END)
-        if os.path.exists(self.projects_dir):
-            for project in os.listdir(self.projects_dir):
-                project_path = os.path.join(self.projects_dir, project)
-                if os.path.isdir(project_path) and os.path.exists(os.path.join(project_path, '.git')):
-                    self.projects_listbox.insert(END, project)
+        self.service.catalog.refresh()
+        self.sync_projects_listbox()
+
+    def sync_projects_listbox(self):
+        # Точечно обновляем список, чтобы не сбрасывать выделение и прокрутку
+        catalog = self.service.catalog
+        self.catalog_version = catalog.version
+        names = catalog.names()
+        current = list(self.projects_listbox.get(0, END))
+        wanted = set(names)
+        for index in range(len(current) - 1, -1, -1):
+            if current[index] not in wanted:
+                self.projects_listbox.delete(index)
+                del current[index]
+        existing = set(current)
+        for index, name in enumerate(names):
+            if name not in existing:
+                self.projects_listbox.insert(index, name)
+
+    def poll_catalog(self):
+        # Каталог обновляется в фоне, список перерисовываем из главного потока
+        if self.service.catalog.version != self.catalog_version:
+            self.sync_projects_listbox()
+        self.after(1000, self.poll_catalog)
+
+    def selected_projects(self):
+        return [self.projects_listbox.get(index) for index in self.projects_listbox.curselection()]
+
+    def selected_project(self):
+        selected = self.selected_projects()
+        return selected[0] if selected else None
 
     def on_project_select(self, event):
-        if self.projects_listbox.curselection():
-            selected_project = self.projects_listbox.get(self.projects_listbox.curselection())
-            self.project_label.config(text=f"Проект: {selected_project}")
+        selected = self.selected_projects()
+        if len(selected) == 1:
+            self.project_label.config(text=f"Проект: {selected[0]}")
+            self.service.touch(selected[0])
+        elif selected:
+            self.project_label.config(text=f"Выбрано проектов: {len(selected)}")
 
     def run_project(self):
-        selected_project = self.projects_listbox.get(self.projects_listbox.curselection())
+        selected_project = self.selected_project()
+        if selected_project is None:
+            return
         project_path = os.path.join(self.projects_dir, selected_project)
 
-        config_path = os.path.join(project_path, 'config.json')
-
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except FileNotFoundError:
-            config = {}  # Инициализация переменной config
-            run_file = filedialog.askopenfilename(initialdir=project_path, title="Выберите файл для запуска")
-            if run_file:
+            config = self.service.run_config(selected_project)
+            if not config.get('run_file'):
+                run_file = filedialog.askopenfilename(initialdir=project_path, title="Выберите файл для запуска")
+                if not run_file:
+                    messagebox.showerror("Ошибка", "Файл для запуска не выбран.")
+                    return
+                self.service.set_run_file(selected_project, run_file)
                 config['run_file'] = run_file
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, ensure_ascii=False, indent=4)
-            else:
-                messagebox.showerror("Ошибка", "Файл для запуска не выбран.")
-                return
-
-        run_file = config['run_file']
-
-        self.output_windows[selected_project] = OutputWindow(selected_project, None)
-        self.output_windows[selected_project].append_output(f"Запуск {run_file}...\n")
 
-        venv_path = os.path.join(project_path, 'venv', 'Scripts', 'python.exe')
-        if not os.path.exists(venv_path):
-            venv_path = os.path.join(project_path, '.venv', 'Scripts', 'python.exe')
+            output_window = OutputWindow(selected_project, self.service)
+            self.output_windows[selected_project] = output_window
+            output_window.append_output(f"Запуск {config['run_file']}...\n")
 
-        if not os.path.exists(venv_path):
-            messagebox.showerror("Ошибка", "Виртуальное окружение не найдено.")
+            supervised = self.service.run(selected_project)
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
             return
-
-        process = subprocess.Popen([venv_path, run_file], cwd=project_path, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE, text=True, encoding='utf-8')
-        self.output_windows[selected_project].process = process
-
-        def read_output():
-            for line in process.stdout:
-                self.output_windows[selected_project].append_output(line)
-            process.stdout.close()
-
-            for line in process.stderr:
-                self.output_windows[selected_project].append_output(line)
-            process.stderr.close()
-
-            process.wait()
-            self.output_windows[selected_project].set_status("Проект завершен")
-
-        threading.Thread(target=read_output).start()
+        output_window.attach(supervised)
 
     def update_project(self):
-        selected_project = self.projects_listbox.get(self.projects_listbox.curselection())
-        project_path = os.path.join(self.projects_dir, selected_project)
-
-        def update_progress(value):
-            self.progress_bar['value'] = value
-
-        def update_message(message):
-            self.progress_label.config(text=message)
+        selected = self.selected_projects()
+        if len(selected) > 1:
+            self.run_bulk('update', selected, "Обновление проектов")
+            return
+        if not selected:
+            return
 
-        def update_finished():
-            messagebox.showinfo("Обновление", "Проект успешно обновлен")
-            self.progress_bar['value'] = 0
-            self.progress_label.config(text="")
+        # Колбэк приходит из воркера планировщика, итог показываем из главного потока
+        name = selected[0]
+        self.service.update(name, lambda state, message: self.events.call(self.show_update_result, name, state,
+                                                                          message))
 
-        update_thread = UpdateThread(project_path, update_progress, update_message, update_finished)
-        update_thread.start()
+    def show_update_result(self, name, state, message):
+        if state == UPDATE_FAILED:
+            self.notify("Ошибка", f"Не удалось обновить {name}: {message}", True)
+        else:
+            self.notify("Обновление", "Проект успешно обновлен")
 
-    def update_project_by_path(self, project_path):
-        def update_progress(value):
-            self.progress_bar['value'] = value
+    def restart_projects(self):
+        selected = self.selected_projects()
+        if selected:
+            self.run_bulk('restart', selected, "Перезапуск проектов")
 
-        def update_message(message):
-            self.progress_label.config(text=message)
+    def toggle_watch(self):
+        # Включает режим наблюдения для выбранных проектов или выключает, если он уже включен у всех
+        selected = self.selected_projects()
+        if not selected:
+            return
+        enabled = not all(self.service.run_config(name).get('watch') for name in selected)
+        self.service.config_store.update_many({name: {'watch': enabled or None} for name in selected})
+        if enabled:
+            messagebox.showinfo("Наблюдение", "Проекты будут перезапускаться при изменении файлов и после обновления")
+        else:
+            messagebox.showinfo("Наблюдение", "Наблюдение за файлами выключено")
 
-        def update_finished():
-            self.progress_bar['value'] = 0
-            self.progress_label.config(text="")
+    def checkout_projects(self):
+        selected = self.selected_projects()
+        if not selected:
+            return
+        ref = simpledialog.askstring("Переключить на тег", f"Тег или ветка для {len(selected)} проектов:")
+        if ref:
+            self.run_bulk('checkout', selected, f"Переключение на {ref}", ref=ref)
 
-        update_thread = UpdateThread(project_path, update_progress, update_message, update_finished)
-        update_thread.start()
+    def run_bulk(self, action, names, title, ref=None):
+        try:
+            operation_id = self.service.bulk(action, names, ref)
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        BulkWindow(self, self.service, operation_id, title)
+
+    def poll_update_progress(self):
+        # Планировщик сам ведет прогресс каждого проекта, панель сверяется с его снимком
+        items = self.service.update_scheduler.progress.snapshot()['items']
+        for path, item in items.items():
+            key = ('update', path)
+            if item['state'] in (UPDATE_DONE, UPDATE_FAILED):
+                if key in self.update_keys:
+                    self.update_keys.discard(key)
+                    error = (item['message'] or "ошибка") if item['state'] == UPDATE_FAILED else None
+                    self.operations_panel.on_finished(key, {'error': error})
+                continue
+            queued = item['state'] == UPDATE_QUEUED
+            self.update_keys.add(key)
+            self.operations_panel.on_progress(key, {
+                'title': f"Обновление {os.path.basename(path)}", 'value': item['value'], 'queued': queued,
+                'message': "в очереди" if queued else item['message']})
+        self.after(500, self.poll_update_progress)
 
     def delete_project(self):
-        selected_project = self.projects_listbox.get(self.projects_listbox.curselection())
-        project_path = os.path.join(self.projects_dir, selected_project)
-
-        confirm = messagebox.askyesno("Удалить проект", f"Вы уверены, что хотите удалить проект {selected_project}?")
+        selected = self.selected_projects()
+        if not selected:
+            return
+        question = (f"Вы уверены, что хотите удалить проект {selected[0]}?" if len(selected) == 1
+                    else f"Вы уверены, что хотите удалить {len(selected)} проектов?")
+        confirm = messagebox.askyesno("Удалить проект", question)
         if confirm:
-            shutil.rmtree(project_path)
-            self.load_projects()
+            # Удаление идет в фоне: проект переименовывается в корзину и стирается там
+            self.run_bulk('delete', selected, "Удаление проектов")
 
     def clone_project(self):
         url = simpledialog.askstring("Скачать проект", "Введите URL репозитория GitHub")
-        if url:
-            def update_progress(value):
-                self.progress_bar['value'] = value
-
-            def update_message(message):
-                self.progress_label.config(text=message)
-
-            def update_finished():
-                self.load_projects()
-                messagebox.showinfo("Скачивание", "Проект успешно скачан")
-                self.progress_bar['value'] = 0
-                self.progress_label.config(text="")
-
-            clone_thread = CloneThread(url, self.projects_dir, update_progress, update_message, update_finished)
-            clone_thread.start()
-
-    def autoupdate_projects(self):
-        for project in os.listdir(self.projects_dir):
-            project_path = os.path.join(self.projects_dir, project)
-            if os.path.isdir(project_path) and os.path.exists(os.path.join(project_path, '.git')):
-                self.update_project_by_path(project_path)
-        self.after(3600000, self.autoupdate_projects)  # Повторный вызов функции через 1 час
+        if not url:
+            return
+        # Колбэки вызываются из цикла сервиса: виджеты не трогаем, только шлем события
+        key = ('clone', url)
+        operation_id = None
+
+        def clone_finished():
+            self.load_projects()
+            operation = next((item for item in self.service.operations() if item['id'] == operation_id), {})
+            if operation.get('state') == OPERATION_FAILED:
+                self.operations_panel.on_finished(key, {'error': operation['message']})
+                self.notify("Ошибка", f"Не удалось скачать проект: {operation['message']}", True)
+            else:
+                self.operations_panel.on_finished(key, {})
+                self.notify("Скачивание", "Проект успешно скачан")
+
+        self.events.progress(key, title=f"Скачивание {url}")
+        try:
+            operation_id = self.service.clone(url,
+                                              lambda value: self.events.progress(key, value=value),
+                                              lambda message: self.events.progress(key, message=message),
+                                              lambda: self.events.call(clone_finished))
+        except Exception as e:
+            self.events.finished(key, str(e))
+            messagebox.showerror("Ошибка", str(e))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import threading
+import time
+
+import git
+
+from catalog import CACHE_DIR, find_git_dir
+
+COMMITS_CACHE_DIR = 'commits'
+PAGE_SIZE = 200
+MAX_CACHED_TIPS = 5  # сколько разных вершин истории хранить на проект
+SEARCH_LIMIT = 200
+
+LOG_FORMAT = '%H%x1f%h%x1f%an%x1f%at%x1f%s%x1e'
+SHA_RE = re.compile(r'^[0-9a-fA-F]{4,40}$')
+
+
+def parse_log(output):
+    commits = []
+    for record in output.split('\x1e'):
+        record = record.strip('\n')
+        if not record:
+            continue
+        sha, short_sha, author, timestamp, summary = record.split('\x1f')
+        commits.append({'sha': sha, 'short': short_sha, 'author': author,
+                        'date': int(timestamp), 'summary': summary})
+    return commits
+
+
+class CommitHistory:
+    # Постраничная загрузка истории произвольной ветки или тега. Разобранные коммиты
+    # кэшируются в .cache/commits/<проект>.json по SHA вершины: пока ветка не сдвинулась,
+    # повторное открытие окна не запускает git log. У мелкого (shallow) клона
+    # недостающая история догружается с сервера, когда пользователь до нее долистал.
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.repo = git.Repo(project_path)
+        self.git_dir = find_git_dir(project_path)
+        projects_dir = os.path.dirname(project_path)
+        self.cache_path = os.path.join(projects_dir, CACHE_DIR, COMMITS_CACHE_DIR,
+                                       os.path.basename(project_path) + '.json')
+        self._lock = threading.Lock()
+        self._cache = self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        # Храним только несколько последних вершин, самые старые выбрасываем
+        tips = sorted(self._cache, key=lambda tip: self._cache[tip].get('used', 0), reverse=True)
+        self._cache = {tip: self._cache[tip] for tip in tips[:MAX_CACHED_TIPS]}
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def default_ref(self):
+        if self.repo.head.is_detached:
+            return 'HEAD'
+        return self.repo.active_branch.name
+
+    def refs(self):
+        output = self.repo.git.for_each_ref('--format=%(refname:short)', 'refs/heads', 'refs/remotes', 'refs/tags')
+        return [ref for ref in output.splitlines() if ref and not ref.endswith('/HEAD')]
+
+    def resolve(self, ref):
+        return self.repo.git.rev_parse('--verify', f'{ref}^{{commit}}')
+
+    def is_shallow(self):
+        try:
+            return os.path.getsize(os.path.join(self.git_dir, 'shallow')) > 0
+        except OSError:
+            return False
+
+    def deepen(self, count=PAGE_SIZE):
+        self.repo.git.fetch(f'--deepen={count}')
+
+    def _log(self, tip, skip, count):
+        return parse_log(self.repo.git.log(tip, f'--format={LOG_FORMAT}', f'--skip={skip}', f'-n{count}'))
+
+    def load_page(self, ref, offset, count=PAGE_SIZE):
+        # -> (коммиты, есть ли еще)
+        tip = self.resolve(ref)
+        with self._lock:
+            entry = self._cache.setdefault(tip, {'commits': [], 'complete': False})
+            entry['used'] = time.time()
+            commits = entry['commits']
+            missing = offset + count - len(commits)
+            if missing > 0 and not entry['complete']:
+                loaded = self._log(tip, len(commits), missing)
+                if len(loaded) < missing and self.is_shallow():
+                    # Уперлись в границу мелкого клона - углубляем историю на недостающее
+                    self.deepen(max(missing - len(loaded), PAGE_SIZE))
+                    loaded += self._log(tip, len(commits) + len(loaded), missing - len(loaded))
+                commits.extend(loaded)
+                if len(loaded) < missing and not self.is_shallow():
+                    entry['complete'] = True
+                self._save_cache()
+            return commits[offset:offset + count], not entry['complete'] or offset + count < len(commits)
+
+    def search(self, ref, query):
+        query = query.strip()
+        if not query:
+            return []
+        results = []
+        if SHA_RE.match(query):
+            try:
+                sha = self.resolve(query)
+                results.extend(parse_log(self.repo.git.log(sha, f'--format={LOG_FORMAT}', '-n1')))
+            except git.exc.GitCommandError:
+                pass
+        output = self.repo.git.log(self.resolve(ref), f'--format={LOG_FORMAT}', f'-n{SEARCH_LIMIT}',
+                                   '-i', '--fixed-strings', f'--grep={query}')
+        seen = {commit['sha'] for commit in results}
+        results.extend(commit for commit in parse_log(output) if commit['sha'] not in seen)
+        return results
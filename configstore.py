@@ -0,0 +1,235 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CONFIG_DIR = '.config'
+CONFIG_DB = 'projects.db'
+LEGACY_CONFIG_FILE = 'config.json'
+
+# Ключи конфигурации проекта
+RUN_FILE = 'run_file'
+ARGS = 'args'  # список аргументов после файла запуска
+ENV = 'env'  # дополнительные переменные окружения процесса
+PYTHON = 'python'  # путь или версия интерпретатора для venv
+VENV_BACKEND = 'venv_backend'
+AUTO_UPDATE = 'auto_update'  # False - проект не обновляется по расписанию
+UPDATE_INTERVAL = 'update_interval'  # свой интервал плановых обновлений, секунды
+WATCH = 'watch'  # перезапускать процесс при изменении файлов проекта и после обновления
+WATCH_EXCLUDE = 'watch_exclude'  # доп. шаблоны имен, которые не считаются изменением проекта
+WORKTREE = 'worktree'  # {"ref", "sha"} закрепленной версии, запуск идет из ее рабочего дерева
+RESTART = 'restart'  # перезапускать процесс после падения
+MAX_RSS_MB = 'max_rss_mb'  # лимит памяти процесса
+MAX_CPU_PERCENT = 'max_cpu_percent'  # лимит загрузки CPU процессом
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_positive_number(value):
+    return _is_number(value) and value > 0
+
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+# Ключ -> (проверка значения, что ожидается). Значение записывается только после проверки:
+# строковый интервал или env-список иначе ломали бы планировщик и запуск уже после сохранения
+FIELDS = {
+    RUN_FILE: (lambda value: isinstance(value, str) and bool(value), "непустой путь"),
+    ARGS: (lambda value: isinstance(value, list) and all(isinstance(item, str) or _is_number(item)
+                                                         for item in value), "список строк"),
+    ENV: (lambda value: isinstance(value, dict) and all(isinstance(key, str) and isinstance(item, str)
+                                                        for key, item in value.items()),
+          "объект со строковыми значениями"),
+    PYTHON: (lambda value: isinstance(value, str) and bool(value), "непустая строка"),
+    VENV_BACKEND: (lambda value: isinstance(value, str) and bool(value), "непустая строка"),
+    AUTO_UPDATE: (lambda value: isinstance(value, bool), "true или false"),
+    UPDATE_INTERVAL: (_is_positive_number, "положительное число секунд"),
+    WATCH: (lambda value: isinstance(value, bool), "true или false"),
+    WATCH_EXCLUDE: (_is_string_list, "список шаблонов"),
+    WORKTREE: (lambda value: isinstance(value, dict) and isinstance(value.get('ref'), str)
+               and isinstance(value.get('sha'), str), 'объект {"ref", "sha"}'),
+    RESTART: (lambda value: isinstance(value, bool), "true или false"),
+    MAX_RSS_MB: (_is_positive_number, "положительное число"),
+    MAX_CPU_PERCENT: (_is_positive_number, "положительное число"),
+}
+
+
+def validate_field(key, value):
+    if key not in FIELDS:
+        raise ValueError(f"Неизвестный ключ конфигурации: {key}")
+    check, expected = FIELDS[key]
+    if not check(value):
+        raise ValueError(f"Некорректное значение {key}: ожидается {expected}")
+
+
+def clean_config(name, config):
+    # Для данных, записанных до появления проверок: неверные ключи отбрасываются, а не ломают запуск
+    result = {}
+    for key, value in config.items():
+        if value is None:
+            continue
+        try:
+            validate_field(key, value)
+        except ValueError as e:
+            print(f"Config value dropped for {name}: {e}")
+            continue
+        result[key] = value
+    return result
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS legacy_checked (
+    name TEXT PRIMARY KEY
+);
+"""
+
+
+class ConfigStore:
+    # Конфигурация запуска всех проектов в одной SQLite-базе (WAL) вместо config.json
+    # в каждом проекте. Чтения идут из кэша в памяти, изменения пачками в одной
+    # транзакции, подписчики получают имена измененных проектов.
+    # Старые config.json импортируются при открытии для проектов, которых еще нет в базе;
+    # каждая папка проверяется один раз, дальше ее имя помнит таблица legacy_checked.
+    def __init__(self, projects_dir):
+        self.projects_dir = projects_dir
+        self.path = os.path.join(projects_dir, CONFIG_DIR, CONFIG_DB)
+        self.version = 0
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._legacy_checked = set()
+        self._listeners = []
+        self._connection = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        with self._lock:
+            for name, config in self._connection.execute('SELECT name, config FROM projects'):
+                self._cache[name] = clean_config(name, json.loads(config))
+            self._legacy_checked = {name for name, in self._connection.execute('SELECT name FROM legacy_checked')}
+        self.import_legacy()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def subscribe(self, listener):
+        # listener(names) вызывается после каждой записанной транзакции
+        self._listeners.append(listener)
+
+    def get(self, name):
+        with self._lock:
+            return dict(self._cache.get(name, {}))
+
+    def all(self):
+        with self._lock:
+            return {name: dict(config) for name, config in self._cache.items()}
+
+    def update(self, name, **fields):
+        self.update_many({name: fields})
+
+    def update_many(self, changes):
+        # changes: {проект: {ключ: значение}}; None удаляет ключ. Все - одной транзакцией.
+        # Неизвестный ключ или значение не того типа - ValueError, и не записывается ничего
+        for fields in changes.values():
+            for key, value in fields.items():
+                if value is not None:
+                    validate_field(key, value)
+        with self._lock:
+            merged = {}
+            for name, fields in changes.items():
+                config = dict(self._cache.get(name, {}))
+                for key, value in fields.items():
+                    if value is None:
+                        config.pop(key, None)
+                    else:
+                        config[key] = value
+                merged[name] = config
+            self._write(merged, [])
+        self._notify(list(merged))
+
+    def reset(self, key, names=None):
+        # Сброс одного ключа у многих проектов (например, всех файлов запуска) одной транзакцией
+        with self._lock:
+            names = [name for name in (names if names is not None else list(self._cache))
+                     if key in self._cache.get(name, {})]
+        if names:
+            self.update_many({name: {key: None} for name in names})
+        return names
+
+    def delete(self, name):
+        with self._lock:
+            if name not in self._cache:
+                return
+            self._write({}, [name])
+        self._notify([name])
+
+    def _write(self, configs, deleted, checked=()):
+        now = time.time()
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO projects (name, config, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET config = excluded.config, updated = excluded.updated',
+                [(name, json.dumps(config, ensure_ascii=False), now) for name, config in configs.items()])
+            connection.executemany('DELETE FROM projects WHERE name = ?', [(name,) for name in deleted])
+            connection.executemany('INSERT OR IGNORE INTO legacy_checked (name) VALUES (?)',
+                                   [(name,) for name in checked])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        # Кэш меняем только после успешного коммита
+        self._cache.update(configs)
+        for name in deleted:
+            self._cache.pop(name, None)
+        self._legacy_checked.update(checked)
+        self.version += 1
+
+    def _notify(self, names):
+        for listener in list(self._listeners):
+            try:
+                listener(names)
+            except Exception as e:
+                print(f"Config listener error: {e}")
+
+    def import_legacy(self):
+        try:
+            listing = os.listdir(self.projects_dir)
+        except OSError:
+            return []
+        imported = {}
+        with self._lock:
+            checked = [name for name in listing if not name.startswith('.') and name not in self._cache
+                       and name not in self._legacy_checked]
+            for name in checked:
+                config_path = os.path.join(self.projects_dir, name, LEGACY_CONFIG_FILE)
+                try:
+                    with open(config_path, 'r', encoding='utf-8') as f:
+                        config = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if isinstance(config, dict):
+                    imported[name] = clean_config(name, config)
+            if checked:
+                self._write(imported, [], checked)
+        if imported:
+            print(f"Imported {len(imported)} legacy config.json files into {self.path}")
+            self._notify(list(imported))
+        return list(imported)
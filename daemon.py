@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import os
+import re
+import secrets
+import signal
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from service import ManagerService, ServiceError, load_settings
+from triggers import PUSH_HOOK_PATH, PING_EVENT, PUSH_EVENTS, verify_signature, event_type, parse_push, send_push
+
+DEFAULT_API_HOST = '127.0.0.1'
+DEFAULT_API_PORT = 8765
+MAX_BODY_SIZE = 1024 * 1024
+API_TOKEN_FILE = 'api_token'  # рядом с settings.json, доступен только владельцу
+TOKEN_HEADER = 'authorization'  # Authorization: Bearer <токен>
+JSON_CONTENT_TYPE = 'application/json'
+
+STATUS_TEXT = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+               404: 'Not Found', 405: 'Method Not Allowed', 415: 'Unsupported Media Type',
+               500: 'Internal Server Error'}
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def load_api_token(path=API_TOKEN_FILE):
+    # Случайный токен создается при первом запуске, файл получает права 0600
+    try:
+        with open(path, 'r') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    os.chmod(path, 0o600)  # у уже существовавшего пустого файла права могли быть шире
+    return token
+
+
+class ControlServer:
+    # Локальный HTTP API поверх ManagerService (TCP на localhost или Unix-сокет).
+    # Каждый запрос, кроме вебхука (он проверяется подписью), должен нести заголовок
+    # Authorization: Bearer <токен из API_TOKEN_FILE>. Запросы с Origin (из браузера)
+    # отклоняются, POST принимается только с Content-Type: application/json - так
+    # открытая в браузере страница не может отправить API даже "простой" запрос.
+    #   GET  /projects                    список проектов
+    #   POST /projects {"url": ..., "mode": ..., "depth": N}  клонирование
+    #   POST /projects/<имя>/update       обновление вне очереди
+    #   POST /projects/<имя>/run {"ref": ...}  запуск; с ref - версия рядом с основной
+    #   POST /projects/<имя>/switch {"ref": ...}  переключение версии (ref null - основное дерево)
+    #   GET  /projects/<имя>/versions     развернутые рабочие деревья версий
+    #   POST /projects/<имя>/stop         остановка дерева процессов
+    #   POST /projects/<имя>/restart      перезапуск на месте
+    #   GET  /projects/<имя>/logs?lines=N&run=<id>
+    #   GET  /projects/<имя>/config, POST /projects/<имя>/config {ключ: значение, null удаляет}
+    #   POST /bulk {"action": ..., "projects": [...], "ref": ...}  массовая операция
+    #   GET  /bulk/<id>, POST /bulk/<id>/cancel
+    #   GET  /operations, GET /metrics
+    #   GET  /metrics/prometheus          текстовый формат Prometheus
+    #   GET  /traces?limit=N&name=<операция>&project=<имя>
+    #   GET  /storage                     место на диске по проектам и общим каталогам
+    #   POST /storage/gc {"target_free_mb": N, "time_budget": секунды}  сборка мусора
+    #   POST /hooks/push                  push-вебхук GitHub/Gitea/GitLab (секрет - webhook_secret)
+    def __init__(self, service, host=DEFAULT_API_HOST, port=DEFAULT_API_PORT, socket_path=None, token=None):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.token = token or load_api_token(service.settings.get('api_token_file', API_TOKEN_FILE))
+        self.server = None
+        self.routes = [
+            ('GET', re.compile(r'^/projects$'), self.list_projects),
+            ('POST', re.compile(r'^/projects$'), self.clone),
+            ('POST', re.compile(r'^/projects/([^/]+)/update$'), self.update),
+            ('POST', re.compile(r'^/projects/([^/]+)/run$'), self.run),
+            ('POST', re.compile(r'^/projects/([^/]+)/stop$'), self.stop),
+            ('POST', re.compile(r'^/projects/([^/]+)/restart$'), self.restart),
+            ('POST', re.compile(r'^/projects/([^/]+)/switch$'), self.switch),
+            ('GET', re.compile(r'^/projects/([^/]+)/versions$'), self.versions),
+            ('GET', re.compile(r'^/projects/([^/]+)/logs$'), self.logs),
+            ('GET', re.compile(r'^/projects/([^/]+)/config$'), self.get_config),
+            ('POST', re.compile(r'^/projects/([^/]+)/config$'), self.set_config),
+            ('POST', re.compile(r'^/bulk$'), self.bulk),
+            ('GET', re.compile(r'^/bulk/(\d+)$'), self.bulk_status),
+            ('POST', re.compile(r'^/bulk/(\d+)/cancel$'), self.cancel_bulk),
+            ('GET', re.compile(r'^/operations$'), self.operations),
+            ('GET', re.compile(r'^/metrics$'), self.metrics),
+            ('GET', re.compile(r'^/metrics/prometheus$'), self.prometheus),
+            ('GET', re.compile(r'^/traces$'), self.traces),
+            ('GET', re.compile(r'^/storage$'), self.storage),
+            ('POST', re.compile(r'^/storage/gc$'), self.gc),
+            ('POST', re.compile(rf'^{PUSH_HOOK_PATH}$'), self.push_hook),
+        ]
+        # Обработчикам вебхуков нужны заголовки и сырое тело для проверки подписи
+        self.raw_handlers = {self.push_hook}
+        # Хостинг токена не знает, вебхук проверяет подпись сам
+        self.public_handlers = {self.push_hook}
+
+    async def start(self):
+        if self.socket_path:
+            self.server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        else:
+            # Снаружи хук без подписи принимал бы чужие push, а он делит порт с остальным API
+            if not is_loopback(self.host) and not self.service.settings.get('webhook_secret'):
+                raise ServiceError(f"API на {self.host} доступно из сети: сначала задайте webhook_secret")
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]  # порт 0 - любой свободный
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+            if not request_line:
+                return
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                key, _, value = line.partition(':')
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_SIZE:
+                raise ServiceError("Слишком большое тело запроса")
+            body = await reader.readexactly(length) if length else b''
+            status, payload = await self.dispatch(method, target, body, headers)
+        except ServiceError as e:
+            status, payload = 400, {'error': str(e)}
+        except (ValueError, json.JSONDecodeError) as e:
+            status, payload = 400, {'error': f"Некорректный запрос: {e}"}
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+        if isinstance(payload, str):
+            data = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                     f"Content-Type: {content_type}\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def authorized(self, headers):
+        return hmac.compare_digest(headers.get(TOKEN_HEADER, ''), f'Bearer {self.token}')
+
+    async def dispatch(self, method, target, body, headers=None):
+        headers = headers or {}
+        if 'origin' in headers:
+            return 403, {'error': 'Cross-origin requests are not allowed'}
+        if method == 'POST' and headers.get('content-type', '').split(';')[0].strip().lower() != JSON_CONTENT_TYPE:
+            return 415, {'error': f'Content-Type must be {JSON_CONTENT_TYPE}'}
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            if handler not in self.public_handlers and not self.authorized(headers):
+                return 401, {'error': 'Unauthorized'}
+            args = [unquote(group) for group in match.groups()]
+            data = json.loads(body) if body else {}
+            kwargs = {'query': query, 'data': data}
+            if handler in self.raw_handlers:
+                kwargs.update(headers=headers, body=body)
+            # Обращения к диску и psutil не должны блокировать цикл сервиса
+            return await asyncio.to_thread(handler, *args, **kwargs)
+        if allowed:
+            return 405, {'error': 'Method not allowed'}
+        return 404, {'error': 'Not found'}
+
+    def list_projects(self, query, data):
+        return 200, self.service.list_projects()
+
+    def clone(self, query, data):
+        url = data.get('url')
+        if not url:
+            raise ServiceError("Не указан url")
+        return 202, {'operation': self.service.clone(url, mode=data.get('mode'), depth=data.get('depth'))}
+
+    def update(self, name, query, data):
+        self.service.update(name)
+        return 202, {'project': name}
+
+    def run(self, name, query, data):
+        supervised = self.service.run(name, data.get('ref'))
+        return 200, {'project': supervised.name, 'pid': supervised.process.pid}
+
+    def stop(self, name, query, data):
+        return 200, {'project': name, 'stopped': self.service.stop(name)}
+
+    def restart(self, name, query, data):
+        supervised = self.service.restart(name, data.get('reason', ''))
+        return 200, {'project': name, 'pid': supervised.process.pid}
+
+    def switch(self, name, query, data):
+        self.service.switch(name, data.get('ref'))
+        return 200, {'project': name, 'version': data.get('ref')}
+
+    def versions(self, name, query, data):
+        return 200, self.service.versions(name)
+
+    def get_config(self, name, query, data):
+        return 200, self.service.run_config(name)
+
+    def set_config(self, name, query, data):
+        if not isinstance(data, dict):
+            raise ServiceError("Ожидается объект с настройками")
+        self.service.update_config(name, **data)
+        return 200, self.service.run_config(name)
+
+    def logs(self, name, query, data):
+        lines = int(query.get('lines', 100))
+        return 200, self.service.tail_logs(name, lines, query.get('run'))
+
+    def bulk(self, query, data):
+        projects = data.get('projects')
+        if not isinstance(projects, list) or not projects:
+            raise ServiceError("Не указан список проектов")
+        return 202, {'operation': self.service.bulk(data.get('action'), projects, data.get('ref'))}
+
+    def bulk_status(self, operation_id, query, data):
+        return 200, self.service.bulk_status(int(operation_id))
+
+    def cancel_bulk(self, operation_id, query, data):
+        self.service.cancel_bulk(int(operation_id))
+        return 200, {'operation': int(operation_id), 'cancelled': True}
+
+    def operations(self, query, data):
+        return 200, self.service.operations()
+
+    def metrics(self, query, data):
+        return 200, self.service.metrics()
+
+    def prometheus(self, query, data):
+        return 200, self.service.prometheus_metrics()
+
+    def traces(self, query, data):
+        return 200, self.service.traces(int(query.get('limit', 100)), query.get('name'), query.get('project'))
+
+    def storage(self, query, data):
+        return 200, self.service.storage_usage()
+
+    def gc(self, query, data):
+        return 202, {'operation': self.service.gc(data.get('target_free_mb'), data.get('time_budget'))}
+
+    def push_hook(self, query, data, headers, body):
+        if not verify_signature(self.service.settings.get('webhook_secret'), body, headers):
+            return 401, {'error': 'Bad signature'}
+        event = event_type(headers)
+        if event == PING_EVENT:
+            return 200, {'pong': True}
+        if event not in PUSH_EVENTS:
+            return 202, {'ignored': event}
+        urls, repo_name, ref = parse_push(data)
+        return 202, {'projects': self.service.push(urls, repo_name, ref)}
+
+
+def start_control_server(service, host=DEFAULT_API_HOST, port=DEFAULT_API_PORT, socket_path=None):
+    server = ControlServer(service, host, port, socket_path)
+    service.call_soon(server.start()).result()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GitHub Manager без графического интерфейса")
+    parser.add_argument('--projects-dir', help="папка проектов (по умолчанию из settings.json)")
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--socket', help="Unix-сокет вместо TCP")
+    parser.add_argument('--send-push', metavar='REMOTE_URL',
+                        help="отправить запущенному менеджеру тестовое push-событие для репозитория и выйти")
+    parser.add_argument('--ref', help="ветка тестового push-события, например refs/heads/main")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    if args.send_push:
+        host = args.host or settings.get('api_host', DEFAULT_API_HOST)
+        port = args.port or settings.get('api_port', DEFAULT_API_PORT)
+        print(send_push(f"http://{host}:{port}", args.send_push, args.ref, settings.get('webhook_secret')))
+        return
+    if args.projects_dir:
+        settings['projects_dir'] = args.projects_dir
+    service = ManagerService(settings)
+    service.start()
+    service.start_background()
+    start_control_server(service,
+                         args.host or settings.get('api_host', DEFAULT_API_HOST),
+                         args.port or settings.get('api_port', DEFAULT_API_PORT),
+                         args.socket or settings.get('api_socket'))
+    print(f"Manager service started for {service.projects_dir}")
+    print(f"API token: {os.path.abspath(settings.get('api_token_file', API_TOKEN_FILE))}")
+
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+    while not stop_event.wait(1):
+        pass
+    service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
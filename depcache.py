@@ -0,0 +1,350 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+
+from tracing import span
+
+WHEELHOUSE_DIR = '.wheelhouse'
+MANIFESTS_DIR = 'manifests'
+STAMP_FILE = '.requirements.sha256'
+LOCK_FILE = '.requirements.lock'  # что из requirements.txt уже стоит в venv
+PROTECTED_PACKAGES = {'pip', 'setuptools', 'wheel'}
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+PIN_RE = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)(\[[^\]]*\])?\s*==\s*([^\s;#]+)\s*$')
+REQUIREMENT_RE = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*([<>=!~][^;]*)?(;.*)?$')
+
+# Граф зависимостей venv: запускается интерпретатором окружения, чтобы маркеры
+# (версия Python, платформа, extra) вычислялись для него, а не для менеджера.
+# {пакет: {extra: [[зависимость, [ее extras]]]}}, под ключом "" - зависимости без extra
+GRAPH_SCRIPT = """
+import importlib.metadata, json, re
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    from pip._vendor.packaging.requirements import Requirement
+
+def normalize_extra(extra):
+    return re.sub(r'[-_.]+', '-', extra).lower()
+
+graph = {}
+for dist in importlib.metadata.distributions():
+    name = dist.metadata['Name']
+    if not name:
+        continue
+    requirements = []
+    for line in dist.requires or []:
+        try:
+            requirements.append(Requirement(line))
+        except Exception:
+            continue
+    extras = {normalize_extra(extra) for extra in dist.metadata.get_all('Provides-Extra') or []}
+    for requirement in requirements:
+        if requirement.marker is not None:
+            extras.update(normalize_extra(extra) for extra in
+                          re.findall(r'extra\\s*==\\s*[\\'"]([^\\'"]+)', str(requirement.marker)))
+    node = graph.setdefault(name, {})
+    for extra in [''] + sorted(extras):
+        node[extra] = [[requirement.name, sorted(normalize_extra(item) for item in requirement.extras)]
+                       for requirement in requirements
+                       if requirement.marker is None or requirement.marker.evaluate({'extra': extra})]
+print(json.dumps(graph))
+"""
+
+
+def read_requirements(requirements_path):
+    # requirements.txt бывает в UTF-16 (pip freeze в PowerShell), pip это понимает - и мы тоже
+    with open(requirements_path, 'rb') as f:
+        data = f.read()
+    if data.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return data.decode('utf-16')
+    return data.decode('utf-8-sig')
+
+
+def requirements_hash(requirements_path):
+    # Хэш по значимым строкам, чтобы пробелы, комментарии и концы строк не сбрасывали кэш
+    lines = []
+    for line in read_requirements(requirements_path).splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            lines.append(line)
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def normalize_name(name):
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def parse_requirements(requirements_path):
+    # {имя: строка требования}. None, если в файле есть то, что построчно не сравнить:
+    # опции pip, вложенные -r, editable, ссылки и дубли
+    entries = {}
+    for line in read_requirements(requirements_path).splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        match = REQUIREMENT_RE.match(line)
+        if not match:
+            return None
+        name = normalize_name(match.group(1))
+        if name in entries:
+            return None
+        entries[name] = re.sub(r'\s+', '', line)
+    return entries
+
+
+def venv_python(pip_executable):
+    scripts_dir = os.path.dirname(pip_executable)
+    for file_name in ('python.exe', 'python'):
+        python_path = os.path.join(scripts_dir, file_name)
+        if os.path.exists(python_path):
+            return python_path
+    raise Exception(f"Python executable not found next to {pip_executable}")
+
+
+def normalize_extra(extra):
+    return re.sub(r'[-_.]+', '-', extra).lower()
+
+
+def requested_extras(line):
+    # ["socks"] для "requests[socks]>=2"
+    match = REQUIREMENT_RE.match(line)
+    if not match or not match.group(2):
+        return []
+    return [normalize_extra(extra.strip()) for extra in match.group(2)[1:-1].split(',') if extra.strip()]
+
+
+def constraint_line(line):
+    # Строка требования без extras - в таком виде pip принимает ее как ограничение (-c)
+    match = REQUIREMENT_RE.match(line)
+    if not match or not match.group(3):
+        return None
+    return match.group(1) + match.group(3) + (match.group(4) or '')
+
+
+def dependency_closure(roots, graph):
+    # roots: [(имя, extras)]. Через extra пакета достижимы только его зависимости под этим extra
+    seen = set()
+    stack = [(name, '') for name, _ in roots] + [(name, extra) for name, extras in roots for extra in extras]
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        name, extra = node
+        for dependency, extras in graph.get(name, {}).get(extra, ()):
+            stack.append((dependency, ''))
+            stack.extend((dependency, item) for item in extras)
+    return {name for name, _ in seen}
+
+
+def _lock_for(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+class DependencyCache:
+    # Общий wheelhouse для всех проектов в projects_dir. Для каждого набора
+    # зависимостей (по хэшу requirements.txt) хранится манифест: если он есть,
+    # все колеса уже лежат локально и установка идет без сети.
+    # Рядом со штампом в venv лежит снимок установленных требований: при следующем
+    # изменении requirements.txt ставятся только измененные строки одним вызовом pip,
+    # а удаленные пакеты (с их больше никому не нужными зависимостями) удаляются.
+    def __init__(self, projects_dir):
+        self.wheelhouse = os.path.join(projects_dir, WHEELHOUSE_DIR)
+        self.manifests_dir = os.path.join(self.wheelhouse, MANIFESTS_DIR)
+
+    def installed_hash(self, venv_path):
+        try:
+            with open(os.path.join(venv_path, STAMP_FILE), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def read_lock(self, venv_path):
+        try:
+            with open(os.path.join(venv_path, LOCK_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_lock(self, venv_path, entries):
+        lock_path = os.path.join(venv_path, LOCK_FILE)
+        if entries is None:
+            # Снимок неприменим - следующая установка снова будет полной
+            if os.path.exists(lock_path):
+                os.remove(lock_path)
+            return
+        tmp_path = lock_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'requirements': entries}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, lock_path)
+
+    def install(self, pip_executable, venv_path, requirements_path):
+        # Возвращает False, если окружение уже соответствует requirements.txt
+        req_hash = requirements_hash(requirements_path)
+        if self.installed_hash(venv_path) == req_hash:
+            return False
+
+        project_name = os.path.basename(os.path.dirname(os.path.abspath(venv_path)))
+        entries = parse_requirements(requirements_path)
+        lock = self.read_lock(venv_path)
+
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        if entries is not None and lock is not None:
+            with span('pip_sync', project_name):
+                self.sync(pip_executable, lock.get('requirements', {}), entries)
+        else:
+            self._install_all(pip_executable, requirements_path, req_hash, project_name)
+
+        with open(os.path.join(venv_path, STAMP_FILE), 'w') as f:
+            f.write(req_hash)
+        self.write_lock(venv_path, entries)
+        return True
+
+    def _install_all(self, pip_executable, requirements_path, req_hash, project_name):
+        requirement_args = ['-r', requirements_path]
+        with _lock_for((self.wheelhouse, req_hash)):
+            installed = False
+            if self.is_cached(req_hash, requirements_path):
+                with span('pip_install', project_name, cached=True):
+                    installed = self._install_offline(pip_executable, requirement_args)
+            if not installed:
+                with span('pip_wheel', project_name):
+                    self._build_wheels(pip_executable, requirement_args)
+                with span('pip_install', project_name, cached=False):
+                    if not self._install_offline(pip_executable, requirement_args):
+                        raise Exception(f"Error installing dependencies from {self.wheelhouse}")
+            with open(os.path.join(self.manifests_dir, req_hash), 'w') as f:
+                f.write(requirements_path)
+
+    def sync(self, pip_executable, installed, entries):
+        # installed и entries: {имя: строка требования} до и после изменения
+        changed = [line for name, line in sorted(entries.items()) if installed.get(name) != line]
+        removed = {name: line for name, line in installed.items() if name not in entries}
+        if changed:
+            # Одним вызовом pip и только измененные строки - без пересборки всего набора.
+            # Оставшиеся требования идут ограничениями: новая строка не сдвинет их версии
+            kept = [constraint_line(line) for name, line in sorted(entries.items()) if installed.get(name) == line]
+            with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+                f.write('\n'.join(line for line in kept if line))
+            requirement_args = ['-c', f.name, *changed]
+            try:
+                if not self._install_offline(pip_executable, requirement_args):
+                    self._build_wheels(pip_executable, requirement_args)
+                    if not self._install_offline(pip_executable, requirement_args):
+                        raise Exception(f"Error installing {', '.join(changed)} from {self.wheelhouse}")
+            finally:
+                os.remove(f.name)
+        if removed:
+            packages = self._removable(pip_executable, removed, entries)
+            if packages:
+                result = subprocess.run([pip_executable, 'uninstall', '-y', *packages],
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                if result.returncode != 0:
+                    raise Exception(f"Error uninstalling {', '.join(packages)}: {result.stderr}")
+        return changed, list(removed)
+
+    def _removable(self, pip_executable, removed, entries):
+        # Удаляемые пакеты и их зависимости, до которых не дотянуться из оставшихся требований.
+        # removed и entries: {имя: строка требования}, extras из строк учитываются с обеих сторон
+        graph = self._dependency_graph(pip_executable)
+        keep = dependency_closure([(name, requested_extras(line)) for name, line in entries.items()], graph)
+        candidates = dependency_closure([(name, requested_extras(line)) for name, line in removed.items()], graph)
+        return sorted(name for name in candidates - keep - PROTECTED_PACKAGES if name in graph)
+
+    def _dependency_graph(self, pip_executable):
+        result = subprocess.run([venv_python(pip_executable), '-c', GRAPH_SCRIPT],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Error reading installed packages: {result.stderr}")
+        graph = {}
+        for name, extras in json.loads(result.stdout).items():
+            node = graph.setdefault(normalize_name(name), {})
+            for extra, requires in extras.items():
+                node.setdefault(extra, []).extend((normalize_name(item), item_extras) for item, item_extras in requires)
+        return graph
+
+    def prune(self, venv_paths):
+        # Чистка wheelhouse: у каждого пакета остается самое свежее колесо плюс версии,
+        # закрепленные в снимках живых окружений. Манифесты наборов, которых больше нет
+        # ни в одном venv, удаляются - недостающее колесо при следующей установке соберется заново
+        pins = set()
+        hashes = set()
+        for venv_path in venv_paths:
+            req_hash = self.installed_hash(venv_path)
+            if req_hash:
+                hashes.add(req_hash)
+            for line in (self.read_lock(venv_path) or {}).get('requirements', {}).values():
+                match = PIN_RE.match(line)
+                if match:
+                    pins.add((normalize_name(match.group(1)), match.group(3)))
+
+        try:
+            file_names = os.listdir(self.wheelhouse)
+        except OSError:
+            return 0
+        wheels = {}
+        for file_name in file_names:
+            if file_name.endswith('.whl'):
+                name, version = file_name.split('-')[:2]
+                file_path = os.path.join(self.wheelhouse, file_name)
+                wheels.setdefault(normalize_name(name), []).append((os.path.getmtime(file_path), version, file_path))
+
+        freed = 0
+        for name, items in wheels.items():
+            items.sort(reverse=True)
+            for _, version, file_path in items[1:]:
+                if (name, version) in pins:
+                    continue
+                freed += os.path.getsize(file_path)
+                os.remove(file_path)
+        if os.path.isdir(self.manifests_dir):
+            for req_hash in os.listdir(self.manifests_dir):
+                if req_hash not in hashes:
+                    os.remove(os.path.join(self.manifests_dir, req_hash))
+        return freed
+
+    def is_cached(self, req_hash, requirements_path):
+        if os.path.exists(os.path.join(self.manifests_dir, req_hash)):
+            return True
+        return self._all_pins_cached(requirements_path)
+
+    def _all_pins_cached(self, requirements_path):
+        # Новый набор зависимостей тоже ставим без сети, если все пины уже есть в wheelhouse
+        wheels = set()
+        for file_name in os.listdir(self.wheelhouse):
+            if file_name.endswith('.whl'):
+                name, version = file_name.split('-')[:2]
+                wheels.add((normalize_name(name), version))
+
+        pins = []
+        for line in read_requirements(requirements_path).splitlines():
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            match = PIN_RE.match(line)
+            if not match:
+                return False  # диапазоны версий, ссылки и опции pip не проверить локально
+            pins.append((normalize_name(match.group(1)), match.group(3)))
+        return bool(pins) and all(pin in wheels for pin in pins)
+
+    def _build_wheels(self, pip_executable, requirement_args):
+        result = subprocess.run(
+            [pip_executable, 'wheel', *requirement_args, '-w', self.wheelhouse,
+             '--find-links', self.wheelhouse],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Error building wheels: {result.stderr}")
+
+    def _install_offline(self, pip_executable, requirement_args):
+        result = subprocess.run(
+            [pip_executable, 'install', '--no-index', '--find-links', self.wheelhouse, *requirement_args],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return result.returncode == 0
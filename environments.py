@@ -0,0 +1,110 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+VENV_NAMES = ('venv', '.venv')
+DEFAULT_VENV_NAME = 'venv'
+
+BACKEND_VENV = 'venv'
+BACKEND_VIRTUALENV = 'virtualenv'
+BACKEND_UV = 'uv'
+BACKENDS = (BACKEND_VENV, BACKEND_VIRTUALENV, BACKEND_UV)
+
+VERSION_RE = re.compile(r'^\d+(\.\d+)*$')
+
+_interpreters = {}
+_interpreters_lock = threading.Lock()
+
+
+def get_python_executable():
+    if hasattr(sys, 'frozen'):
+        with open(os.path.join(sys._MEIPASS, 'python_path.txt'), 'r') as f:
+            return f.read().strip()
+    else:
+        return sys.executable
+
+
+def venv_layout(venv_path):
+    # Интерпретатор и pip внутри venv: Scripts\python.exe на Windows, bin/python в остальных
+    # системах. Проверяем оба варианта - venv мог прийти с другой платформы или из uv
+    for scripts_dir, suffix in (('Scripts', '.exe'), ('bin', '')):
+        python_path = os.path.join(venv_path, scripts_dir, 'python' + suffix)
+        if os.path.exists(python_path):
+            pip_path = os.path.join(venv_path, scripts_dir, 'pip' + suffix)
+            return {'venv': venv_path, 'python': python_path,
+                    'pip': pip_path if os.path.exists(pip_path) else None}
+    return None
+
+
+def find_environment(project_path):
+    for venv_name in VENV_NAMES:
+        layout = venv_layout(os.path.join(project_path, venv_name))
+        if layout is not None:
+            return layout
+    return None
+
+
+def default_venv_path(project_path):
+    return os.path.join(project_path, DEFAULT_VENV_NAME)
+
+
+def resolve_interpreter(spec=None):
+    # spec - путь к интерпретатору, версия ("3.11") или None для интерпретатора по умолчанию.
+    # Результат поиска по версии кэшируется: py/which вызываются один раз на процесс
+    if not spec:
+        return get_python_executable()
+    if not VERSION_RE.match(str(spec)):
+        if not os.path.exists(spec):
+            raise Exception(f"Python executable not found: {spec}")
+        return spec
+    spec = str(spec)
+    with _interpreters_lock:
+        if spec in _interpreters:
+            return _interpreters[spec]
+    python_path = _find_interpreter_version(spec)
+    if python_path is None:
+        raise Exception(f"Python {spec} not found")
+    with _interpreters_lock:
+        _interpreters[spec] = python_path
+    return python_path
+
+
+def _find_interpreter_version(version):
+    if os.name == 'nt':
+        launcher = shutil.which('py')
+        if launcher is None:
+            return None
+        result = subprocess.run([launcher, f'-{version}', '-c', 'import sys; print(sys.executable)'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return shutil.which(f'python{version}')
+
+
+def create_command(python_executable, venv_path, backend=BACKEND_VENV):
+    # Команда создания окружения. pip нужен DependencyCache, поэтому uv просим его положить
+    if backend == BACKEND_VENV:
+        return [python_executable, '-m', 'venv', venv_path]
+    if backend == BACKEND_VIRTUALENV:
+        virtualenv = shutil.which('virtualenv')
+        if virtualenv is not None:
+            return [virtualenv, '--python', python_executable, venv_path]
+        return [python_executable, '-m', 'virtualenv', venv_path]
+    if backend == BACKEND_UV:
+        uv = shutil.which('uv')
+        if uv is None:
+            raise Exception("uv not found in PATH")
+        return [uv, 'venv', '--seed', '--python', python_executable, venv_path]
+    raise Exception(f"Unknown venv backend: {backend}")
+
+
+def launch_environment(layout, base_env=None):
+    # Переменные "активированного" venv для запуска интерпретатора напрямую, без shell
+    # и activate-скриптов: дочерние процессы проекта тоже найдут его pip и скрипты
+    env = dict(base_env if base_env is not None else os.environ)
+    env['VIRTUAL_ENV'] = layout['venv']
+    env['PATH'] = os.path.dirname(layout['python']) + os.pathsep + env.get('PATH', '')
+    env.pop('PYTHONHOME', None)
+    return env
@@ -0,0 +1,86 @@
+import queue
+
+EVENT_PROGRESS = 'progress'  # ход операции: title, value, message - любое поле может отсутствовать
+EVENT_FINISHED = 'finished'  # операция закончилась, error - текст ошибки или None
+EVENT_LOG = 'log'  # строки вывода для проекта
+EVENT_CALL = 'call'  # функция, которую нужно выполнить в главном потоке
+
+DEFAULT_FRAME_INTERVAL = 50  # мс между разборами очереди, около 20 кадров в секунду
+DEFAULT_MAX_EVENTS = 5000  # событий за кадр, остальные ждут следующего
+
+
+class EventBus:
+    # Единственный путь из фоновых потоков к виджетам. Воркеры (клонирование, обновления,
+    # горячие клавиши) только кладут события в очередь, а главный поток Tk раз в кадр
+    # разбирает ее и вызывает обработчики. За кадр от каждой операции остается только
+    # последнее состояние прогресса, а строки лога склеиваются в одну пачку: сотня
+    # одновременно закончившихся обновлений - одна перерисовка, а не сотня вызовов Tk.
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._handlers = {}
+
+    def subscribe(self, kind, handler):
+        # handler(key, data) вызывается из главного потока
+        self._handlers.setdefault(kind, []).append(handler)
+
+    # --- Вызываются из любого потока ---
+
+    def post(self, kind, key=None, **data):
+        self._queue.put((kind, key, data))
+
+    def progress(self, key, value=None, message=None, title=None):
+        self.post(EVENT_PROGRESS, key, value=value, message=message, title=title)
+
+    def finished(self, key, error=None):
+        self.post(EVENT_FINISHED, key, error=error)
+
+    def log(self, key, text):
+        self.post(EVENT_LOG, key, text=text)
+
+    def call(self, function, *args):
+        self.post(EVENT_CALL, function=function, args=args)
+
+    # --- Вызываются из главного потока ---
+
+    def drain(self, max_events=DEFAULT_MAX_EVENTS):
+        # [(вид, ключ, данные)] в порядке поступления, прогресс и лог одной операции схлопнуты
+        # в первое по времени событие, так что завершение операции всегда идет после ее прогресса
+        events = []
+        progress = {}
+        logs = {}
+        for _ in range(max_events):
+            try:
+                kind, key, data = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == EVENT_PROGRESS:
+                pending = progress.get(key)
+                if pending is None:
+                    pending = progress[key] = {}
+                    events.append((kind, key, pending))
+                pending.update((name, value) for name, value in data.items() if value is not None)
+            elif kind == EVENT_LOG:
+                pending = logs.get(key)
+                if pending is None:
+                    pending = logs[key] = {'lines': []}
+                    events.append((kind, key, pending))
+                pending['lines'].append(data['text'])
+            else:
+                if kind == EVENT_FINISHED:
+                    # Прогресс, пришедший после завершения, относится уже к новой операции
+                    progress.pop(key, None)
+                events.append((kind, key, data))
+        return events
+
+    def dispatch(self, max_events=DEFAULT_MAX_EVENTS):
+        events = self.drain(max_events)
+        for kind, key, data in events:
+            try:
+                if kind == EVENT_CALL:
+                    data['function'](*data['args'])
+                    continue
+                for handler in self._handlers.get(kind, ()):
+                    handler(key, data)
+            except Exception as e:
+                print(f"Event handler error for {kind} {key}: {e}")
+        return len(events)
@@ -0,0 +1,265 @@
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+LOGS_DIR = '.logs'
+SEGMENT_BYTES = 8 * 1024 * 1024  # после этого размера сегмент сжимается и начинается новый
+CHECKPOINT_LINES = 1000  # шаг разреженного индекса смещений
+DEFAULT_MAX_RUNS = 20  # сколько последних запусков хранить на проект
+FLUSH_PERIOD = 1.0  # как часто сбрасывать буфер, чтобы хвост был виден читателям
+SEGMENTS_INDEX = 'segments.idx'
+
+STREAM_CODES = {'stdout': 'O', 'stderr': 'E'}
+STREAM_NAMES = {code: name for name, code in STREAM_CODES.items()}
+
+
+def format_line(ts, stream, text):
+    return f"{ts:.3f} {STREAM_CODES.get(stream, 'O')} {text.rstrip(chr(10))}\n"
+
+
+def parse_line(raw):
+    # -> (timestamp, stream, text)
+    parts = raw.rstrip('\n').split(' ', 2)
+    try:
+        return float(parts[0]), STREAM_NAMES.get(parts[1], 'stdout'), parts[2]
+    except (ValueError, IndexError):
+        return 0.0, 'stdout', raw.rstrip('\n')  # недописанная строка активного сегмента
+
+
+def segment_name(number):
+    return f"{number:05d}.log"
+
+
+class LogStore:
+    # Логи запусков: <projects_dir>/.logs/<проект>/<run_id>/NNNNN.log[.gz] + индексы
+    def __init__(self, projects_dir, max_runs=DEFAULT_MAX_RUNS):
+        self.root = os.path.join(projects_dir, LOGS_DIR)
+        self.max_runs = max_runs
+
+    def project_dir(self, project_name):
+        return os.path.join(self.root, project_name)
+
+    def runs(self, project_name):
+        # Запуски от новых к старым
+        project_dir = self.project_dir(project_name)
+        if not os.path.isdir(project_dir):
+            return []
+        return sorted(os.listdir(project_dir), reverse=True)
+
+    def open_run(self, project_name):
+        run_id = time.strftime('%Y%m%d-%H%M%S') + f"-{time.time_ns() % 1000000:06d}"
+        run_dir = os.path.join(self.project_dir(project_name), run_id)
+        os.makedirs(run_dir)
+        self._prune(project_name)
+        return LogWriter(run_dir)
+
+    def reader(self, project_name, run_id):
+        return LogReader(os.path.join(self.project_dir(project_name), run_id))
+
+    def _prune(self, project_name):
+        for run_id in self.runs(project_name)[self.max_runs:]:
+            shutil.rmtree(os.path.join(self.project_dir(project_name), run_id), ignore_errors=True)
+
+
+class LogWriter:
+    def __init__(self, run_dir, flush_period=FLUSH_PERIOD):
+        self.run_dir = run_dir
+        self.flush_period = flush_period
+        self._lock = threading.Lock()
+        self._segment = 0
+        self._first_line = 0
+        self._lines = 0
+        self._start_ts = None
+        self._dirty = False
+        self._file = None
+        self._index = None
+        self._compressors = []
+        self._closed = threading.Event()
+        self._open_segment()
+        # Буфер сбрасывается по таймеру: замолчавший процесс не должен прятать свои последние строки
+        self._flusher = threading.Thread(target=self._flush_loop, name="log-flush", daemon=True)
+        self._flusher.start()
+
+    def _open_segment(self):
+        base = os.path.join(self.run_dir, segment_name(self._segment))
+        self._file = open(base, 'ab')
+        self._index = open(base[:-len('.log')] + '.idx', 'a', encoding='utf-8')
+        self._lines = 0
+        self._start_ts = None
+
+    def write(self, stream, text):
+        ts = time.time()
+        data = format_line(ts, stream, text).encode('utf-8', errors='replace')
+        with self._lock:
+            if self._file is None:
+                return
+            if self._lines % CHECKPOINT_LINES == 0:
+                # Смещение строки внутри несжатого сегмента и ее время
+                self._index.write(f"{self._first_line + self._lines}\t{self._file.tell()}\t{ts:.3f}\n")
+                self._index.flush()
+            if self._start_ts is None:
+                self._start_ts = ts
+            self._file.write(data)
+            self._lines += 1
+            self._dirty = True
+            if self._file.tell() >= SEGMENT_BYTES:
+                self._rotate(ts)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None and self._dirty:
+                self._file.flush()
+                self._dirty = False
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_period):
+            self.flush()
+
+    def _rotate(self, ts):
+        self._finish_segment(ts)
+        path = self._file.name
+        self._file.close()
+        self._index.close()
+        compressor = threading.Thread(target=self._compress, args=(path,), daemon=True)
+        compressor.start()
+        self._compressors.append(compressor)
+        self._first_line += self._lines
+        self._segment += 1
+        self._dirty = False
+        self._open_segment()
+
+    def _finish_segment(self, ts):
+        with open(os.path.join(self.run_dir, SEGMENTS_INDEX), 'a', encoding='utf-8') as f:
+            f.write(f"{self._segment}\t{self._first_line}\t{self._lines}\t{self._start_ts or ts:.3f}\t{ts:.3f}\n")
+
+    def _compress(self, path):
+        # Сначала пишем .gz рядом, потом удаляем исходник - читатель всегда видит один из них
+        with open(path, 'rb') as source, gzip.open(path + '.gz.tmp', 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target)
+        os.replace(path + '.gz.tmp', path + '.gz')
+        for _ in range(50):
+            try:
+                os.remove(path)
+                return
+            except PermissionError:
+                time.sleep(0.1)  # на Windows сегмент может быть открыт читателем
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            if self._file is None:
+                return
+            if self._lines:
+                self._finish_segment(time.time())
+            self._file.close()
+            self._index.close()
+            self._file = None
+        for compressor in self._compressors:
+            compressor.join()
+
+
+class LogReader:
+    # Постраничное чтение, хвост и поиск без загрузки лога в память
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+
+    def segments(self):
+        # -> список (номер, первая строка, число строк); последний сегмент может быть активным
+        segments = []
+        index_path = os.path.join(self.run_dir, SEGMENTS_INDEX)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    number, first_line, lines = line.split('\t')[:3]
+                    segments.append((int(number), int(first_line), int(lines)))
+        next_number = segments[-1][0] + 1 if segments else 0
+        next_first = segments[-1][1] + segments[-1][2] if segments else 0
+        if os.path.exists(os.path.join(self.run_dir, segment_name(next_number))):
+            segments.append((next_number, next_first, self._count_active(next_number)))
+        return segments
+
+    def total_lines(self):
+        segments = self.segments()
+        return segments[-1][1] + segments[-1][2] if segments else 0
+
+    def _checkpoints(self, number):
+        checkpoints = []
+        index_path = os.path.join(self.run_dir, f"{number:05d}.idx")
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line_no, offset, ts = line.rstrip('\n').split('\t')
+                    checkpoints.append((int(line_no), int(offset), float(ts)))
+        return checkpoints
+
+    def _open_segment(self, number):
+        path = os.path.join(self.run_dir, segment_name(number))
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return gzip.open(path + '.gz', 'rb')
+
+    def _count_active(self, number):
+        checkpoints = self._checkpoints(number)
+        if not checkpoints:
+            return 0
+        line_no, offset, _ = checkpoints[-1]
+        with self._open_segment(number) as f:
+            f.seek(offset)
+            counted = sum(1 for _ in f)
+        return line_no - checkpoints[0][0] + counted
+
+    def _iter_from(self, start):
+        # Генератор (номер строки, сырая строка) начиная со start
+        for number, first_line, lines in self.segments():
+            if start >= first_line + lines:
+                continue
+            line_no, offset = first_line, 0
+            for checkpoint_line, checkpoint_offset, _ in self._checkpoints(number):
+                if checkpoint_line > start:
+                    break
+                line_no, offset = checkpoint_line, checkpoint_offset
+            with self._open_segment(number) as f:
+                f.seek(offset)
+                for raw in f:
+                    if line_no >= start:
+                        yield line_no, raw.decode('utf-8', errors='replace')
+                    line_no += 1
+
+    def read_lines(self, start, count):
+        # -> список (номер строки, timestamp, stream, text)
+        result = []
+        if count <= 0:
+            return result
+        for line_no, raw in self._iter_from(max(0, start)):
+            result.append((line_no, *parse_line(raw)))
+            if len(result) >= count:
+                break
+        return result
+
+    def tail(self, count):
+        return self.read_lines(self.total_lines() - count, count)
+
+    def line_at_time(self, ts):
+        # Номер первой строки не раньше ts с точностью до шага индекса
+        best = 0
+        for number, first_line, lines in self.segments():
+            for line_no, _, checkpoint_ts in self._checkpoints(number):
+                if checkpoint_ts > ts:
+                    return best
+                best = line_no
+        return best
+
+    def grep(self, pattern, max_results=1000, ignore_case=True):
+        regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        result = []
+        for line_no, raw in self._iter_from(0):
+            ts, stream, text = parse_line(raw)
+            if regex.search(text):
+                result.append((line_no, ts, stream, text))
+                if len(result) >= max_results:
+                    break
+        return result
@@ -0,0 +1,96 @@
+import collections
+import threading
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+DEFAULT_MAX_LINES = 10000
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+MAX_LINE_LENGTH = 8192  # длиннее обрезаем, чтобы одна строка не съела всю прокрутку
+
+
+class OutputPipe:
+    # Одновременно вычитывает stdout и stderr процесса в общий ограниченный буфер.
+    # Каждый поток читается своим потоком-читателем: select по пайпам на Windows
+    # не работает, а ждать EOF одного потока перед другим нельзя - дочерний процесс
+    # заблокируется на переполненном пайпе. UI забирает строки пачками через drain(),
+    # а sink (LogWriter) получает полный вывод для хранения на диске.
+    def __init__(self, process, max_lines=DEFAULT_MAX_LINES, sink=None):
+        self.process = process
+        self.sink = sink
+        self._buffer = collections.deque()
+        self._max_lines = max_lines
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._readers = []
+        self.returncode = None
+        self.finished = threading.Event()
+
+    def start(self):
+        for name, stream in ((STDOUT, self.process.stdout), (STDERR, self.process.stderr)):
+            if stream is None:
+                continue
+            reader = threading.Thread(target=self._read, args=(name, stream), daemon=True)
+            reader.start()
+            self._readers.append(reader)
+        threading.Thread(target=self._wait, daemon=True).start()
+
+    def _read(self, name, stream):
+        try:
+            for line in iter(stream.readline, ''):
+                if self.sink is not None:
+                    self.sink.write(name, line)
+                if len(line) > MAX_LINE_LENGTH:
+                    line = line[:MAX_LINE_LENGTH] + '...\n'
+                with self._lock:
+                    self._buffer.append((name, line))
+                    if len(self._buffer) > self._max_lines:
+                        # UI не успевает - старые строки все равно ушли бы из прокрутки
+                        self._buffer.popleft()
+                        self._dropped += 1
+        except (OSError, ValueError):
+            pass  # пайп закрыт при остановке процесса
+        finally:
+            stream.close()
+
+    def _wait(self):
+        for reader in self._readers:
+            reader.join()
+        self.returncode = self.process.wait()
+        if self.sink is not None:
+            self.sink.close()
+        self.finished.set()
+
+    def drain(self, limit=None):
+        # Возвращает (список (stream, line), число пропущенных строк)
+        with self._lock:
+            if limit is None or limit >= len(self._buffer):
+                lines = list(self._buffer)
+                self._buffer.clear()
+            else:
+                lines = [self._buffer.popleft() for _ in range(limit)]
+            dropped, self._dropped = self._dropped, 0
+        return lines, dropped
+
+
+class Scrollback:
+    # Учет строк в виджете Text для обрезки прокрутки по числу строк и байтам
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._sizes = collections.deque()
+        self._bytes = 0
+
+    def add(self, text):
+        for line in text.splitlines(True):
+            size = len(line)
+            self._sizes.append(size)
+            self._bytes += size
+
+    def overflow(self):
+        # Сколько строк с начала надо удалить
+        count = 0
+        while self._sizes and (len(self._sizes) > self.max_lines or self._bytes > self.max_bytes):
+            self._bytes -= self._sizes.popleft()
+            count += 1
+        return count
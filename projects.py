@@ -0,0 +1,262 @@
+import asyncio
+import os
+import pathlib
+import subprocess
+import threading
+
+from depcache import DependencyCache
+from environments import resolve_interpreter, create_command, find_environment, \
+    venv_layout, default_venv_path, BACKEND_VENV
+from tracing import span
+
+CLONE_FULL = 'full'
+CLONE_SHALLOW = 'shallow'  # только последние depth коммитов, глубже - по запросу
+CLONE_BLOBLESS = 'blobless'  # вся история, содержимое файлов скачивается при checkout
+CLONE_TREELESS = 'treeless'  # вся история коммитов, деревья и файлы - по требованию
+CLONE_MODES = (CLONE_FULL, CLONE_SHALLOW, CLONE_BLOBLESS, CLONE_TREELESS)
+DEFAULT_CLONE_DEPTH = 1
+CLONE_PROGRESS_SHARE = 70  # доля скачивания в общем прогрессе, остальное - venv и зависимости
+
+
+async def create_venv(project_path, template_pool=None, python=None, backend=BACKEND_VENV, projects_dir=None):
+    # projects_dir - где лежит общий кэш колес, если проект не прямо в папке проектов (рабочие деревья)
+    venv_path = default_venv_path(project_path)
+    python_executable = await asyncio.to_thread(resolve_interpreter, python)
+    backend = backend or BACKEND_VENV
+    venv_create_command = create_command(python_executable, venv_path, backend)
+
+    # Проверяем, что python_executable существует
+    if not os.path.exists(python_executable):
+        raise Exception(f"Python executable not found: {python_executable}")
+
+    project_name = os.path.basename(project_path)
+    # Готовый шаблон из пула избавляет от холодного создания venv с ensurepip
+    acquired = False
+    if template_pool is not None and backend == BACKEND_VENV:
+        with span('venv_acquire', project_name):
+            acquired = await asyncio.to_thread(template_pool.acquire, python_executable, venv_path)
+    if acquired:
+        print(f"Virtual environment taken from template pool: {venv_path}")
+    else:
+        print(f"Creating virtual environment with: {venv_create_command}")
+
+        # Создание виртуального окружения
+        with span('venv_create', project_name, backend=backend):
+            proc = await asyncio.create_subprocess_exec(
+                *venv_create_command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            stdout, stderr = await proc.communicate()
+
+            if proc.returncode != 0:
+                raise Exception(f"Error creating virtual environment: {stderr.decode()}")
+
+    requirements_path = os.path.join(project_path, 'requirements.txt')
+    if os.path.exists(requirements_path):
+        layout = venv_layout(venv_path)
+        pip_executable = layout['pip'] if layout is not None else None
+
+        # Проверяем, что pip_executable существует
+        if pip_executable is None:
+            raise Exception(f"Pip executable not found in {venv_path}")
+
+        print(f"Installing dependencies from {requirements_path}")
+
+        # Установка зависимостей через общий кэш колес
+        cache = DependencyCache(projects_dir or os.path.dirname(project_path))
+        await asyncio.to_thread(cache.install, pip_executable, venv_path, requirements_path)
+
+
+def clone_options(mode=CLONE_FULL, depth=DEFAULT_CLONE_DEPTH, reference=None):
+    # Аргументы git clone для выбранной стратегии
+    if mode not in CLONE_MODES:
+        raise Exception(f"Неизвестный режим клонирования: {mode}")
+    options = []
+    if mode == CLONE_SHALLOW:
+        options.append(f'--depth={int(depth)}')
+    elif mode == CLONE_BLOBLESS:
+        options.append('--filter=blob:none')
+    elif mode == CLONE_TREELESS:
+        options.append('--filter=tree:0')
+    if reference:
+        # Объекты берутся из локального зеркала через alternates, если оно подходит
+        options.append(f'--reference-if-able={reference}')
+    return options
+
+
+def find_reference_mirror(reference_dir, repo_name):
+    if not reference_dir:
+        return None
+    for name in (repo_name + '.git', repo_name):
+        mirror_path = os.path.join(reference_dir, name)
+        if os.path.isdir(mirror_path):
+            return mirror_path
+    return None
+
+
+class CloneProgress:
+    # Реальный прогресс git clone вместо фиксированного шага: стадии
+    # переводятся в диапазон 0..CLONE_PROGRESS_SHARE общего прогресс-бара.
+    # GitPython принимает вместо RemoteProgress любой callable, так что git
+    # импортируется только при первом клонировании
+    def __init__(self, progress_callback, message_callback):
+        import git
+        stages = git.RemoteProgress
+        self.stages = {
+            stages.COUNTING: (0, 5, "Подсчет объектов"),
+            stages.COMPRESSING: (5, 10, "Сжатие объектов"),
+            stages.RECEIVING: (10, 80, "Получение объектов"),
+            stages.RESOLVING: (80, 95, "Разрешение дельт"),
+            stages.CHECKING_OUT: (95, 100, "Распаковка файлов"),
+        }
+        self.op_mask = stages.OP_MASK
+        self.progress_callback = progress_callback
+        self.message_callback = message_callback
+        self.last_value = None
+        self.last_stage = None
+
+    def __call__(self, op_code, cur_count, max_count=None, message=''):
+        stage = op_code & self.op_mask
+        if stage not in self.stages:
+            return
+        start, end, title = self.stages[stage]
+        fraction = min(1.0, cur_count / max_count) if max_count else 0.0
+        value = int((start + (end - start) * fraction) * CLONE_PROGRESS_SHARE / 100)
+        # git шлет прогресс очень часто, наружу отдаем только изменения
+        if value != self.last_value:
+            self.last_value = value
+            self.progress_callback(value)
+            if stage != self.last_stage or message:
+                self.message_callback(f"{title}: {message}" if message else f"{title}...")
+        self.last_stage = stage
+
+
+def install_requirements(project_path, requirements_path):
+    environment = find_environment(project_path)
+    if environment is None or environment['pip'] is None:
+        raise Exception(f"Виртуальное окружение с pip не найдено в {project_path}")
+    cache = DependencyCache(os.path.dirname(project_path))
+    cache.install(environment['pip'], environment['venv'], requirements_path)
+
+
+class CloneThread(threading.Thread):
+    def __init__(self, url, projects_dir, progress_callback, message_callback, finished_callback,
+                 template_pool=None, mode=CLONE_FULL, depth=DEFAULT_CLONE_DEPTH, reference_dir=None,
+                 python=None, backend=BACKEND_VENV):
+        super().__init__()
+        self.url = url
+        self.projects_dir = projects_dir
+        self.template_pool = template_pool
+        self.python = python
+        self.backend = backend
+        self.mode = mode
+        self.depth = depth
+        self.reference_dir = reference_dir
+        self.progress_callback = progress_callback
+        self.message_callback = message_callback
+        self.finished_callback = finished_callback
+        self.repo_name = self.url.rstrip('/').split('/')[-1].replace(".git", "")
+        self.error = None
+
+    def run(self):
+        asyncio.run(self.clone_project())
+
+    async def clone_project(self):
+        # Может выполняться и в собственном потоке, и в общем цикле asyncio сервиса
+        import git
+        try:
+            repo_name = self.repo_name
+            project_path = os.path.join(self.projects_dir, repo_name)
+            if os.path.exists(project_path):
+                raise Exception(f"Проект {repo_name} уже существует.")
+
+            reference = find_reference_mirror(self.reference_dir, repo_name)
+            options = clone_options(self.mode, self.depth, reference)
+            url = self.url
+            if options and os.path.isdir(url):
+                # Для локального пути git игнорирует --depth и --filter, нужен file://
+                url = pathlib.Path(url).resolve().as_uri()
+
+            self.message_callback(f"Скачивание проекта {repo_name}...")
+            progress = CloneProgress(self.progress_callback, self.message_callback)
+            with span('clone', repo_name, mode=self.mode):
+                await asyncio.to_thread(git.Repo.clone_from, url, project_path, progress=progress,
+                                        multi_options=options)
+
+            self.progress_callback(CLONE_PROGRESS_SHARE)
+            self.message_callback("Создание виртуального окружения...")
+
+            await create_venv(project_path, self.template_pool, self.python, self.backend)
+
+            self.progress_callback(100)
+        except Exception as e:
+            self.error = e
+            self.message_callback(str(e))
+        self.finished_callback()
+
+
+class UpdateThread(threading.Thread):
+    def __init__(self, project_path, progress_callback, message_callback, finished_callback):
+        super().__init__()
+        self.project_path = project_path
+        self.progress_callback = progress_callback
+        self.message_callback = message_callback
+        self.finished_callback = finished_callback
+        self.error = None
+        self.head_changed = False
+
+    def run(self):
+        import git
+        project_name = os.path.basename(self.project_path)
+        try:
+            self.message_callback("Проверка обновлений...")
+            repo = git.Repo(self.project_path)
+            old_sha = repo.head.commit.hexsha
+
+            with span('ls_remote', project_name):
+                remote_sha = self.get_remote_sha(repo)
+            if remote_sha is not None and remote_sha == old_sha:
+                # Ничего нового на сервере - не трогаем ни git pull, ни pip
+                self.message_callback("Проект уже актуален")
+                self.progress_callback(100)
+                self.finished_callback()
+                return
+
+            self.message_callback("Обновление проекта...")
+            origin = repo.remotes.origin
+            with span('pull', project_name):
+                origin.pull()
+            new_sha = repo.head.commit.hexsha
+            self.head_changed = new_sha != old_sha
+
+            self.progress_callback(50)
+            requirements_path = os.path.join(self.project_path, 'requirements.txt')
+            if (self.head_changed and os.path.exists(requirements_path)
+                    and self.requirements_changed(repo, old_sha, new_sha)):
+                self.message_callback("Обновление зависимостей...")
+                install_requirements(self.project_path, requirements_path)
+
+            self.progress_callback(100)
+        except Exception as e:
+            self.error = e
+            self.message_callback(str(e))
+        self.finished_callback()
+
+    def get_remote_sha(self, repo):
+        # SHA отслеживаемой ветки на сервере через ls-remote, без скачивания объектов.
+        # None - сравнить не получилось, тогда выполняем обычный pull.
+        if repo.head.is_detached:
+            return None
+        tracking = repo.active_branch.tracking_branch()
+        if tracking is None:
+            return None
+        output = repo.git.ls_remote(tracking.remote_name, f"refs/heads/{tracking.remote_head}")
+        for line in output.splitlines():
+            sha, _, ref = line.partition('\t')
+            if ref == f"refs/heads/{tracking.remote_head}":
+                return sha
+        return None
+
+    def requirements_changed(self, repo, old_sha, new_sha):
+        return bool(repo.git.diff('--name-only', old_sha, new_sha, '--', 'requirements.txt').strip())
@@ -0,0 +1,277 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_INTERVAL = 3600  # секунды между обновлениями одного проекта
+DEFAULT_JITTER = 0.2  # доля интервала, на которую разбрасываем время запуска
+DEFAULT_STARTUP_WINDOW = 600  # первый проход растягиваем на это время
+# Адаптивный опрос: интервал проекта сокращается, когда обновление что-то принесло,
+# и растет, пока репозиторий стоит на месте
+DEFAULT_MIN_INTERVAL = 300
+DEFAULT_MAX_INTERVAL = 24 * 3600
+SPEEDUP_FACTOR = 0.5
+BACKOFF_FACTOR = 1.5
+RECENT_WINDOW = 3600  # сколько проект считается "недавно использованным"
+
+PRIORITY_SELECTED = 0
+PRIORITY_RECENT = 5
+PRIORITY_NORMAL = 10
+
+STATE_QUEUED = 'queued'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+STOPPED_MESSAGE = "Планировщик обновлений остановлен"
+
+
+# Сводный прогресс обновлений, который UI опрашивает из главного потока
+class UpdateProgress:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def set(self, key, state=None, value=None, message=None):
+        with self._lock:
+            if state == STATE_QUEUED and not self._has_active():
+                # Начинается новая волна обновлений - старые итоги больше не нужны
+                self._items.clear()
+            item = self._items.setdefault(key, {'state': STATE_QUEUED, 'value': 0, 'message': ''})
+            if state is not None:
+                item['state'] = state
+            if value is not None:
+                item['value'] = value
+            if message is not None:
+                item['message'] = message
+
+    def _has_active(self):
+        return any(item['state'] in (STATE_QUEUED, STATE_RUNNING) for item in self._items.values())
+
+    def snapshot(self):
+        with self._lock:
+            items = {key: dict(item) for key, item in self._items.items()}
+        counts = {STATE_QUEUED: 0, STATE_RUNNING: 0, STATE_DONE: 0, STATE_FAILED: 0}
+        total_value = 0
+        for item in items.values():
+            counts[item['state']] += 1
+            if item['state'] in (STATE_DONE, STATE_FAILED):
+                total_value += 100
+            elif item['state'] == STATE_RUNNING:
+                total_value += item['value']
+        total = len(items)
+        return {
+            'items': items,
+            'total': total,
+            'queued': counts[STATE_QUEUED],
+            'running': counts[STATE_RUNNING],
+            'done': counts[STATE_DONE],
+            'failed': counts[STATE_FAILED],
+            'percent': total_value / total if total else 0,
+        }
+
+
+# Пул воркеров для обновления проектов с ограничением параллельности.
+# task(project_path, progress_callback, message_callback) выполняется синхронно
+# в одном из воркеров и должен бросить исключение при ошибке. Если task возвращает
+# True/False (были ли изменения), интервал проекта подстраивается под его активность.
+# finished_callback(state, message) получает итог именно своего запуска: снимок progress
+# для этого не годится - новая волна обновлений его очищает.
+class UpdateScheduler:
+    def __init__(self, task, concurrency=DEFAULT_CONCURRENCY, interval=DEFAULT_INTERVAL,
+                 jitter=DEFAULT_JITTER, startup_window=DEFAULT_STARTUP_WINDOW,
+                 min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+        self.task = task
+        self.concurrency = max(1, int(concurrency))
+        self.interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.jitter = jitter
+        self.startup_window = startup_window
+        self.progress = UpdateProgress()
+
+        self._cond = threading.Condition()
+        self._ready = []  # (priority, seq, path)
+        self._timers = []  # (due, seq, path)
+        self._due = {}  # path -> время следующего планового обновления
+        self._intervals = {}  # path -> свой интервал проекта вместо общего
+        self._adaptive = {}  # path -> текущий адаптивный интервал
+        self._queued = {}  # path -> приоритет записи в _ready
+        self._running = set()
+        self._callbacks = {}  # колбэки, ожидающие следующего запуска проекта
+        self._active_callbacks = {}  # колбэки текущего запуска
+        self._recent = {}
+        self._seq = itertools.count()
+        self._workers = []
+        self._stopped = False
+
+    def start(self):
+        for i in range(self.concurrency):
+            worker = threading.Thread(target=self._worker, name=f"update-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            # Проекты из очереди уже не запустятся - ждущие их итога не должны висеть вечно
+            callbacks = [callback for items in self._callbacks.values() for callback in items]
+            self._callbacks.clear()
+            self._cond.notify_all()
+        for callback in callbacks:
+            callback(STATE_FAILED, STOPPED_MESSAGE)
+
+    def set_projects(self, project_paths, intervals=None):
+        # Синхронизирует список проектов с плановым расписанием.
+        # intervals - {path: секунды} для проектов со своим интервалом обновления
+        now = time.time()
+        with self._cond:
+            project_paths = set(project_paths)
+            self._intervals = dict(intervals or {})
+            for path in list(self._due):
+                if path not in project_paths:
+                    del self._due[path]
+                    self._adaptive.pop(path, None)
+            for path in project_paths:
+                if path not in self._due:
+                    window = min(self._intervals.get(path, self.interval), self.startup_window)
+                    self._schedule(path, now + random.uniform(0, window))
+            self._cond.notify_all()
+
+    def submit(self, project_path, priority=PRIORITY_SELECTED, finished_callback=None):
+        # Ставит проект в очередь немедленно, минуя расписание
+        with self._cond:
+            stopped = self._stopped
+            if not stopped:
+                if finished_callback is not None:
+                    self._callbacks.setdefault(project_path, []).append(finished_callback)
+                self._enqueue(project_path, priority)
+                self._cond.notify()
+        if stopped and finished_callback is not None:
+            finished_callback(STATE_FAILED, STOPPED_MESSAGE)
+
+    def touch(self, project_path):
+        # Отмечает проект как недавно запущенный или выбранный
+        with self._cond:
+            self._recent[project_path] = time.time()
+            queued_priority = self._queued.get(project_path)
+            if queued_priority is not None and queued_priority > PRIORITY_RECENT:
+                self._enqueue(project_path, PRIORITY_RECENT)
+
+    def is_busy(self, project_path):
+        # Обновление проекта стоит в очереди или уже идет
+        with self._cond:
+            return project_path in self._queued or project_path in self._running
+
+    def _schedule(self, path, due):
+        self._due[path] = due
+        heapq.heappush(self._timers, (due, next(self._seq), path))
+
+    def _enqueue(self, path, priority):
+        current = self._queued.get(path)
+        if current is not None and current <= priority:
+            return
+        # Старая запись в куче с худшим приоритетом будет пропущена при извлечении
+        self._queued[path] = priority
+        heapq.heappush(self._ready, (priority, next(self._seq), path))
+        self.progress.set(path, state=STATE_QUEUED, value=0, message='')
+
+    def _priority_for(self, path, now):
+        last_used = self._recent.get(path)
+        if last_used is not None and now - last_used < RECENT_WINDOW:
+            return PRIORITY_RECENT
+        return PRIORITY_NORMAL
+
+    def _release_due_timers(self, now):
+        while self._timers and self._timers[0][0] <= now:
+            due, _, path = heapq.heappop(self._timers)
+            if self._due.get(path) != due:
+                continue  # проект удален или перепланирован
+            if path in self._running:
+                self._schedule(path, now + self._next_interval(path))
+                continue
+            self._enqueue(path, self._priority_for(path, now))
+
+    def _next_job(self):
+        # Вызывается под self._cond
+        while not self._stopped:
+            now = time.time()
+            self._release_due_timers(now)
+            deferred = []
+            job = None
+            while self._ready:
+                entry = heapq.heappop(self._ready)
+                priority, _, path = entry
+                if self._queued.get(path) != priority:
+                    continue
+                if path in self._running:
+                    # Повторный запрос дождется окончания текущего обновления
+                    deferred.append(entry)
+                    continue
+                del self._queued[path]
+                self._running.add(path)
+                self._active_callbacks[path] = self._callbacks.pop(path, [])
+                job = path
+                break
+            for entry in deferred:
+                heapq.heappush(self._ready, entry)
+            if job is not None:
+                return job
+            timeout = self._timers[0][0] - now if self._timers else None
+            self._cond.wait(timeout)
+        return None
+
+    def _next_interval(self, path):
+        interval = self._intervals.get(path) or self._adaptive.get(path, self.interval)
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _adapt(self, path, changed):
+        # Вызывается под self._cond. Заданный вручную интервал проекта не трогаем
+        if path in self._intervals:
+            return
+        interval = self._adaptive.get(path, self.interval)
+        factor = SPEEDUP_FACTOR if changed else BACKOFF_FACTOR
+        self._adaptive[path] = min(self.max_interval, max(self.min_interval, interval * factor))
+
+    def schedule(self):
+        # Следующий плановый запуск и текущий интервал каждого проекта
+        with self._cond:
+            return {path: {'due': due, 'interval': self._intervals.get(path) or self._adaptive.get(path, self.interval)}
+                    for path, due in self._due.items()}
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                path = self._next_job()
+            if path is None:
+                return
+            self._run(path)
+
+    def _run(self, path):
+        self.progress.set(path, state=STATE_RUNNING, message='')
+        state = STATE_DONE
+        changed = None
+        result = {'message': ''}
+
+        def on_message(message):
+            result['message'] = message
+            self.progress.set(path, message=message)
+
+        try:
+            changed = self.task(path, lambda value: self.progress.set(path, value=value), on_message)
+        except Exception as e:
+            state = STATE_FAILED
+            on_message(str(e))
+        self.progress.set(path, state=state, value=100)
+
+        with self._cond:
+            self._running.discard(path)
+            if changed is not None:
+                self._adapt(path, changed)
+            if path in self._due:
+                self._schedule(path, time.time() + self._next_interval(path))
+            callbacks = self._active_callbacks.pop(path, [])
+            self._cond.notify_all()
+        for callback in callbacks:
+            callback(state, result['message'])
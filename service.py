@@ -0,0 +1,731 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+from bulk import BulkOperation, move_to_trash, purge_trash, BULK_ACTIONS, BULK_UPDATE, BULK_RESTART, \
+    BULK_DELETE, BULK_CHECKOUT, DEFAULT_BULK_CONCURRENCY, ITEM_PENDING, ITEM_RUNNING
+from catalog import ProjectCatalog, DEFAULT_POLL_INTERVAL, find_git_dir, read_head_ref, read_remote_urls
+from configstore import ConfigStore, RUN_FILE, ARGS, ENV, PYTHON, VENV_BACKEND, AUTO_UPDATE, UPDATE_INTERVAL, \
+    WATCH, WATCH_EXCLUDE, WORKTREE, RESTART, MAX_RSS_MB, MAX_CPU_PERCENT
+from logstore import LogStore, DEFAULT_MAX_RUNS, LOGS_DIR
+from environments import get_python_executable, launch_environment, find_environment, BACKEND_VENV, BACKENDS
+from projects import CloneThread, UpdateThread, CLONE_FULL, CLONE_MODES, DEFAULT_CLONE_DEPTH
+from storage import StorageManager, PARTS, DEFAULT_SCAN_INTERVAL, DEFAULT_STALE_DAYS, DEFAULT_GC_TIME_BUDGET
+from scheduler import UpdateScheduler, DEFAULT_CONCURRENCY, DEFAULT_INTERVAL, DEFAULT_JITTER, PRIORITY_SELECTED, \
+    STATE_FAILED, DEFAULT_MIN_INTERVAL, DEFAULT_MAX_INTERVAL
+from tracing import tracer, span, format_labels, METRIC_PREFIX, TRACE_FILE
+from triggers import normalize_remote_url
+from supervisor import ProcessSupervisor, DEFAULT_SAMPLE_INTERVAL, STATE_RUNNING, STATE_RESTARTING, STATE_STOPPING, \
+    STATE_STOPPED
+from venvpool import VenvTemplatePool, DEFAULT_POOL_SIZE, DEFAULT_TEMPLATE_TTL
+from watcher import ProjectWatcher, DEFAULT_WATCH_INTERVAL, DEFAULT_DEBOUNCE
+from worktrees import WorktreeCache, DEFAULT_MAX_WORKTREES
+
+SETTINGS_FILE = 'settings.json'
+DEFAULT_CLONE_CONCURRENCY = 4
+MAX_OPERATIONS = 200  # сколько последних операций помнить для API
+BULK_UPDATE_TIMEOUT = 3600  # секунды, дольше которых массовое обновление одного проекта не ждем
+
+OPERATION_RUNNING = 'running'
+OPERATION_DONE = 'done'
+OPERATION_FAILED = 'failed'
+
+
+def load_settings():
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, 'r') as f:
+            return json.load(f)
+    return {"projects_dir": "C:/"}
+
+
+def save_settings(settings):
+    # Через временный файл: оборванная запись не оставит settings.json пустым
+    tmp_path = SETTINGS_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(settings, f)
+    os.replace(tmp_path, SETTINGS_FILE)
+
+
+class ServiceError(Exception):
+    # Ошибка запроса к сервису (неизвестный проект, нет файла запуска и т.п.)
+    pass
+
+
+class ManagerService:
+    # Ядро менеджера без UI: каталог проектов, обновления, клонирование, запуск и
+    # остановка процессов, логи и метрики. Свой цикл asyncio в отдельном потоке
+    # выполняет параллельные операции и локальный API. Окно Tk и демон - его клиенты.
+    def __init__(self, settings):
+        self.settings = settings
+        self.projects_dir = settings['projects_dir']
+        os.makedirs(self.projects_dir, exist_ok=True)
+
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = None
+        self._clone_semaphore = None
+        self._operations = {}
+        self._operation_ids = itertools.count(1)
+        self._operations_lock = threading.Lock()
+        self._bulk_operations = {}
+        self._watchers = {}
+        self._watchers_lock = threading.Lock()
+        self._catalog_version = None
+        self._background_started = False
+
+        self.supervisor = ProcessSupervisor(settings.get('process_sample_interval', DEFAULT_SAMPLE_INTERVAL))
+        self.update_scheduler = UpdateScheduler(
+            self.run_update_job,
+            concurrency=settings.get('update_concurrency', DEFAULT_CONCURRENCY),
+            interval=settings.get('update_interval', DEFAULT_INTERVAL),
+            jitter=settings.get('update_jitter', DEFAULT_JITTER),
+            min_interval=settings.get('update_min_interval', DEFAULT_MIN_INTERVAL),
+            max_interval=settings.get('update_max_interval', DEFAULT_MAX_INTERVAL))
+
+        self.venv_pool = None
+        self.catalog = None
+        self.config_store = None
+        self.worktrees = None
+        self.storage = None
+        self.log_store = None
+        self.open_projects_dir()
+
+    def start(self):
+        # Минимум для работы: цикл сервиса и супервизор. Обновления, пул venv и слежение
+        # за каталогом запускаются отдельно через start_background, чтобы не тормозить старт окна
+        self._loop_thread = threading.Thread(target=self._run_loop, name="manager-service", daemon=True)
+        self._loop_thread.start()
+        self.supervisor.start()
+
+    def start_background(self):
+        self._background_started = True
+        self._start_projects_dir_tasks()
+        self.update_scheduler.start()
+        self.sync_schedule()
+        self.call_soon(self._watch_catalog())
+
+    def _start_projects_dir_tasks(self):
+        self.venv_pool.start()
+        self.catalog.start_watching()
+        self.storage.start()
+        # Остатки удалений, прерванных закрытием программы
+        threading.Thread(target=purge_trash, args=(self.projects_dir,), daemon=True).start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._clone_semaphore = asyncio.Semaphore(self.settings.get('clone_concurrency', DEFAULT_CLONE_CONCURRENCY))
+        self.loop.run_forever()
+
+    def call_soon(self, coroutine):
+        # Запуск корутины в цикле сервиса из любого потока
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def shutdown(self):
+        self._stop_all_watching()
+        self.update_scheduler.stop()
+        self.venv_pool.stop()
+        self.catalog.stop()
+        self.storage.stop()
+        self.supervisor.stop_all()
+        self.config_store.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def open_projects_dir(self):
+        # Подсистемы, привязанные к папке проектов, пересоздаются при ее смене
+        self._stop_all_watching()
+        if self.venv_pool is not None:
+            self.venv_pool.stop()
+        self.venv_pool = VenvTemplatePool(self.projects_dir,
+                                          size=self.settings.get('venv_pool_size', DEFAULT_POOL_SIZE),
+                                          ttl=self.settings.get('venv_template_ttl', DEFAULT_TEMPLATE_TTL))
+        self.venv_pool.register(get_python_executable())
+
+        self.log_store = LogStore(self.projects_dir, self.settings.get('log_max_runs', DEFAULT_MAX_RUNS))
+        if self.settings.get('trace_jsonl'):
+            tracer.set_jsonl(os.path.join(self.projects_dir, LOGS_DIR, TRACE_FILE))
+
+        if self.catalog is not None:
+            self.catalog.stop()
+        self.catalog = ProjectCatalog(self.projects_dir,
+                                      self.settings.get('catalog_poll_interval', DEFAULT_POLL_INTERVAL))
+        self.catalog.load()
+        self._catalog_version = None
+
+        if self.config_store is not None:
+            self.config_store.close()
+        self.config_store = ConfigStore(self.projects_dir)
+        self.config_store.open()
+        self.config_store.subscribe(self._on_config_changed)
+
+        self.worktrees = WorktreeCache(self.projects_dir, self.settings.get('max_worktrees', DEFAULT_MAX_WORKTREES),
+                                       in_use=self._worktree_in_use, template_pool=self.venv_pool)
+
+        if self.storage is not None:
+            self.storage.stop()
+        self.storage = StorageManager(self.projects_dir, self.catalog, self.worktrees, self.venv_pool,
+                                      scan_interval=self.settings.get('storage_scan_interval', DEFAULT_SCAN_INTERVAL),
+                                      stale_days=self.settings.get('gc_stale_days', DEFAULT_STALE_DAYS),
+                                      busy=self._project_busy)
+        self.storage.load()
+        if self._background_started:
+            self._start_projects_dir_tasks()
+
+    def set_projects_dir(self, projects_dir):
+        self.projects_dir = projects_dir
+        os.makedirs(projects_dir, exist_ok=True)
+        self.open_projects_dir()
+        self.catalog.refresh()
+        if self._background_started:
+            self.sync_schedule()
+        self.settings['projects_dir'] = projects_dir
+        settings = load_settings()
+        settings['projects_dir'] = projects_dir
+        save_settings(settings)
+
+    def sync_schedule(self):
+        # Планировщик сам разносит обновления по времени, здесь только синхронизируем список проектов
+        # и их расписание из ConfigStore
+        self._catalog_version = self.catalog.version
+        configs = self.config_store.all()
+        paths = []
+        intervals = {}
+        for name, entry in sorted(self.catalog.entries().items()):
+            config = configs.get(name, {})
+            if config.get(AUTO_UPDATE, True) is False:
+                continue
+            paths.append(entry['path'])
+            if config.get(UPDATE_INTERVAL):
+                intervals[entry['path']] = config[UPDATE_INTERVAL]
+        self.update_scheduler.set_projects(paths, intervals)
+
+    def _on_config_changed(self, names):
+        if self._background_started:
+            self.sync_schedule()
+        # Режим наблюдения включается и выключается сразу, без перезапуска процесса
+        for name in names:
+            config = self.config_store.get(name)
+            supervised = self.supervisor.get(name)
+            if not config.get(WATCH):
+                self._stop_watching(name)
+            elif supervised is not None and supervised.is_running() and self.catalog.get(name) is not None:
+                # Каталог процесса, а не проекта: закрепленная версия работает из рабочего дерева
+                self._start_watching(name, supervised.cwd, config)
+
+    async def _watch_catalog(self):
+        while True:
+            if self.catalog.version != self._catalog_version:
+                self.sync_schedule()
+            await asyncio.sleep(1)
+
+    def project_path(self, name):
+        entry = self.catalog.get(name)
+        if entry is None:
+            raise ServiceError(f"Проект {name} не найден")
+        return entry['path']
+
+    def list_projects(self):
+        projects = []
+        configs = self.config_store.all()
+        for name, entry in sorted(self.catalog.entries().items()):
+            supervised = self.supervisor.get(name)
+            projects.append({
+                'name': name,
+                'path': entry['path'],
+                'venv': entry['venv'],
+                'python': entry['python'],
+                'run_file': configs.get(name, {}).get(RUN_FILE),
+                'watch': bool(configs.get(name, {}).get(WATCH)),
+                'version': (configs.get(name, {}).get(WORKTREE) or {}).get('ref'),
+                'head_sha': entry['head_sha'],
+                'last_update': entry['last_update'],
+                'state': supervised.state if supervised is not None else None,
+            })
+        return projects
+
+    # --- Операции ---
+
+    def _new_operation(self, kind, project):
+        with self._operations_lock:
+            operation_id = next(self._operation_ids)
+            self._operations[operation_id] = {'id': operation_id, 'kind': kind, 'project': project,
+                                              'state': OPERATION_RUNNING, 'progress': 0, 'message': '',
+                                              'started': time.time(), 'finished': None}
+            for old_id in list(self._operations)[:-MAX_OPERATIONS]:
+                if self._operations[old_id]['state'] != OPERATION_RUNNING:
+                    del self._operations[old_id]
+                    self._bulk_operations.pop(old_id, None)
+        return operation_id
+
+    def _update_operation(self, operation_id, **fields):
+        with self._operations_lock:
+            self._operations[operation_id].update(fields)
+
+    def operations(self):
+        with self._operations_lock:
+            return [dict(operation) for operation in self._operations.values()]
+
+    def clone(self, url, progress_callback=None, message_callback=None, finished_callback=None,
+              mode=None, depth=None):
+        mode = mode or self.settings.get('clone_mode', CLONE_FULL)
+        if mode not in CLONE_MODES:
+            raise ServiceError(f"Неизвестный режим клонирования: {mode}")
+        if self.settings.get('venv_backend', BACKEND_VENV) not in BACKENDS:
+            raise ServiceError(f"Неизвестный способ создания venv: {self.settings['venv_backend']}")
+        clone = CloneThread(url, self.projects_dir, lambda value: None, lambda message: None, lambda: None,
+                            self.venv_pool,
+                            mode=mode,
+                            depth=depth or self.settings.get('clone_depth', DEFAULT_CLONE_DEPTH),
+                            reference_dir=self.settings.get('clone_reference_dir'),
+                            python=self.settings.get('python'),
+                            backend=self.settings.get('venv_backend', BACKEND_VENV))
+        # Интерпретатор и способ создания venv, заданные проекту заранее, важнее общих настроек
+        config = self.config_store.get(clone.repo_name)
+        clone.python = config.get(PYTHON) or clone.python
+        clone.backend = config.get(VENV_BACKEND) or clone.backend
+        operation_id = self._new_operation('clone', clone.repo_name)
+
+        def on_progress(value):
+            self._update_operation(operation_id, progress=value)
+            if progress_callback is not None:
+                progress_callback(value)
+
+        def on_message(message):
+            self._update_operation(operation_id, message=message)
+            if message_callback is not None:
+                message_callback(message)
+
+        def on_finished():
+            state = OPERATION_FAILED if clone.error is not None else OPERATION_DONE
+            self._update_operation(operation_id, state=state, finished=time.time())
+            self.catalog.refresh()
+            if finished_callback is not None:
+                finished_callback()
+
+        clone.progress_callback = on_progress
+        clone.message_callback = on_message
+        clone.finished_callback = on_finished
+
+        async def run():
+            async with self._clone_semaphore:
+                await clone.clone_project()
+
+        self.call_soon(run())
+        return operation_id
+
+    def update(self, name, finished_callback=None):
+        # finished_callback(state, message) вызывается из воркера планировщика
+        self.update_scheduler.submit(self.project_path(name), PRIORITY_SELECTED, finished_callback)
+
+    def run_update_job(self, project_path, progress_callback, message_callback):
+        # Выполняется в воркере планировщика, ошибку пробрасываем ему для учета.
+        # Результат - изменился ли HEAD, по нему планировщик подстраивает частоту опроса
+        name = os.path.basename(project_path)
+        update_thread = UpdateThread(project_path, progress_callback, message_callback, lambda: None)
+        with self._watching_suspended(name):
+            with span('update', name):
+                update_thread.run()
+                if update_thread.error is not None:
+                    raise update_thread.error
+            self.catalog.mark_updated(project_path)
+        # Проекты в режиме наблюдения подхватывают новый код сразу после обновления
+        with self._watchers_lock:
+            watched = name in self._watchers
+        pinned = self.config_store.get(name).get(WORKTREE)
+        if watched and update_thread.head_changed and not pinned:
+            message_callback("Перезапуск...")
+            self.restart(name, "обновление", automatic=True)
+        return update_thread.head_changed
+
+    def push(self, urls, repo_name=None, ref=None):
+        # Push-событие от хостинга: обновляем вне очереди проекты с этим remote.
+        # Если адресов в событии нет, ищем проект по имени репозитория.
+        # Push в другую ветку игнорируется - pull все равно заберет только текущую
+        wanted = {normalize_remote_url(url) for url in urls}
+        matched = []
+        for name, entry in sorted(self.catalog.entries().items()):
+            git_dir = find_git_dir(entry['path'])
+            if wanted:
+                if not wanted & {normalize_remote_url(url) for url in read_remote_urls(git_dir)}:
+                    continue
+            elif name != repo_name:
+                continue
+            head_ref = read_head_ref(git_dir)
+            if ref and head_ref and ref != head_ref:
+                continue
+            self.update_scheduler.submit(entry['path'], PRIORITY_SELECTED)
+            matched.append(name)
+        return matched
+
+    def touch(self, name):
+        self.update_scheduler.touch(os.path.join(self.projects_dir, name))
+
+    # --- Массовые операции ---
+
+    def bulk(self, action, names, ref=None, finished_callback=None):
+        if action not in BULK_ACTIONS:
+            raise ServiceError(f"Неизвестное действие: {action}")
+        if action == BULK_CHECKOUT and not ref:
+            raise ServiceError("Не указан тег или ветка")
+        for name in names:
+            self.project_path(name)
+        handlers = {
+            BULK_UPDATE: self._bulk_update,
+            BULK_RESTART: self._bulk_restart,
+            BULK_DELETE: self._bulk_delete,
+            BULK_CHECKOUT: lambda name, message_callback: self.switch(name, ref, message_callback),
+        }
+        operation_id = self._new_operation(f'bulk-{action}', None)
+
+        def on_finished(operation):
+            snapshot = operation.snapshot()
+            state = OPERATION_FAILED if snapshot['failed'] else OPERATION_DONE
+            self._update_operation(operation_id, state=state, progress=100, message=operation.summary(),
+                                   finished=time.time())
+            if action in (BULK_DELETE, BULK_CHECKOUT):
+                self.catalog.refresh()
+            if finished_callback is not None:
+                finished_callback(operation)
+
+        operation = BulkOperation(action, list(names), handlers[action],
+                                  self.settings.get('bulk_concurrency', DEFAULT_BULK_CONCURRENCY), on_finished)
+        with self._operations_lock:
+            self._bulk_operations[operation_id] = operation
+        operation.start()
+        return operation_id
+
+    def bulk_status(self, operation_id):
+        return self.bulk_operation(operation_id).snapshot()
+
+    def cancel_bulk(self, operation_id):
+        self.bulk_operation(operation_id).cancel()
+
+    def bulk_operation(self, operation_id):
+        with self._operations_lock:
+            operation = self._bulk_operations.get(operation_id)
+        if operation is None:
+            raise ServiceError(f"Операция {operation_id} не найдена")
+        return operation
+
+    def _bulk_update(self, name, message_callback):
+        # Через планировщик, чтобы не столкнуться с плановым обновлением того же проекта
+        project_path = self.project_path(name)
+        done = threading.Event()
+        result = {}
+
+        def on_finished(state, message):
+            result.update(state=state, message=message)
+            done.set()
+
+        self.update_scheduler.submit(project_path, PRIORITY_SELECTED, on_finished)
+        if not done.wait(BULK_UPDATE_TIMEOUT):
+            raise Exception(f"Обновление не завершилось за {BULK_UPDATE_TIMEOUT} с")
+        if result['state'] == STATE_FAILED:
+            raise Exception(result['message'] or "Ошибка обновления")
+        message_callback(result['message'])
+
+    def _bulk_restart(self, name, message_callback):
+        self.stop(name)
+        message_callback("Запуск...")
+        self.run(name)
+
+    def _bulk_delete(self, name, message_callback):
+        self.stop(name)
+        move_to_trash(self.projects_dir, self.project_path(name))
+        self.worktrees.drop(name)
+        self.config_store.delete(name)
+
+    # --- Запуск ---
+
+    def run_config(self, name):
+        self.project_path(name)
+        return self.config_store.get(name)
+
+    def update_config(self, name, **fields):
+        self.project_path(name)
+        try:
+            self.config_store.update(name, **fields)
+        except ValueError as e:
+            raise ServiceError(str(e))
+
+    def set_run_file(self, name, run_file):
+        self.update_config(name, **{RUN_FILE: run_file})
+
+    def reset_run_files(self, names=None):
+        # Одной транзакцией для всех проектов
+        return self.config_store.reset(RUN_FILE, names)
+
+    def _launch_spec(self, name, worktree=None, instance=None):
+        # Команда, каталог и окружение запуска. worktree - {"ref", "sha"} версии из рабочего дерева,
+        # по умолчанию - закрепленная версия проекта, а без нее основное дерево
+        project_path = self.project_path(name)
+        config = self.run_config(name)
+        run_file = config.get(RUN_FILE)
+        if not run_file:
+            raise ServiceError("Файл для запуска не выбран.")
+
+        worktree = worktree or config.get(WORKTREE)
+        if worktree:
+            cwd = self.worktrees.path(name, worktree['sha'])
+            if not os.path.isdir(cwd):
+                raise ServiceError(f"Версия {worktree['ref']} не развернута")
+            if os.path.isabs(run_file):
+                # Файл запуска выбирали в основном дереве - берем тот же файл в рабочем
+                run_file = os.path.join(cwd, os.path.relpath(run_file, project_path))
+            environment = find_environment(cwd)
+            self.worktrees.touch(name, worktree['sha'])
+        else:
+            cwd = project_path
+            environment = self.catalog.environment(name)
+        if environment is None:
+            raise ServiceError("Виртуальное окружение не найдено.")
+
+        instance = instance or name
+
+        def open_log():
+            log_writer = self.log_store.open_run(instance)
+            log_writer.write('stdout', f"Запуск {run_file}...\n")
+            return log_writer
+
+        # Интерпретатор venv запускается напрямую, без shell и activate-скриптов
+        env = launch_environment(environment)
+        env.update({key: str(value) for key, value in config.get(ENV, {}).items()})
+        argv = [environment['python'], run_file] + [str(arg) for arg in config.get(ARGS, [])]
+        return {'argv': argv, 'cwd': cwd, 'env': env, 'sink_factory': open_log}, config
+
+    def run(self, name, ref=None, message_callback=None):
+        # ref - запустить рядом с основной другую версию (канареечное сравнение):
+        # отдельный процесс "<имя>@<sha>" из рабочего дерева этой версии
+        if ref:
+            sha, _ = self.materialize(name, ref, message_callback)
+            instance = f"{name}@{sha[:7]}"
+            spec, config = self._launch_spec(name, {'ref': ref, 'sha': sha}, instance)
+        else:
+            instance = name
+            spec, config = self._launch_spec(name)
+            self.touch(name)
+
+        supervised = self.supervisor.launch(
+            instance,
+            restart=config.get(RESTART, False),
+            max_rss_mb=config.get(MAX_RSS_MB),
+            max_cpu_percent=config.get(MAX_CPU_PERCENT),
+            **spec)
+        if not ref and config.get(WATCH):
+            self._start_watching(name, spec['cwd'], config)
+        return supervised
+
+    def restart(self, name, reason='', automatic=False):
+        # Работающий процесс перезапускается на месте, остановленный или упавший - запускается заново.
+        # Команда и каталог пересчитываются: перезапуск подхватывает новую версию и настройки.
+        # automatic - перезапуск от наблюдения за файлами или обновления: проект, который
+        # пользователь остановил (или еще не запускал), так и остается остановленным
+        if automatic and self._stopped_by_user(name):
+            return None
+        with span('restart', name, reason=reason):
+            spec, _ = self._launch_spec(name)
+            if self.supervisor.restart(name, reason, **spec):
+                return self.supervisor.get(name)
+            return self.run(name)
+
+    def _stopped_by_user(self, name):
+        supervised = self.supervisor.get(name)
+        return supervised is None or supervised.state in (STATE_STOPPING, STATE_STOPPED)
+
+    # --- Версии и рабочие деревья ---
+
+    def materialize(self, name, ref, message_callback=None):
+        config = self.config_store.get(name)
+        return self.worktrees.materialize(
+            self.project_path(name), ref, message_callback or (lambda message: None),
+            python=config.get(PYTHON) or self.settings.get('python'),
+            backend=config.get(VENV_BACKEND) or self.settings.get('venv_backend', BACKEND_VENV))
+
+    def switch(self, name, ref, message_callback=None):
+        # Переключение проекта на коммит/тег: версия разворачивается в рабочее дерево один раз,
+        # дальше переключение - только смена каталога запуска и перезапуск. ref=None - обратно
+        # на основное дерево (текущую ветку)
+        message_callback = message_callback or (lambda message: None)
+        with span('switch', name, ref=ref):
+            if ref:
+                sha, _ = self.materialize(name, ref, message_callback)
+                self.config_store.update(name, **{WORKTREE: {'ref': ref, 'sha': sha}})
+            else:
+                self.config_store.update(name, **{WORKTREE: None})
+            supervised = self.supervisor.get(name)
+            if supervised is not None and supervised.is_running():
+                message_callback("Перезапуск...")
+                supervised = self.restart(name, f"переключение на {ref or 'основное дерево'}")
+                # Наблюдение переезжает вслед за каталогом запуска
+                config = self.config_store.get(name)
+                if config.get(WATCH):
+                    self._stop_watching(name)
+                    self._start_watching(name, supervised.cwd, config)
+        message_callback(f"Активная версия: {ref or 'основное дерево'}")
+
+    def versions(self, name):
+        self.project_path(name)
+        return self.worktrees.entries(name)
+
+    def _project_busy(self, name):
+        # Клонирование, обновление или массовая операция еще могут заполнять окружение проекта
+        with self._operations_lock:
+            if any(operation['project'] == name and operation['state'] == OPERATION_RUNNING
+                   for operation in self._operations.values()):
+                return True
+            bulk_operations = list(self._bulk_operations.values())
+        for operation in bulk_operations:
+            item = operation.snapshot()['items'].get(name)
+            if item is not None and item['state'] in (ITEM_PENDING, ITEM_RUNNING):
+                return True
+        entry = self.catalog.get(name)
+        return entry is not None and self.update_scheduler.is_busy(entry['path'])
+
+    def _worktree_in_use(self, name, sha):
+        if (self.config_store.get(name).get(WORKTREE) or {}).get('sha') == sha:
+            return True
+        path = self.worktrees.path(name, sha)
+        for instance in (name, f"{name}@{sha[:7]}"):
+            supervised = self.supervisor.get(instance)
+            if supervised is not None and supervised.cwd == path and supervised.is_running():
+                return True
+        return False
+
+    def stop(self, name):
+        self._stop_watching(name)
+        supervised = self.supervisor.get(name)
+        if supervised is None or supervised.state not in (STATE_RUNNING, STATE_RESTARTING):
+            return False
+        self.supervisor.stop(name)
+        return True
+
+    # --- Наблюдение за файлами ---
+
+    def _start_watching(self, name, project_path, config):
+        with self._watchers_lock:
+            if name in self._watchers:
+                return
+            watcher = ProjectWatcher(name, project_path, self._on_project_changed,
+                                     ignore=config.get(WATCH_EXCLUDE, ()),
+                                     interval=self.settings.get('watch_interval', DEFAULT_WATCH_INTERVAL),
+                                     debounce=self.settings.get('watch_debounce', DEFAULT_DEBOUNCE))
+            self._watchers[name] = watcher
+        watcher.start()
+
+    def _stop_watching(self, name):
+        with self._watchers_lock:
+            watcher = self._watchers.pop(name, None)
+        if watcher is not None:
+            watcher.stop()
+
+    def _stop_all_watching(self):
+        with self._watchers_lock:
+            names = list(self._watchers)
+        for name in names:
+            self._stop_watching(name)
+
+    def _watching_suspended(self, name):
+        with self._watchers_lock:
+            watcher = self._watchers.get(name)
+        return watcher.suspended() if watcher is not None else contextlib.nullcontext()
+
+    def _on_project_changed(self, name, paths):
+        print(f"{name}: {len(paths)} files changed, restarting")
+        try:
+            self.restart(name, "изменены файлы", automatic=True)
+        except Exception as e:
+            print(f"Restart of {name} failed: {e}")
+
+    # --- Место на диске ---
+
+    def storage_usage(self):
+        return self.storage.usage()
+
+    def gc(self, target_free_mb=None, time_budget=None, finished_callback=None):
+        # Сборка мусора в фоне как отдельная операция; прогресс - в ее сообщении
+        operation_id = self._new_operation('gc', None)
+        target_free = target_free_mb * 1024 * 1024 if target_free_mb else None
+        time_budget = time_budget or self.settings.get('gc_time_budget', DEFAULT_GC_TIME_BUDGET)
+
+        def run():
+            state = OPERATION_DONE
+            report = None
+            try:
+                report = self.storage.gc(target_free, time_budget,
+                                         lambda message: self._update_operation(operation_id, message=message))
+                if any(job['error'] for job in report['jobs']):
+                    state = OPERATION_FAILED
+            except Exception as e:
+                state = OPERATION_FAILED
+                self._update_operation(operation_id, message=str(e))
+            self._update_operation(operation_id, state=state, progress=100, finished=time.time(), report=report)
+            if finished_callback is not None:
+                finished_callback(report)
+
+        threading.Thread(target=run, name="storage-gc", daemon=True).start()
+        return operation_id
+
+    # --- Логи и метрики ---
+
+    def log_runs(self, name):
+        self.project_path(name)
+        return self.log_store.runs(name)
+
+    def tail_logs(self, name, lines=100, run_id=None):
+        runs = self.log_runs(name)
+        if run_id is None:
+            if not runs:
+                return []
+            run_id = runs[0]
+        elif run_id not in runs:
+            raise ServiceError(f"Запуск {run_id} не найден")
+        reader = self.log_store.reader(name, run_id)
+        return [{'line': line_no, 'ts': ts, 'stream': stream, 'text': text}
+                for line_no, ts, stream, text in reader.tail(lines)]
+
+    def metrics(self):
+        return {
+            'processes': self.supervisor.metrics(),
+            'updates': self.update_scheduler.progress.snapshot(),
+            'operations': self.operations(),
+            'spans': tracer.summary(),
+            'schedule': {os.path.basename(path): item for path, item in self.update_scheduler.schedule().items()},
+        }
+
+    def traces(self, limit=100, name=None, project=None):
+        return tracer.spans(limit, name, project)
+
+    def prometheus_metrics(self):
+        # Гистограммы операций из трассировщика плюс текущее состояние процессов и обновлений
+        lines = [tracer.prometheus().rstrip('\n')]
+        gauges = (('process_cpu_percent', 'cpu_percent', 1), ('process_rss_bytes', 'rss_mb', 1024 * 1024),
+                  ('process_threads', 'threads', 1), ('process_open_files', 'open_files', 1))
+        processes = self.supervisor.metrics()
+        for metric, key, scale in gauges:
+            lines.append(f'# TYPE {METRIC_PREFIX}_{metric} gauge')
+            for name, item in sorted(processes.items()):
+                if key in item:
+                    lines.append(f'{METRIC_PREFIX}_{metric}{format_labels({"project": name})} {item[key] * scale}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_process_restarts_total counter')
+        for name, item in sorted(processes.items()):
+            lines.append(f'{METRIC_PREFIX}_process_restarts_total{format_labels({"project": name})} '
+                         f'{item["restarts"]}')
+        progress = self.update_scheduler.progress.snapshot()
+        lines.append(f'# TYPE {METRIC_PREFIX}_updates gauge')
+        for state in ('queued', 'running', 'done', 'failed'):
+            lines.append(f'{METRIC_PREFIX}_updates{format_labels({"state": state})} {progress[state]}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_projects gauge')
+        lines.append(f'{METRIC_PREFIX}_projects {len(self.catalog.names())}')
+        usage = self.storage.usage()
+        lines.append(f'# TYPE {METRIC_PREFIX}_disk_bytes gauge')
+        for name, item in sorted(usage['projects'].items()):
+            for part in PARTS:
+                lines.append(f'{METRIC_PREFIX}_disk_bytes{format_labels({"project": name, "part": part})} '
+                             f'{item.get(part, 0)}')
+        for key, size in sorted(usage['shared'].items()):
+            lines.append(f'{METRIC_PREFIX}_disk_bytes{format_labels({"project": "", "part": key})} {size}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_disk_free_bytes gauge')
+        lines.append(f'{METRIC_PREFIX}_disk_free_bytes {usage["disk"]["free"]}')
+        return '\n'.join(lines) + '\n'
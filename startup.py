@@ -0,0 +1,64 @@
+import json
+import os
+import statistics
+import time
+
+STARTUP_LOG = 'startup.jsonl'
+MAX_LOG_ENTRIES = 50
+REGRESSION_FACTOR = 1.5  # во сколько раз медленнее обычного считаем запуск регрессией
+REGRESSION_MIN_MS = 100  # разницу меньше этой не замечаем, это шум
+
+
+class StartupTimer:
+    # Замеры этапов запуска от импорта модуля до старта фоновых подсистем.
+    # История хранится в .cache/startup.jsonl, отчет сравнивает с медианой прошлых запусков.
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.started))
+
+    def total(self):
+        return self.marks[-1][1] if self.marks else 0.0
+
+    def report(self, history=()):
+        lines = ["Время запуска:"]
+        previous = 0.0
+        for name, elapsed in self.marks:
+            lines.append(f"  {name:<16} {elapsed * 1000:8.1f} мс  (+{(elapsed - previous) * 1000:.1f})")
+            previous = elapsed
+        totals = [entry['total'] for entry in history if 'total' in entry]
+        if totals:
+            median = statistics.median(totals)
+            line = f"  медиана прошлых запусков: {median:.1f} мс"
+            total = self.total() * 1000
+            if total > median * REGRESSION_FACTOR and total - median > REGRESSION_MIN_MS:
+                line += " - запуск заметно медленнее обычного"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def load_history(self, cache_dir):
+        history = []
+        try:
+            with open(os.path.join(cache_dir, STARTUP_LOG), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        history.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return history
+
+    def save(self, cache_dir, history):
+        entry = {'time': time.time(), 'total': round(self.total() * 1000, 1),
+                 'marks': {name: round(elapsed * 1000, 1) for name, elapsed in self.marks}}
+        entries = list(history[-(MAX_LOG_ENTRIES - 1):]) + [entry]
+        os.makedirs(cache_dir, exist_ok=True)
+        log_path = os.path.join(cache_dir, STARTUP_LOG)
+        tmp_path = log_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item in entries:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, log_path)
@@ -0,0 +1,379 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from bulk import TRASH_DIR, purge_trash, move_to_trash
+from catalog import CACHE_DIR, find_git_dir
+from depcache import DependencyCache, WHEELHOUSE_DIR
+from environments import VENV_NAMES, find_environment, get_python_executable
+from logstore import LOGS_DIR
+from tracing import span
+from venvpool import TEMPLATES_DIR
+from worktrees import WORKTREES_DIR
+
+STORAGE_FILE = 'storage.json'
+DEFAULT_SCAN_INTERVAL = 3600  # полный проход по всем проектам (по кэшу каталогов - это только stat папок)
+DEFAULT_STALE_DAYS = 14  # версии и шаблоны venv, не нужные дольше, считаются мусором
+DEFAULT_GC_TIME_BUDGET = 600  # секунды на один запуск сборки мусора
+VENV_GRACE_PERIOD = 24 * 3600  # лишний venv, который менялся недавно, может еще заполняться
+CHECK_INTERVAL = 30
+
+PART_CHECKOUT = 'checkout'
+PART_GIT = 'git'
+PART_VENV = 'venv'
+PART_WORKTREES = 'worktrees'
+PART_LOGS = 'logs'
+PARTS = (PART_CHECKOUT, PART_GIT, PART_VENV, PART_WORKTREES, PART_LOGS)
+
+# Общие каталоги projects_dir, не принадлежащие одному проекту
+SHARED_DIRS = {'wheelhouse': WHEELHOUSE_DIR, 'venv_templates': TEMPLATES_DIR, 'trash': TRASH_DIR,
+               'logs': LOGS_DIR, 'worktrees': WORKTREES_DIR, 'cache': CACHE_DIR}
+
+
+def format_size(size):
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ТБ"
+
+
+def venv_mtime(venv_path):
+    # Время последнего изменения окружения: pip и venv трогают корень, bin и site-packages
+    paths = [venv_path, os.path.join(venv_path, 'pyvenv.cfg'), os.path.join(venv_path, 'bin'),
+             os.path.join(venv_path, 'Scripts'), os.path.join(venv_path, 'Lib', 'site-packages')]
+    lib_dir = os.path.join(venv_path, 'lib')
+    try:
+        paths.extend(os.path.join(lib_dir, name, 'site-packages') for name in os.listdir(lib_dir))
+    except OSError:
+        pass
+    mtime = 0
+    for path in paths:
+        try:
+            mtime = max(mtime, os.stat(path).st_mtime)
+        except OSError:
+            pass
+    return mtime
+
+
+class DirSizeCache:
+    # Размеры каталогов без полного обхода каждый раз: для папки запоминается ее mtime,
+    # сумма размеров файлов в ней и список подпапок. Пока mtime папки не изменился
+    # (файлы не добавлялись, не удалялись и не переименовывались), файлы в ней не
+    # перечитываются - остается один stat на папку. git и pip пишут новые файлы через
+    # создание и переименование, так что это ловит почти все. Дописывание в существующий
+    # файл так не увидеть, для этого есть принудительный пересчет (force).
+    def __init__(self):
+        self._dirs = {}  # path -> (mtime_ns, байты файлов, имена подпапок)
+        self._lock = threading.Lock()
+
+    def size(self, path, exclude=(), force=False):
+        top = self._scan_dir(path, force)
+        if top is None:
+            return 0
+        total = top[1]
+        stack = [os.path.join(path, name) for name in top[2] if name not in exclude]
+        while stack:
+            directory = stack.pop()
+            entry = self._scan_dir(directory, force)
+            if entry is None:
+                continue
+            total += entry[1]
+            stack.extend(os.path.join(directory, name) for name in entry[2])
+        return total
+
+    def _scan_dir(self, path, force):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._dirs.pop(path, None)
+            return None
+        with self._lock:
+            cached = self._dirs.get(path)
+        if cached is not None and cached[0] == mtime and not force:
+            return cached
+        files = 0
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        else:
+                            files += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        result = (mtime, files, tuple(subdirs))
+        with self._lock:
+            self._dirs[path] = result
+        return result
+
+    def forget(self, path):
+        prefix = os.path.join(path, '')
+        with self._lock:
+            for key in [key for key in self._dirs if key == path or key.startswith(prefix)]:
+                del self._dirs[key]
+
+
+class StorageManager:
+    # Учет места в projects_dir по проектам (рабочие файлы, .git, venv, рабочие деревья
+    # версий, логи) и по общим каталогам. Итоги хранятся в .cache/storage.json и
+    # показываются сразу при запуске, фоновый поток пересчитывает проекты, у которых
+    # изменились HEAD или окружение, и раз в scan_interval - все остальные.
+    # gc() чистит мусор в пределах бюджета времени, пока не освобождено нужное место.
+    def __init__(self, projects_dir, catalog, worktrees=None, venv_pool=None, scan_interval=DEFAULT_SCAN_INTERVAL,
+                 stale_days=DEFAULT_STALE_DAYS, busy=None):
+        self.projects_dir = projects_dir
+        self.catalog = catalog
+        self.worktrees = worktrees
+        self.venv_pool = venv_pool
+        self.scan_interval = scan_interval
+        self.stale_age = stale_days * 24 * 3600
+        self.busy = busy or (lambda name: False)
+        self.cache_path = os.path.join(projects_dir, CACHE_DIR, STORAGE_FILE)
+        self.sizes = DirSizeCache()
+        self.version = 0
+        self._lock = threading.Lock()
+        self._projects = {}
+        self._shared = {}
+        self._scanned = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        with self._lock:
+            self._projects = data.get('projects', {})
+            self._shared = data.get('shared', {})
+            self._scanned = data.get('scanned')
+            self.version += 1
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {'projects': self._projects, 'shared': self._shared, 'scanned': self._scanned}
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+
+    def usage(self):
+        with self._lock:
+            projects = {name: dict(item) for name, item in self._projects.items()}
+            shared = dict(self._shared)
+            scanned = self._scanned
+        disk = shutil.disk_usage(self.projects_dir)
+        return {'projects': projects, 'shared': shared, 'scanned': scanned,
+                'disk': {'total': disk.total, 'used': disk.used, 'free': disk.free}}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, name="storage-scan", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Storage scan error: {e}")
+            self._stopped.wait(CHECK_INTERVAL)
+
+    def _stamp(self, entry):
+        # По чему видно, что проект мог заметно измениться
+        return [entry['head_sha'], entry['last_update'], entry['venv']]
+
+    def refresh(self, force=False):
+        entries = self.catalog.entries()
+        now = time.time()
+        with self._lock:
+            full = force or self._scanned is None or now - self._scanned > self.scan_interval
+            for name in [name for name in self._projects if name not in entries]:
+                del self._projects[name]
+            changed = [name for name, entry in entries.items()
+                       if full or self._projects.get(name, {}).get('stamp') != self._stamp(entry)]
+        for name in changed:
+            self.scan_project(name, entries[name], force)
+        if full:
+            self.scan_shared(force)
+        if changed or full:
+            with self._lock:
+                if full:
+                    self._scanned = now
+                self.version += 1
+            self.save()
+
+    def scan_project(self, name, entry, force=False):
+        project_path = entry['path']
+        with span('storage_scan', name):
+            git_dir = find_git_dir(project_path)
+            item = {
+                PART_CHECKOUT: self.sizes.size(project_path, exclude=('.git',) + VENV_NAMES, force=force),
+                PART_GIT: self.sizes.size(git_dir, force=force) if os.path.isdir(git_dir) else 0,
+                PART_VENV: sum(self.sizes.size(os.path.join(project_path, venv_name), force=force)
+                               for venv_name in VENV_NAMES),
+                PART_WORKTREES: self.sizes.size(os.path.join(self.projects_dir, WORKTREES_DIR, name), force=force),
+                PART_LOGS: self.sizes.size(os.path.join(self.projects_dir, LOGS_DIR, name), force=force),
+            }
+        item['total'] = sum(item[part] for part in PARTS)
+        item['stamp'] = self._stamp(entry)
+        with self._lock:
+            self._projects[name] = item
+        return item
+
+    def scan_shared(self, force=False):
+        shared = {key: self.sizes.size(os.path.join(self.projects_dir, dir_name), force=force)
+                  for key, dir_name in SHARED_DIRS.items()}
+        with self._lock:
+            self._shared = shared
+
+    def _measure(self, path):
+        return self.sizes.size(path, force=True) if os.path.exists(path) else 0
+
+    # --- Сборка мусора ---
+
+    def gc(self, target_free=None, time_budget=DEFAULT_GC_TIME_BUDGET, message_callback=lambda message: None):
+        # Задачи идут от дешевых и безопасных к дорогим; останавливаемся, когда на диске
+        # target_free байт свободно или кончился бюджет времени. Без target_free - все задачи
+        # Задачи удаляют синхронно, так что проверка перед следующей видит уже освобожденное место
+        started = time.time()
+        jobs = [
+            ('trash', "Очистка корзины", self._gc_trash),
+            ('worktrees', "Удаление неиспользуемых версий", self._gc_worktrees),
+            ('venv_templates', "Удаление старых шаблонов venv", self._gc_templates),
+            ('wheelhouse', "Чистка кэша колес", self._gc_wheelhouse),
+            ('pip_cache', "Очистка кэша pip", self._gc_pip_cache),
+            ('venvs', "Удаление лишних venv", self._gc_venvs),
+            ('git', "git gc", lambda: self._gc_git(started + time_budget)),
+        ]
+        report = {'freed': 0, 'jobs': [], 'stopped': None}
+        for key, title, job in jobs:
+            if target_free is not None and shutil.disk_usage(self.projects_dir).free >= target_free:
+                report['stopped'] = 'target'
+                break
+            if time.time() - started > time_budget:
+                report['stopped'] = 'time_budget'
+                break
+            message_callback(f"{title}...")
+            job_started = time.time()
+            result = {'name': key, 'freed': 0, 'error': None}
+            try:
+                with span('gc', None, job=key):
+                    result['freed'] = job()
+            except Exception as e:
+                result['error'] = str(e)
+            result['duration'] = time.time() - job_started
+            report['freed'] += result['freed']
+            report['jobs'].append(result)
+        self.refresh(force=True)
+        message_callback(f"Освобождено {format_size(report['freed'])}")
+        return report
+
+    def _gc_trash(self):
+        trash_path = os.path.join(self.projects_dir, TRASH_DIR)
+        before = self._measure(trash_path)
+        purge_trash(self.projects_dir)
+        return before - self._measure(trash_path)
+
+    def _gc_worktrees(self):
+        if self.worktrees is None:
+            return 0
+        freed = 0
+        for name, entry in self.catalog.entries().items():
+            sizes = {item['sha']: self._measure(self.worktrees.path(name, item['sha']))
+                     for item in self.worktrees.entries(name) if time.time() - item['last_used'] > self.stale_age}
+            if sizes:
+                removed = self.worktrees.prune(entry['path'], self.stale_age, wait=True)
+                freed += sum(sizes.get(sha, 0) for sha in removed)
+        return freed
+
+    def _gc_templates(self):
+        if self.venv_pool is None:
+            return 0
+        before = self._measure(self.venv_pool.root)
+        self.venv_pool.evict_unused(self.stale_age)
+        return before - self._measure(self.venv_pool.root)
+
+    def _gc_wheelhouse(self):
+        venv_paths = []
+        for name, entry in self.catalog.entries().items():
+            venv_paths.extend(os.path.join(entry['path'], venv_name) for venv_name in VENV_NAMES)
+            if self.worktrees is not None:
+                for item in self.worktrees.entries(name):
+                    environment = find_environment(self.worktrees.path(name, item['sha']))
+                    if environment is not None:
+                        venv_paths.append(environment['venv'])
+        return DependencyCache(self.projects_dir).prune([path for path in venv_paths if os.path.isdir(path)])
+
+    def _gc_pip_cache(self):
+        # Кэш pip пользователя: колеса для проектов и так лежат в wheelhouse
+        python_executable = get_python_executable()
+        result = subprocess.run([python_executable, '-m', 'pip', 'cache', 'dir'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            return 0  # кэш pip выключен
+        cache_dir = result.stdout.strip()
+        before = self._measure(cache_dir)
+        subprocess.run([python_executable, '-m', 'pip', 'cache', 'purge'],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return before - self._measure(cache_dir)
+
+    def _gc_venvs(self):
+        # В проекте живет одно окружение: второе (venv рядом с .venv) и сломанные
+        # (без интерпретатора) никем не используются. Проекты, над которыми идет
+        # клонирование, обновление или массовая операция, и недавно менявшиеся venv
+        # не трогаем - их может заполнять create_venv
+        freed = 0
+        now = time.time()
+        for name, entry in self.catalog.entries().items():
+            if self.busy(name):
+                continue
+            active = find_environment(entry['path'])
+            for venv_name in VENV_NAMES:
+                venv_path = os.path.join(entry['path'], venv_name)
+                if not os.path.isdir(venv_path) or (active is not None and active['venv'] == venv_path):
+                    continue
+                if now - venv_mtime(venv_path) < VENV_GRACE_PERIOD:
+                    continue
+                freed += self._measure(venv_path)
+                self.sizes.forget(venv_path)
+                move_to_trash(self.projects_dir, venv_path, wait=True)
+        return freed
+
+    def _gc_git(self, deadline):
+        # Сначала самые тяжелые .git - там больше всего можно выиграть
+        import git
+        with self._lock:
+            order = sorted(self._projects, key=lambda name: self._projects[name].get(PART_GIT, 0), reverse=True)
+        entries = self.catalog.entries()
+        freed = 0
+        for name in order:
+            if time.time() > deadline:
+                break
+            entry = entries.get(name)
+            if entry is None:
+                continue
+            git_dir = find_git_dir(entry['path'])
+            before = self._measure(git_dir)
+            with span('git_gc', name):
+                repo = git.Repo(entry['path'])
+                repo.git.worktree('prune')
+                # Срок prune по умолчанию: --prune=now может удалить объекты fetch, который
+                # в этот момент идет в том же репозитории из планировщика или массовой операции
+                repo.git.gc('--quiet')
+            freed += max(0, before - self._measure(git_dir))
+        return freed
@@ -0,0 +1,297 @@
+import subprocess
+import threading
+import time
+
+from output import OutputPipe, DEFAULT_MAX_LINES
+from tracing import span
+
+DEFAULT_SAMPLE_INTERVAL = 2
+DEFAULT_STOP_TIMEOUT = 5
+DEFAULT_BACKOFF_BASE = 1
+DEFAULT_BACKOFF_MAX = 60
+DEFAULT_MAX_RESTARTS = 10
+STABLE_RUN_TIME = 60  # после стольких секунд работы счетчик падений сбрасывается
+CPU_LIMIT_SAMPLES = 3  # сколько замеров подряд CPU может быть выше лимита
+
+STATE_RUNNING = 'running'
+STATE_STOPPING = 'stopping'
+STATE_STOPPED = 'stopped'
+STATE_EXITED = 'exited'
+STATE_RESTARTING = 'restarting'
+STATE_FAILED = 'failed'
+
+
+def kill_tree(pid, timeout=DEFAULT_STOP_TIMEOUT):
+    # Мягко завершаем процесс вместе со всеми потомками, оставшихся добиваем
+    import psutil
+    try:
+        parent = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    try:
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        processes = [parent]
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(alive, timeout=timeout)
+
+
+class SupervisedProcess:
+    def __init__(self, name, argv, cwd, sink_factory=None, env=None, restart=False,
+                 max_restarts=DEFAULT_MAX_RESTARTS, max_rss_mb=None, max_cpu_percent=None,
+                 max_lines=DEFAULT_MAX_LINES):
+        self.name = name
+        self.argv = argv
+        self.cwd = cwd
+        self.env = env
+        self.sink_factory = sink_factory
+        self.restart = restart
+        self.max_restarts = max_restarts
+        self.max_rss_mb = max_rss_mb
+        self.max_cpu_percent = max_cpu_percent
+        self.max_lines = max_lines
+
+        self.process = None
+        self.pipe = None
+        self.generation = 0  # растет с каждым (пере)запуском, окно вывода по нему подхватывает новый пайп
+        self.state = STATE_STOPPED
+        self.reason = ''
+        self.returncode = None
+        self.restarts = 0
+        self.started_at = None
+        self.metrics = {}
+        self.lock = threading.Lock()
+        # Держится на время проверки флага остановки и перезапуска, чтобы stop() не разминулся
+        # с процессом, который как раз создается
+        self.start_lock = threading.Lock()
+        self._failures = 0
+        self._cpu_strikes = 0
+        self._ps_cache = {}
+        self._stop_requested = False
+        self._stop_event = threading.Event()  # будит ожидание паузы перед перезапуском
+        self._reload_requested = False
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        with span('process_start', self.name, generation=self.generation + 1):
+            process = subprocess.Popen(self.argv, cwd=self.cwd, env=self.env, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+        sink = self.sink_factory() if self.sink_factory is not None else None
+        pipe = OutputPipe(process, self.max_lines, sink=sink)
+        with self.lock:
+            self.process = process
+            self.pipe = pipe
+            self.generation += 1
+            self.state = STATE_RUNNING
+            self.reason = ''
+            self.returncode = None
+            self.started_at = time.time()
+            self._cpu_strikes = 0
+            self._ps_cache = {}
+        pipe.start()
+        return process
+
+    def sample(self):
+        # CPU, RSS, открытые файлы и потоки по всему дереву процесса
+        import psutil
+        if not self.is_running():
+            return None
+        try:
+            root = self._ps_cache.get(self.process.pid) or psutil.Process(self.process.pid)
+            tree = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return None
+        cache = {}
+        metrics = {'cpu_percent': 0.0, 'rss_mb': 0.0, 'open_files': 0, 'threads': 0, 'processes': 0}
+        for item in tree:
+            item = self._ps_cache.get(item.pid, item)
+            cache[item.pid] = item
+            try:
+                with item.oneshot():
+                    metrics['cpu_percent'] += item.cpu_percent(None)
+                    metrics['rss_mb'] += item.memory_info().rss / (1024 * 1024)
+                    metrics['threads'] += item.num_threads()
+                    try:
+                        metrics['open_files'] += len(item.open_files())
+                    except psutil.AccessDenied:
+                        pass
+                    metrics['processes'] += 1
+            except psutil.NoSuchProcess:
+                continue
+        self._ps_cache = cache
+        metrics['uptime'] = time.time() - self.started_at
+        self.metrics = metrics
+        return metrics
+
+    def limit_exceeded(self):
+        metrics = self.metrics
+        if self.max_rss_mb is not None and metrics.get('rss_mb', 0) > self.max_rss_mb:
+            return f"превышен лимит памяти {self.max_rss_mb} МБ"
+        if self.max_cpu_percent is not None and metrics.get('cpu_percent', 0) > self.max_cpu_percent:
+            self._cpu_strikes += 1
+            if self._cpu_strikes >= CPU_LIMIT_SAMPLES:
+                return f"превышен лимит CPU {self.max_cpu_percent}%"
+        else:
+            self._cpu_strikes = 0
+        return None
+
+    def next_backoff(self):
+        if self.started_at is not None and time.time() - self.started_at > STABLE_RUN_TIME:
+            self._failures = 0
+        self._failures += 1
+        return min(DEFAULT_BACKOFF_MAX, DEFAULT_BACKOFF_BASE * 2 ** (self._failures - 1))
+
+
+class ProcessSupervisor:
+    # Владеет всеми запущенными проектами: следит за ресурсами, перезапускает
+    # упавшие процессы с экспоненциальной задержкой и останавливает деревья процессов
+    def __init__(self, sample_interval=DEFAULT_SAMPLE_INTERVAL, stop_timeout=DEFAULT_STOP_TIMEOUT):
+        self.sample_interval = sample_interval
+        self.stop_timeout = stop_timeout
+        self.processes = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample_loop, name="process-sampler", daemon=True)
+        self._sampler.start()
+
+    def launch(self, name, argv, cwd, **options):
+        with self._lock:
+            current = self.processes.get(name)
+        if current is not None and current.is_running():
+            raise Exception(f"Проект {name} уже запущен")
+        supervised = SupervisedProcess(name, argv, cwd, **options)
+        supervised.start()
+        with self._lock:
+            self.processes[name] = supervised
+        threading.Thread(target=self._watch, args=(supervised,), daemon=True).start()
+        return supervised
+
+    def get(self, name):
+        with self._lock:
+            return self.processes.get(name)
+
+    def stop(self, name, reason=''):
+        supervised = self.get(name)
+        if supervised is None:
+            return
+        with supervised.lock:
+            supervised._stop_requested = True
+            supervised.state = STATE_STOPPING
+            supervised.reason = reason
+        supervised._stop_event.set()
+        # Перезапуск, начавшийся до флага, дожидаемся и останавливаем уже новый процесс
+        with supervised.start_lock:
+            process = supervised.process
+        if process is not None and process.poll() is None:
+            with span('process_stop', name):
+                kill_tree(process.pid, self.stop_timeout)
+
+    def restart(self, name, reason='', argv=None, cwd=None, env=None, sink_factory=None):
+        # Перезапуск на месте: тот же SupervisedProcess с новым поколением, окна вывода
+        # переключаются на новый пайп сами. False - процесс не запущен, перезапускать нечего.
+        # argv, cwd, env и sink_factory, если заданы, заменяют прежние (другая версия проекта)
+        supervised = self.get(name)
+        if supervised is None:
+            return False
+        with supervised.lock:
+            process = supervised.process
+            if supervised._stop_requested or process is None or process.poll() is not None:
+                return False
+            for key, value in (('argv', argv), ('cwd', cwd), ('env', env), ('sink_factory', sink_factory)):
+                if value is not None:
+                    setattr(supervised, key, value)
+            supervised._reload_requested = True
+            supervised.state = STATE_RESTARTING
+            supervised.reason = reason
+        with span('process_stop', name, reason=reason):
+            kill_tree(process.pid, self.stop_timeout)
+        return True
+
+    def stop_all(self):
+        # Деревья процессов останавливаем параллельно, чтобы выход не ждал N * timeout
+        with self._lock:
+            names = list(self.processes)
+        threads = [threading.Thread(target=self.stop, args=(name,), daemon=True) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stopped.set()
+
+    def metrics(self):
+        with self._lock:
+            processes = list(self.processes.values())
+        return {supervised.name: dict(supervised.metrics, state=supervised.state, restarts=supervised.restarts,
+                                      reason=supervised.reason)
+                for supervised in processes}
+
+    def _watch(self, supervised):
+        while True:
+            process = supervised.process
+            returncode = process.wait()
+            supervised.pipe.finished.wait()
+            with supervised.lock:
+                supervised.returncode = returncode
+                supervised.metrics = {}
+                if supervised._stop_requested:
+                    supervised.state = STATE_STOPPED
+                    return
+                reload = supervised._reload_requested
+                supervised._reload_requested = False
+                if not reload:
+                    can_restart = supervised.restart and supervised.restarts < supervised.max_restarts
+                    if returncode == 0 and not supervised.reason or not can_restart:
+                        supervised.state = STATE_EXITED if returncode == 0 else STATE_FAILED
+                        return
+                    supervised.state = STATE_RESTARTING
+                    delay = supervised.next_backoff()
+            if not reload:
+                # Перезапуск по запросу (restart) идет сразу и не считается падением
+                if supervised._stop_event.wait(delay) or self._stopped.is_set():
+                    supervised.state = STATE_STOPPED
+                    return
+                supervised.restarts += 1
+            with supervised.start_lock:
+                with supervised.lock:
+                    if supervised._stop_requested:
+                        supervised.state = STATE_STOPPED
+                        return
+                try:
+                    supervised.start()
+                except Exception as e:
+                    supervised.state = STATE_FAILED
+                    supervised.reason = str(e)
+                    return
+
+    def _sample_loop(self):
+        # psutil импортируется здесь, в фоновом потоке, а не при запуске программы
+        import psutil
+        while not self._stopped.wait(self.sample_interval):
+            with self._lock:
+                processes = list(self.processes.values())
+            for supervised in processes:
+                try:
+                    supervised.sample()
+                except psutil.Error:
+                    continue
+                reason = supervised.limit_exceeded()
+                if reason and supervised.state == STATE_RUNNING and not supervised.reason:
+                    # Лимит нарушен: убиваем дерево, политика перезапуска решит, что дальше
+                    supervised.reason = reason
+                    threading.Thread(target=kill_tree, args=(supervised.process.pid, self.stop_timeout),
+                                     daemon=True).start()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from logstore import LogStore, LogWriter
+
+
+class LogWriterFlushTest(unittest.TestCase):
+    def setUp(self):
+        self.projects_dir = tempfile.mkdtemp()
+        self.store = LogStore(self.projects_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.projects_dir, ignore_errors=True)
+
+    def test_quiet_process_lines_reach_readers_without_close(self):
+        run_dir = os.path.join(self.store.project_dir('bot'), 'run')
+        os.makedirs(run_dir)
+        writer = LogWriter(run_dir, flush_period=0.05)
+        try:
+            for text in ('first', 'second', 'third'):
+                writer.write('stdout', text)
+            time.sleep(0.3)  # дальше процесс молчит
+            reader = self.store.reader('bot', 'run')
+            self.assertEqual(reader.total_lines(), 3)
+            self.assertEqual([line[3] for line in reader.tail(3)], ['first', 'second', 'third'])
+        finally:
+            writer.close()
+
+    def test_default_period_flushes_on_timer(self):
+        writer = self.store.open_run('bot')
+        try:
+            writer.write('stderr', 'only line')
+            time.sleep(writer.flush_period * 2)
+            reader = self.store.reader('bot', self.store.runs('bot')[0])
+            self.assertEqual([(line[2], line[3]) for line in reader.tail(1)], [('stderr', 'only line')])
+        finally:
+            writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
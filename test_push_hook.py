@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+
+from daemon import ControlServer, start_control_server
+from service import ManagerService, ServiceError
+from triggers import send_push
+
+SECRET = 'test-secret'
+
+
+def make_repo(projects_dir, name, remote_url, branch):
+    # Минимальный .git: HEAD на ветку и remote в config - больше push-хуку ничего не нужно
+    git_dir = os.path.join(projects_dir, name, '.git')
+    os.makedirs(os.path.join(git_dir, 'refs', 'heads'))
+    with open(os.path.join(git_dir, 'HEAD'), 'w') as f:
+        f.write(f"ref: refs/heads/{branch}\n")
+    with open(os.path.join(git_dir, 'config'), 'w') as f:
+        f.write(f'[remote "origin"]\n\turl = {remote_url}\n\tfetch = +refs/heads/*:refs/remotes/origin/*\n')
+
+
+class PushHookTest(unittest.TestCase):
+    # Хостинг заменяет send_push: подписанное событие уходит в настоящий ControlServer на свободном порту
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        projects_dir = os.path.join(self.root, 'projects')
+        make_repo(projects_dir, 'bot', 'https://github.com/example/bot.git', 'main')
+        make_repo(projects_dir, 'other', 'git@github.com:example/other.git', 'main')
+        self.service = ManagerService({'projects_dir': projects_dir, 'webhook_secret': SECRET,
+                                       'api_token_file': os.path.join(self.root, 'api_token')})
+        self.service.start()
+        self.service.catalog.refresh()
+        self.server = start_control_server(self.service, '127.0.0.1', 0)
+        self.api_url = f"http://127.0.0.1:{self.server.port}"
+
+    def tearDown(self):
+        self.service.call_soon(self.server.close()).result()
+        self.service.shutdown()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def assert_status(self, status, *args, **kwargs):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            send_push(self.api_url, *args, **kwargs)
+        self.assertEqual(raised.exception.code, status)
+
+    def test_signed_push_matches_project_by_remote(self):
+        result = send_push(self.api_url, 'git@github.com:example/bot', 'refs/heads/main', SECRET)
+        self.assertEqual(result, {'projects': ['bot']})
+
+    def test_push_to_other_branch_is_ignored(self):
+        result = send_push(self.api_url, 'https://github.com/example/bot', 'refs/heads/dev', SECRET)
+        self.assertEqual(result, {'projects': []})
+
+    def test_unknown_repository_matches_nothing(self):
+        result = send_push(self.api_url, 'https://github.com/example/missing', 'refs/heads/main', SECRET)
+        self.assertEqual(result, {'projects': []})
+
+    def test_bad_signature_is_rejected(self):
+        self.assert_status(401, 'https://github.com/example/bot', 'refs/heads/main', 'wrong-secret')
+
+    def test_unsigned_push_is_rejected(self):
+        self.assert_status(401, 'https://github.com/example/bot', 'refs/heads/main')
+
+    def test_control_routes_require_token(self):
+        request = urllib.request.Request(self.api_url + '/projects')
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(request)
+        self.assertEqual(raised.exception.code, 401)
+
+        request.add_header('Authorization', f"Bearer {self.server.token}")
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(response.status, 200)
+
+    def test_public_bind_requires_webhook_secret(self):
+        del self.service.settings['webhook_secret']
+        server = ControlServer(self.service, '0.0.0.0', 0)
+        with self.assertRaises(ServiceError):
+            self.service.call_soon(server.start()).result()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import sys
+import time
+import unittest
+
+import supervisor
+from supervisor import ProcessSupervisor, STATE_RESTARTING, STATE_STOPPED
+
+
+class BackoffStopTest(unittest.TestCase):
+    def setUp(self):
+        # Пауза перед перезапуском заведомо дольше теста
+        self.backoff_base = supervisor.DEFAULT_BACKOFF_BASE
+        supervisor.DEFAULT_BACKOFF_BASE = 30
+        self.supervisor = ProcessSupervisor()
+
+    def tearDown(self):
+        supervisor.DEFAULT_BACKOFF_BASE = self.backoff_base
+
+    def wait_state(self, supervised, state, timeout=5):
+        deadline = time.time() + timeout
+        while supervised.state != state and time.time() < deadline:
+            time.sleep(0.02)
+        return supervised.state
+
+    def test_stop_wakes_restart_backoff(self):
+        supervised = self.supervisor.launch('bot', [sys.executable, '-c', 'raise SystemExit(1)'], None,
+                                            restart=True)
+        self.assertEqual(self.wait_state(supervised, STATE_RESTARTING), STATE_RESTARTING)
+        started = time.time()
+        self.supervisor.stop('bot')
+        self.assertEqual(self.wait_state(supervised, STATE_STOPPED, timeout=2), STATE_STOPPED)
+        self.assertLess(time.time() - started, 2)
+        self.assertEqual(supervised.restarts, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
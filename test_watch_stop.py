@@ -0,0 +1,74 @@
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from service import ManagerService
+from supervisor import STATE_STOPPED
+
+HAS_PSUTIL = importlib.util.find_spec('psutil') is not None
+
+
+def make_project(projects_dir, name):
+    # Проект с .git, "venv" из текущего интерпретатора и долго работающим файлом запуска
+    project_path = os.path.join(projects_dir, name)
+    os.makedirs(os.path.join(project_path, '.git'))
+    with open(os.path.join(project_path, '.git', 'HEAD'), 'w') as f:
+        f.write("ref: refs/heads/main\n")
+    bin_dir = os.path.join(project_path, '.venv', 'bin')
+    os.makedirs(bin_dir)
+    os.symlink(sys.executable, os.path.join(bin_dir, 'python'))
+    run_file = os.path.join(project_path, 'main.py')
+    with open(run_file, 'w') as f:
+        f.write("import time\ntime.sleep(60)\n")
+    return run_file
+
+
+class WatchStopTest(unittest.TestCase):
+    def setUp(self):
+        self.projects_dir = tempfile.mkdtemp()
+        self.run_file = make_project(self.projects_dir, 'bot')
+        self.service = ManagerService({'projects_dir': self.projects_dir, 'watch_interval': 0.05,
+                                       'watch_debounce': 0.05})
+        self.service.start()
+        self.service.catalog.refresh()
+        self.service.update_config('bot', run_file=self.run_file, watch=True)
+
+    def tearDown(self):
+        self.service.shutdown()
+        shutil.rmtree(self.projects_dir, ignore_errors=True)
+
+    def touch_and_wait(self):
+        with open(self.run_file, 'a') as f:
+            f.write("# changed\n")
+        time.sleep(0.5)  # с запасом на опрос и debounce наблюдателя
+
+    def test_automatic_restart_does_not_start_project_that_never_ran(self):
+        self.assertIsNone(self.service.restart('bot', "изменены файлы", automatic=True))
+        self.assertIsNone(self.service.supervisor.get('bot'))
+
+    @unittest.skipUnless(HAS_PSUTIL, "psutil is required to stop process trees")
+    def test_stopped_project_stays_stopped_after_file_change(self):
+        supervised = self.service.run('bot')
+        pid = supervised.process.pid
+        self.service.stop('bot')
+        self.touch_and_wait()
+        self.assertEqual(supervised.state, STATE_STOPPED)
+        self.assertEqual(supervised.process.pid, pid)
+        self.assertFalse(supervised.is_running())
+
+    @unittest.skipUnless(HAS_PSUTIL, "psutil is required to stop process trees")
+    def test_supervisor_stop_is_not_undone_by_watcher(self):
+        # Остановка мимо сервиса оставляет наблюдение включенным - перезапускать все равно нельзя
+        supervised = self.service.run('bot')
+        self.service.supervisor.stop('bot')
+        self.touch_and_wait()
+        self.assertEqual(supervised.state, STATE_STOPPED)
+        self.assertFalse(supervised.is_running())
+
+
+if __name__ == '__main__':
+    unittest.main()
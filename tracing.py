@@ -0,0 +1,152 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_MAX_SPANS = 10000
+TRACE_FILE = 'traces.jsonl'
+TRACE_FILE_MAX_BYTES = 16 * 1024 * 1024  # после этого размера файл переименовывается в .1
+# Границы корзин гистограммы длительностей, секунды
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_PREFIX = 'manager'
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + '}'
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, duration, failed=False):
+        for index, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.counts[index] += 1
+        self.total += duration
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+
+class Tracer:
+    # Замеры фаз операций (fetch, checkout, pip, создание venv, запуск и остановка
+    # процессов) с тегом проекта. Последние спаны хранятся в кольцевом буфере,
+    # по каждой паре (операция, проект) копится гистограмма длительностей.
+    # По желанию каждый завершенный спан дописывается в JSONL-файл.
+    def __init__(self, max_spans=DEFAULT_MAX_SPANS):
+        self._spans = collections.deque(maxlen=max_spans)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._jsonl_path = None
+        self._jsonl_lock = threading.Lock()
+
+    def set_jsonl(self, path):
+        self._jsonl_path = path
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @contextlib.contextmanager
+    def span(self, name, project=None, **tags):
+        started = time.time()
+        perf_started = time.perf_counter()
+        record = {'name': name, 'project': project, 'start': started, 'duration': None, 'status': 'ok'}
+        if tags:
+            record['tags'] = tags
+        try:
+            yield record
+        except BaseException as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+            raise
+        finally:
+            record['duration'] = time.perf_counter() - perf_started
+            self.record(record)
+
+    def record(self, record):
+        key = (record['name'], record['project'] or '')
+        with self._lock:
+            self._spans.append(record)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(record['duration'], record['status'] == 'error')
+        if self._jsonl_path is not None:
+            self._write_jsonl(record)
+
+    def _write_jsonl(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._jsonl_lock:
+            try:
+                if os.path.getsize(self._jsonl_path) > TRACE_FILE_MAX_BYTES:
+                    os.replace(self._jsonl_path, self._jsonl_path + '.1')
+            except OSError:
+                pass
+            try:
+                with open(self._jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Trace write error: {e}")
+
+    def spans(self, limit=100, name=None, project=None):
+        # Последние спаны, новые первыми
+        with self._lock:
+            spans = list(self._spans)
+        result = []
+        for record in reversed(spans):
+            if name is not None and record['name'] != name:
+                continue
+            if project is not None and record['project'] != project:
+                continue
+            result.append(dict(record))
+            if len(result) >= limit:
+                break
+        return result
+
+    def summary(self):
+        with self._lock:
+            items = [(key, histogram.count, histogram.total, histogram.errors)
+                     for key, histogram in self._histograms.items()]
+        return [{'name': name, 'project': project or None, 'count': count, 'total': total,
+                 'mean': total / count if count else 0, 'errors': errors}
+                for (name, project), count, total, errors in sorted(items)]
+
+    def prometheus(self):
+        # Текстовый формат Prometheus: гистограмма длительностей и счетчик ошибок
+        histogram_name = f'{METRIC_PREFIX}_operation_duration_seconds'
+        errors_name = f'{METRIC_PREFIX}_operation_errors_total'
+        lines = [f'# HELP {histogram_name} Duration of manager operations by phase and project.',
+                 f'# TYPE {histogram_name} histogram']
+        errors = [f'# HELP {errors_name} Failed manager operations by phase and project.',
+                  f'# TYPE {errors_name} counter']
+        with self._lock:
+            items = sorted((key, list(histogram.counts), histogram.total, histogram.count, histogram.errors)
+                           for key, histogram in self._histograms.items())
+        for (name, project), counts, total, count, error_count in items:
+            labels = {'operation': name, 'project': project}
+            for bound, bucket_count in zip(BUCKETS, counts):
+                lines.append(f'{histogram_name}_bucket{format_labels(dict(labels, le=bound))} {bucket_count}')
+            lines.append(f'{histogram_name}_bucket{format_labels(dict(labels, le="+Inf"))} {count}')
+            lines.append(f'{histogram_name}_sum{format_labels(labels)} {total:.6f}')
+            lines.append(f'{histogram_name}_count{format_labels(labels)} {count}')
+            errors.append(f'{errors_name}{format_labels(labels)} {error_count}')
+        return '\n'.join(lines + errors) + '\n'
+
+
+# Общий трассировщик процесса: модули пишут в него через span()
+tracer = Tracer()
+
+
+def span(name, project=None, **tags):
+    return tracer.span(name, project, **tags)
@@ -0,0 +1,67 @@
+import hashlib
+import hmac
+import json
+import re
+import urllib.request
+
+PUSH_HOOK_PATH = '/hooks/push'
+SIGNATURE_HEADER = 'x-hub-signature-256'  # GitHub и Gitea: sha256=<hmac тела>
+GITLAB_TOKEN_HEADER = 'x-gitlab-token'  # GitLab присылает секрет как есть
+EVENT_HEADERS = ('x-github-event', 'x-gitea-event', 'x-gitlab-event')
+PUSH_EVENTS = ('push', 'Push Hook')
+PING_EVENT = 'ping'
+
+# Поля репозитория с адресами в событиях GitHub, Gitea и GitLab
+URL_FIELDS = ('clone_url', 'ssh_url', 'git_url', 'html_url', 'git_http_url', 'git_ssh_url', 'url', 'web_url')
+
+REMOTE_URL_RE = re.compile(r'^(?:[a-z][a-z0-9+.-]*://)?(?:[^@/]+@)?([^/:]+)(?::\d+)?[:/](.+)$')
+
+
+def normalize_remote_url(url):
+    # https://github.com/o/r.git, git@github.com:o/r и ssh://git@github.com:22/o/r -> github.com/o/r
+    url = url.strip().lower().rstrip('/')
+    if url.endswith('.git'):
+        url = url[:-len('.git')]
+    match = REMOTE_URL_RE.match(url)
+    if match is None:
+        return url
+    return f"{match.group(1)}/{match.group(2).strip('/')}"
+
+
+def verify_signature(secret, body, headers):
+    if not secret:
+        return True
+    token = headers.get(GITLAB_TOKEN_HEADER)
+    if token is not None:
+        return hmac.compare_digest(token, secret)
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(headers.get(SIGNATURE_HEADER, ''), expected)
+
+
+def event_type(headers):
+    for header in EVENT_HEADERS:
+        if header in headers:
+            return headers[header]
+    return 'push'  # самодельные отправители заголовок обычно не ставят
+
+
+def parse_push(payload):
+    # (адреса репозитория, имя репозитория, ref) из тела push-события
+    repository = payload.get('repository') or payload.get('project') or {}
+    urls = [repository[field] for field in URL_FIELDS if isinstance(repository.get(field), str)]
+    return urls, repository.get('name'), payload.get('ref')
+
+
+def send_push(api_url, remote_url, ref=None, secret=None):
+    # Локальная замена GitHub: шлет минимальное push-событие в API менеджера.
+    # Удобно для проверки хука без публичного адреса
+    payload = {'ref': ref, 'repository': {'clone_url': remote_url,
+                                          'name': normalize_remote_url(remote_url).rsplit('/', 1)[-1]}}
+    body = json.dumps(payload).encode('utf-8')
+    headers = {'Content-Type': 'application/json', 'X-GitHub-Event': 'push'}
+    if secret:
+        headers['X-Hub-Signature-256'] = 'sha256=' + hmac.new(secret.encode('utf-8'), body,
+                                                               hashlib.sha256).hexdigest()
+    request = urllib.request.Request(api_url.rstrip('/') + PUSH_HOOK_PATH, data=body, headers=headers, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode('utf-8'))
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+TEMPLATES_DIR = '.venv-templates'
+LAST_USED_FILE = 'last_used'
+DEFAULT_POOL_SIZE = 2
+DEFAULT_TEMPLATE_TTL = 7 * 24 * 3600  # шаблоны интерпретатора, не востребованные неделю, удаляем
+REFILL_PERIOD = 60
+
+
+def interpreter_key(python_executable):
+    return hashlib.sha1(os.path.realpath(python_executable).encode('utf-8')).hexdigest()[:12]
+
+
+def relocate_venv(old_path, new_path, location=None):
+    # venv хранит абсолютный путь к себе в скриптах активации, pyvenv.cfg и shebang
+    # консольных скриптов (в том числе внутри .exe-лаунчеров pip на Windows).
+    # Лаунчеры ищут shebang от конца вложенного zip, поэтому смена длины пути им не мешает.
+    location = location or new_path
+    # venv записывает пути абсолютными, а projects_dir может быть задан относительно
+    old_path = os.path.abspath(old_path)
+    new_path = os.path.abspath(new_path)
+    old_bytes = os.fsencode(old_path)
+    new_bytes = os.fsencode(new_path)
+    candidates = [os.path.join(location, 'pyvenv.cfg')]
+    for scripts_dir in ('Scripts', 'bin'):
+        scripts_path = os.path.join(location, scripts_dir)
+        if os.path.isdir(scripts_path):
+            for file_name in os.listdir(scripts_path):
+                candidates.append(os.path.join(scripts_path, file_name))
+
+    for file_path in candidates:
+        if os.path.islink(file_path) or not os.path.isfile(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        if old_bytes not in data:
+            continue
+        with open(file_path, 'wb') as f:
+            f.write(data.replace(old_bytes, new_bytes))
+
+
+class VenvTemplatePool:
+    # Пул заранее созданных чистых venv для каждого интерпретатора.
+    # Новый проект забирает готовый шаблон переименованием (тот же диск - мгновенно),
+    # а фоновый поток досоздает шаблоны до нужного размера пула.
+    def __init__(self, projects_dir, size=DEFAULT_POOL_SIZE, ttl=DEFAULT_TEMPLATE_TTL):
+        self.root = os.path.join(projects_dir, TEMPLATES_DIR)
+        self.size = size
+        self.ttl = ttl
+        self._interpreters = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._refill_loop, name="venv-template-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def register(self, python_executable):
+        with self._lock:
+            self._interpreters[interpreter_key(python_executable)] = python_executable
+        self._wakeup.set()
+
+    def acquire(self, python_executable, venv_path):
+        # Возвращает True, если venv_path получен из шаблона, иначе venv создается как обычно
+        key = interpreter_key(python_executable)
+        self.register(python_executable)
+        interpreter_dir = os.path.join(self.root, key)
+        self._mark_used(interpreter_dir)
+        with self._lock:
+            for template_path in self._ready_templates(interpreter_dir):
+                try:
+                    os.rename(template_path, venv_path)
+                except OSError:
+                    continue
+                break
+            else:
+                return False
+        self._wakeup.set()
+        relocate_venv(template_path, os.path.abspath(venv_path))
+        return True
+
+    def _ready_templates(self, interpreter_dir):
+        if not os.path.isdir(interpreter_dir):
+            return []
+        return [os.path.join(interpreter_dir, name) for name in sorted(os.listdir(interpreter_dir))
+                if name.startswith('ready-')]
+
+    def _mark_used(self, interpreter_dir):
+        os.makedirs(interpreter_dir, exist_ok=True)
+        with open(os.path.join(interpreter_dir, LAST_USED_FILE), 'w') as f:
+            f.write(str(time.time()))
+
+    def _last_used(self, interpreter_dir):
+        try:
+            with open(os.path.join(interpreter_dir, LAST_USED_FILE), 'r') as f:
+                return float(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _refill_loop(self):
+        while not self._stopped:
+            self._wakeup.clear()
+            try:
+                self.evict_unused()
+                self._refill()
+            except Exception as e:
+                print(f"Venv template pool error: {e}")
+            self._wakeup.wait(REFILL_PERIOD)
+
+    def evict_unused(self, ttl=None):
+        # Удаляет шаблоны интерпретаторов, не востребованные дольше ttl
+        if not os.path.isdir(self.root):
+            return
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        for key in os.listdir(self.root):
+            interpreter_dir = os.path.join(self.root, key)
+            if now - self._last_used(interpreter_dir) > ttl:
+                with self._lock:
+                    self._interpreters.pop(key, None)
+                shutil.rmtree(interpreter_dir, ignore_errors=True)
+
+    def _refill(self):
+        with self._lock:
+            interpreters = dict(self._interpreters)
+        for key, python_executable in interpreters.items():
+            interpreter_dir = os.path.join(self.root, key)
+            if not os.path.exists(os.path.join(interpreter_dir, LAST_USED_FILE)):
+                self._mark_used(interpreter_dir)
+            self._remove_stale_builds(interpreter_dir)
+            while not self._stopped and len(self._ready_templates(interpreter_dir)) < self.size:
+                self._build_template(python_executable, interpreter_dir)
+
+    def _remove_stale_builds(self, interpreter_dir):
+        # Остатки сборок, прерванных закрытием приложения
+        for name in os.listdir(interpreter_dir):
+            build_path = os.path.join(interpreter_dir, name)
+            if name.startswith('build-') and time.time() - os.path.getmtime(build_path) > REFILL_PERIOD * 10:
+                shutil.rmtree(build_path, ignore_errors=True)
+
+    def _build_template(self, python_executable, interpreter_dir):
+        # Собираем во временной папке и переименовываем - acquire видит только готовые шаблоны
+        build_path = os.path.join(interpreter_dir, f"build-{uuid.uuid4().hex}")
+        ready_path = os.path.join(interpreter_dir, f"ready-{time.time_ns()}-{uuid.uuid4().hex[:8]}")
+        result = subprocess.run([python_executable, '-m', 'venv', build_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise Exception(f"Error creating venv template: {result.stderr}")
+        relocate_venv(build_path, ready_path, location=build_path)
+        os.rename(build_path, ready_path)
@@ -0,0 +1,108 @@
+import contextlib
+import fnmatch
+import os
+import threading
+
+from environments import VENV_NAMES
+
+# Каталоги и файлы, изменения в которых не должны перезапускать проект
+WATCH_IGNORE = VENV_NAMES + ('.git', '__pycache__', '.cache', '.mypy_cache', '.pytest_cache', 'node_modules',
+                             '*.pyc', '*.pyo', '*.log', '*.swp', '*~', '.#*')
+DEFAULT_WATCH_INTERVAL = 0.5  # секунды между проходами по дереву
+DEFAULT_DEBOUNCE = 0.5  # сколько дерево должно не меняться, прежде чем перезапускать
+
+
+def snapshot_tree(root, ignore=WATCH_IGNORE):
+    # {путь: (mtime_ns, размер)} всех файлов проекта, кроме игнорируемых
+    result = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if any(fnmatch.fnmatch(entry.name, pattern) for pattern in ignore):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        stat = entry.stat(follow_symlinks=False)
+                        result[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+    return result
+
+
+def changed_paths(old, new):
+    return sorted(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+
+class ProjectWatcher:
+    # Следит за деревом проекта опросом (без зависимостей и одинаково на всех системах).
+    # Серия изменений (git pull, сохранение нескольких файлов) схлопывается в один
+    # вызов callback(name, paths) после того, как дерево DEBOUNCE секунд не меняется.
+    def __init__(self, name, project_path, callback, ignore=(), interval=DEFAULT_WATCH_INTERVAL,
+                 debounce=DEFAULT_DEBOUNCE):
+        self.name = name
+        self.project_path = project_path
+        self.callback = callback
+        self.ignore = WATCH_IGNORE + tuple(ignore)
+        self.interval = interval
+        self.debounce = debounce
+        self._snapshot = None
+        self._suspended = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._snapshot = snapshot_tree(self.project_path, self.ignore)
+        self._thread = threading.Thread(target=self._watch, name=f"watch-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    @contextlib.contextmanager
+    def suspended(self):
+        # На время обновления проекта: изменения от git pull не вызывают перезапуск,
+        # после выхода дерево запоминается заново
+        with self._lock:
+            self._suspended += 1
+        try:
+            yield
+        finally:
+            snapshot = snapshot_tree(self.project_path, self.ignore)
+            with self._lock:
+                self._suspended -= 1
+                self._snapshot = snapshot
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                if self._suspended:
+                    continue
+                previous = self._snapshot
+            current = snapshot_tree(self.project_path, self.ignore)
+            if current == previous:
+                continue
+            # Ждем, пока изменения затихнут
+            while not self._stopped.wait(self.debounce):
+                latest = snapshot_tree(self.project_path, self.ignore)
+                if latest == current:
+                    break
+                current = latest
+            with self._lock:
+                if self._suspended or self._snapshot is not previous:
+                    continue  # пока ждали, началось обновление - оно само решит, перезапускать ли
+                self._snapshot = current
+            if self._stopped.is_set():
+                return
+            try:
+                self.callback(self.name, changed_paths(previous, current))
+            except Exception as e:
+                print(f"Watch callback error for {self.name}: {e}")
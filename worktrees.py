@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from bulk import move_to_trash
+from projects import create_venv
+from environments import BACKEND_VENV
+from tracing import span
+
+WORKTREES_DIR = '.worktrees'
+INDEX_FILE = 'index.json'
+DEFAULT_MAX_WORKTREES = 3  # рабочих деревьев на проект, лишние удаляются по давности использования
+SHA_DIR_LENGTH = 12
+
+
+class WorktreeCache:
+    # Версии проекта (коммиты, теги) разворачиваются через git worktree в
+    # .worktrees/<проект>/<sha> рядом с основным деревом, каждая со своим venv.
+    # Основное дерево при этом не трогается: не нужен чистый рабочий каталог,
+    # HEAD не отцепляется и следующий pull работает как обычно.
+    # Повторное переключение на ту же версию - только смена каталога запуска.
+    # in_use(name, sha) защищает от удаления деревья, из которых что-то запущено.
+    def __init__(self, projects_dir, max_worktrees=DEFAULT_MAX_WORKTREES, in_use=None, template_pool=None):
+        self.projects_dir = projects_dir
+        self.root = os.path.join(projects_dir, WORKTREES_DIR)
+        self.max_worktrees = max(1, int(max_worktrees))
+        self.in_use = in_use or (lambda name, sha: False)
+        self.template_pool = template_pool
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def path(self, name, sha):
+        return os.path.join(self.root, name, sha[:SHA_DIR_LENGTH])
+
+    def _lock(self, name):
+        with self._locks_lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _index_path(self, name):
+        return os.path.join(self.root, name, INDEX_FILE)
+
+    def _load_index(self, name):
+        try:
+            with open(self._index_path(name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, name, index):
+        index_path = self._index_path(name)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def entries(self, name):
+        # Развернутые версии проекта, недавно использованные первыми
+        index = self._load_index(name)
+        return sorted(({'sha': sha, **item} for sha, item in index.items()),
+                      key=lambda item: item['last_used'], reverse=True)
+
+    def resolve(self, project_path, ref, message_callback=lambda message: None):
+        # SHA коммита для ветки/тега/коммита; недостающий тег или коммит догружается с сервера
+        import git
+        repo = git.Repo(project_path)
+        try:
+            return repo.git.rev_parse('--verify', f'{ref}^{{commit}}')
+        except git.exc.GitCommandError:
+            pass
+        message_callback(f"Загрузка {ref}...")
+        with span('fetch', os.path.basename(project_path), ref=ref):
+            try:
+                repo.git.fetch('origin', 'tag', ref, '--no-tags')
+                return repo.git.rev_parse('--verify', f'{ref}^{{commit}}')
+            except git.exc.GitCommandError:
+                repo.git.fetch('origin', ref, '--no-tags')
+                return repo.git.rev_parse('--verify', 'FETCH_HEAD^{commit}')
+
+    def materialize(self, project_path, ref, message_callback=lambda message: None, python=None,
+                    backend=BACKEND_VENV):
+        # (sha, путь) рабочего дерева версии ref, при необходимости создает его с venv и зависимостями
+        import git
+        name = os.path.basename(project_path)
+        sha = self.resolve(project_path, ref, message_callback)
+        worktree_path = self.path(name, sha)
+        with self._lock(name):
+            index = self._load_index(name)
+            if sha in index and os.path.isdir(worktree_path):
+                index[sha]['last_used'] = time.time()
+                self._save_index(name, index)
+                return sha, worktree_path
+
+            repo = git.Repo(project_path)
+            if os.path.exists(worktree_path):
+                # Недоделанное дерево от прерванной попытки
+                self._remove_worktree(repo, worktree_path)
+            message_callback(f"Подготовка версии {ref}...")
+            with span('worktree_add', name, ref=ref):
+                repo.git.worktree('add', '--detach', worktree_path, sha)
+            try:
+                message_callback("Создание окружения...")
+                asyncio.run(create_venv(worktree_path, self.template_pool, python, backend,
+                                        projects_dir=self.projects_dir))
+            except Exception:
+                self._remove_worktree(repo, worktree_path)
+                raise
+            now = time.time()
+            index[sha] = {'ref': ref, 'created': now, 'last_used': now}
+            self._evict(repo, name, index, keep=sha)
+            self._save_index(name, index)
+        return sha, worktree_path
+
+    def touch(self, name, sha):
+        with self._lock(name):
+            index = self._load_index(name)
+            if sha in index:
+                index[sha]['last_used'] = time.time()
+                self._save_index(name, index)
+
+    def prune(self, project_path, max_age, wait=False):
+        # Удаляет версии, не использованные дольше max_age секунд и ни откуда не запущенные.
+        # wait=True - каталоги удаляются до возврата, а не в фоне
+        import git
+        name = os.path.basename(project_path)
+        removed = []
+        with self._lock(name):
+            index = self._load_index(name)
+            now = time.time()
+            stale = [sha for sha, item in index.items()
+                     if now - item['last_used'] > max_age and not self.in_use(name, sha)]
+            if not stale:
+                return removed
+            repo = git.Repo(project_path)
+            for sha in stale:
+                self._remove_worktree(repo, self.path(name, sha), wait)
+                del index[sha]
+                removed.append(sha)
+            self._save_index(name, index)
+        return removed
+
+    def _evict(self, repo, name, index, keep):
+        for sha in sorted(index, key=lambda item: index[item]['last_used']):
+            if len(index) <= self.max_worktrees:
+                break
+            if sha == keep or self.in_use(name, sha):
+                continue
+            self._remove_worktree(repo, self.path(name, sha))
+            del index[sha]
+
+    def _remove_worktree(self, repo, worktree_path, wait=False):
+        # Каталог уезжает в корзину мгновенно, git забывает о дереве через prune
+        move_to_trash(self.projects_dir, worktree_path, wait)
+        try:
+            repo.git.worktree('prune')
+        except Exception as e:
+            print(f"Worktree prune error: {e}")
+
+    def drop(self, name):
+        # Проект удален: все его рабочие деревья больше не нужны
+        project_root = os.path.join(self.root, name)
+        if os.path.isdir(project_root):
+            move_to_trash(self.projects_dir, project_root)